@@ -22,6 +22,8 @@
 #
 # - Turn-based conversation agent, with conversation history.
 # - Autosave conversation history to a text file.
+# - User input is read on a background thread, so lines typed (or piped in) while a response is streaming are queued and processed in order.
+# - Full-text search over the chat log archive, using the `/search <terms>` command.
 # 
 # Dependencies:
 # 
@@ -54,6 +56,8 @@
 import os
 import platform
 from language_model import LanguageModel
+from input_reader   import InputReader
+from chat_log_index import ChatLogIndex
 
 class Application:
 
@@ -76,14 +80,19 @@ class Application:
     APPLICATION_COMMAND_NONE           = 0
     APPLICATION_COMMAND_EXIT           = 1
     APPLICATION_COMMAND_CLEAR_TERMINAL = 2
+    APPLICATION_COMMAND_MEMORY_REPORT  = 3
+    APPLICATION_COMMAND_SEARCH         = 4
 
     # Constants: User Prompt Commands. 
     # - When the user types any of the commands defined below, the text will be translated to application command constants (see below) to be executed by the
     #   command manager.
 
-    PROMPT_COMMAND_NONE  = ''       # No command issued by the user. 
-    PROMPT_COMMAND_EXIT  = 'exit'   # The user wants to exit the application.
-    PROMPT_COMMAND_CLEAR = 'clear'  # The user wants to clear the application terminal. 
+    PROMPT_COMMAND_NONE   = ''        # No command issued by the user. 
+    PROMPT_COMMAND_EXIT   = 'exit'    # The user wants to exit the application.
+    PROMPT_COMMAND_CLEAR  = 'clear'   # The user wants to clear the application terminal. 
+    PROMPT_COMMAND_MEMORY = 'memory'  # The user wants to see how much memory the conversation history is using.
+    PROMPT_COMMAND_SEARCH = '/search' # The user wants to search the chat log archive, e.g. "/search prime numbers". The slash keeps ordinary prompts that
+                                      # start with the word "search" from being taken as a command.
 
     # Constants: Terminal Commands. 
     # - Terminal commands that can be issued to the OS terminal.
@@ -102,6 +111,7 @@ class Application:
     TERMINAL_ERROR                = '[Error]'
     TERMINAL_SYSTEM               = '[SYSTEM]'
     TERMINAL_BULLET               = '- '
+    TERMINAL_SEARCH_SNIPPET_SIZE  = 100                                         # Maximum number of characters of each search result to show.
 
     #---------------------------------------------------------------------------------------------------------------------------------------------------------
     # Constructor.
@@ -111,17 +121,27 @@ class Application:
 
         # Initialise application.
 
-        self.name            = 'Conversation Agent Reference Application'
-        self.version         = 2.0
-        self.agent_name_user = 'User'
-        self.agent_name_ai   = 'AI'        
-        self.command         = self.APPLICATION_COMMAND_NONE
-        self.state           = self.APPLICATION_STATE_IDLE
+        self.name             = 'Conversation Agent Reference Application'
+        self.version          = 2.0
+        self.agent_name_user  = 'User'
+        self.agent_name_ai    = 'AI'        
+        self.command          = self.APPLICATION_COMMAND_NONE
+        self.command_argument = ''
+        self.state            = self.APPLICATION_STATE_IDLE
 
         # Initialise model.
 
         self.model = LanguageModel ()
 
+        # Initialise user input reader.
+        # - User input is read on a background thread into a type-ahead queue, so that the next prompt can be read while the current response is streaming.
+
+        self.input_reader = InputReader ()
+
+        # Initialise chat log search index.
+
+        self.chat_log_index = ChatLogIndex ( self.model.chat_log_folder )
+
     #---------------------------------------------------------------------------------------------------------------------------------------------------------
     # Starts an instance of the application class.    
     #
@@ -187,6 +207,8 @@ class Application:
         self.command = self.APPLICATION_COMMAND_NONE
         self.state   = self.APPLICATION_STATE_RUNNING    
 
+        self.input_reader.start ()
+
         # Execute the main loop.
 
         while self.state == self.APPLICATION_STATE_RUNNING:
@@ -222,6 +244,7 @@ class Application:
         # Shut down program.
 
         self.model.save_chat_log_to_file ( include_system_prompt_enabled = False )
+        self.update_chat_log_index ()
 
     #-------------------------------------------------------------------------------------------------------------------------------------------------------------
     # Retrieve the user prompt from the terminal.
@@ -232,6 +255,9 @@ class Application:
     # Description:
     # - This function retrieves the user's input prompt from the terminal.
     # - It compiles the terminal prompt using the user's agent name and returns the prompt.
+    # - The prompt is taken from the input reader's type-ahead queue, so any lines entered while the previous response was being rendered are returned in
+    #   the order they were entered.
+    # - If the end of the input stream has been reached, the exit command is returned so that the chat log is still saved.
     #
     # Parameters:
     # - None
@@ -241,6 +267,7 @@ class Application:
     #
     # Preconditions:
     # - The application class must be initialized.
+    # - The input reader must have been started.
     #
     # Postconditions:
     # - The user's input prompt is retrieved and returned.
@@ -256,7 +283,15 @@ class Application:
         # Compile terminal prompt, get prompt text from the user, and return the prompt to the caller.
 
         terminal_prompt_user = f'[{self.agent_name_user}]'
-        user_prompt          = input ( f'\n{terminal_prompt_user}\n' )
+
+        print ( f'\n{terminal_prompt_user}', flush = True )
+
+        user_prompt = self.input_reader.get_line ()
+
+        # Treat the end of the input stream as an exit command.
+
+        if user_prompt is None:
+            user_prompt = self.PROMPT_COMMAND_EXIT
 
         return user_prompt
     
@@ -269,6 +304,7 @@ class Application:
     # Description:
     # - This function converts the user's input prompt to an application command.
     # - It normalizes the user prompt to lowercase and identifies any application commands to execute.
+    # - For commands that take an argument, e.g. `/search <terms>`, the rest of the user prompt is saved in `command_argument`.
     #
     # Parameters:
     # - user_prompt : str : The user's input prompt.
@@ -303,6 +339,13 @@ class Application:
         elif user_prompt == self.PROMPT_COMMAND_CLEAR:
             application_command = self.APPLICATION_COMMAND_CLEAR_TERMINAL
 
+        elif user_prompt == self.PROMPT_COMMAND_MEMORY:
+            application_command = self.APPLICATION_COMMAND_MEMORY_REPORT
+
+        elif user_prompt.split ( ' ', 1 ) [ 0 ] == self.PROMPT_COMMAND_SEARCH:
+            application_command   = self.APPLICATION_COMMAND_SEARCH
+            self.command_argument = user_prompt [ len ( self.PROMPT_COMMAND_SEARCH ) : ].strip ()
+
         else:
             application_command = self.APPLICATION_COMMAND_NONE
 
@@ -359,9 +402,20 @@ class Application:
             else:
                 os.system ( self.TERMINAL_COMMAND_CLEAR_TERMINAL_LINUX )
 
+        # Print memory report.
+
+        if self.command == self.APPLICATION_COMMAND_MEMORY_REPORT:
+            self.print_memory_report ()
+
+        # Search the chat log archive.
+
+        if self.command == self.APPLICATION_COMMAND_SEARCH:
+            self.print_search_results ( self.command_argument )
+
         # Reset command to no command. 
 
-        self.command = self.APPLICATION_COMMAND_NONE
+        self.command          = self.APPLICATION_COMMAND_NONE
+        self.command_argument = ''
         
     #-------------------------------------------------------------------------------------------------------------------------------------------------------------
     # Render the language model's response.
@@ -435,7 +489,7 @@ class Application:
         
         except Exception as e:
 
-            error_message = f'\n{[self.TERMINAL_ERROR]} {str(e)}\n'
+            error_message = f'\n{self.TERMINAL_ERROR} {str(e)}\n'
 
             print ( error_message )
 
@@ -480,6 +534,126 @@ class Application:
         print ( f'{self.TERMINAL_BULLET}Temperature:       {self.model.temperature}' )
         print ( f'{self.TERMINAL_BULLET}Streaming Enabled: {self.model.streaming_enabled}' )
 
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Display the memory used by the conversation history.
+    #
+    # Function name:
+    # - print_memory_report
+    #
+    # Description:
+    # - This function prints the number of messages in the conversation history, and the memory used by the session's conversation history, to the console.
+    #
+    # Parameters:
+    # - None
+    #
+    # Return Values:
+    # - None.
+    #
+    # Preconditions:
+    # - The application and model classes must be initialized.
+    #
+    # Postconditions:
+    # - The memory report is printed to the console.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def print_memory_report ( self ):
+
+        # Compile memory report.
+
+        message_count       = len ( self.model.conversation_history )
+        session_memory_size = self.model.get_conversation_history_memory_size ()
+        message_memory_size = session_memory_size // message_count if message_count > 0 else 0
+
+        # Print memory report to the console.
+
+        print ( f'\n{self.TERMINAL_SYSTEM}' )
+        print ( f'{self.TERMINAL_BULLET}Messages:              {message_count}' )
+        print ( f'{self.TERMINAL_BULLET}Session Memory:        {session_memory_size} bytes' )
+        print ( f'{self.TERMINAL_BULLET}Memory per Message:    {message_memory_size} bytes' )
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Search the chat log archive, and display the results.
+    #
+    # Function name:
+    # - print_search_results
+    #
+    # Description:
+    # - This function brings the chat log index up to date with any new chat log files, searches it, and prints the matching messages to the console.
+    #
+    # Parameters:
+    # - query : str : The search query.
+    #
+    # Return Values:
+    # - None.
+    #
+    # Preconditions:
+    # - The application class must be initialized.
+    #
+    # Postconditions:
+    # - The search results are printed to the console.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def print_search_results ( self, query ):
+
+        # Search the chat log archive.
+
+        self.update_chat_log_index ()
+
+        results = self.chat_log_index.search ( query )
+
+        # Print search results to the console.
+
+        print ( f'\n{self.TERMINAL_SYSTEM}' )
+        print ( f'Search results for "{query}": {len ( results )}' )
+
+        for result in results:
+            snippet = ' '.join ( result [ 'content' ].split () ) [ : self.TERMINAL_SEARCH_SNIPPET_SIZE ]
+            print ( f'{self.TERMINAL_BULLET}{result [ "file_name" ]} [{result [ "role" ]}] {snippet}' )
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Update the chat log index.
+    #
+    # Function name:
+    # - update_chat_log_index
+    #
+    # Description:
+    # - This function indexes any new chat log files.
+    # - Index maintenance is not essential to the application, so an index error is reported to the console, rather than ending the session, or preventing
+    #   a clean shut down. Searches use the index as it was before the failed update.
+    #
+    # Parameters:
+    # - None
+    #
+    # Return Values:
+    # - None.
+    #
+    # Preconditions:
+    # - The application class must be initialized.
+    #
+    # Postconditions:
+    # - Every chat log file is indexed, unless the update failed.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def update_chat_log_index ( self ):
+
+        try:
+            self.chat_log_index.update ()
+
+        except Exception as e:
+            print ( f'\n{self.TERMINAL_ERROR} Chat log index update failed: {str(e)}\n' )
+
     #-------------------------------------------------------------------------------------------------------------------------------------------------------------
     # Function tagline. Short one-sentence or phrase description of function. e .g. Execute this or that. 
     #
@@ -0,0 +1,193 @@
+#---------------------------------------------------------------------------------------------------------------------------------------------------------
+# Application   Conversation Agent Reference Application
+# Version:      2.0
+# Release Date: 2024-04-06
+# Author:       Rohin Gosling
+#
+# Description:
+#
+# - Micro-benchmark for the incremental request encoder.
+#
+# - For conversation histories of 10, 1k, and 10k turns, measures the time taken to encode the request body for the next turn:
+#
+#   - Full:        Convert every message to a dictionary and encode the whole request with `json.dumps`, as `chat.completions.create` does.
+#   - Incremental: Append the new turn, and encode the request with `RequestEncoder`.
+#
+# - Usage:
+#
+#   python benchmark_request_encoder.py
+#
+#---------------------------------------------------------------------------------------------------------------------------------------------------------
+
+import json
+import time
+from message         import Message
+from request_encoder import RequestEncoder
+
+# Constants: Benchmark Parameters.
+
+BENCHMARK_TURN_COUNTS     = [ 10, 1000, 10000 ]
+BENCHMARK_ITERATION_COUNT = 100
+BENCHMARK_MESSAGE_CONTENT = 'The quick brown fox jumps over the lazy dog. ' * 8
+BENCHMARK_PARAMETERS      = { 'model': 'gpt-4o', 'max_tokens': 1024, 'temperature': 0.7, 'stream': True }
+
+#-------------------------------------------------------------------------------------------------------------------------------------------------------------
+# Create a conversation history with a given number of turns.
+#
+# Function name:
+# - create_conversation_history
+#
+# Description:
+# - This function returns a conversation history made up of a system prompt, followed by alternating user and assistant messages.
+#
+# Parameters:
+# - turn_count : int : The number of user and assistant message pairs to create.
+#
+# Return Values:
+# - conversation_history : list : The conversation history, as a list of `Message` objects.
+#
+# Preconditions:
+# - None.
+#
+# Postconditions:
+# - None.
+#
+# To-Do:
+# - None.
+#
+#-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def create_conversation_history ( turn_count ):
+
+    conversation_history = [ Message ( BENCHMARK_MESSAGE_CONTENT, 'system' ) ]
+
+    for turn_index in range ( turn_count ):
+        conversation_history.append ( Message ( f'{turn_index} {BENCHMARK_MESSAGE_CONTENT}', 'user' ) )
+        conversation_history.append ( Message ( f'{turn_index} {BENCHMARK_MESSAGE_CONTENT}', 'assistant' ) )
+
+    return conversation_history
+
+#-------------------------------------------------------------------------------------------------------------------------------------------------------------
+# Measure the mean time taken to encode the next turn's request body, re-encoding the whole conversation history.
+#
+# Function name:
+# - benchmark_full_encode
+#
+# Description:
+# - This function appends a new user message to the conversation history, and encodes the full request body from scratch, for a number of iterations.
+#
+# Parameters:
+# - conversation_history : list : The conversation history, as a list of `Message` objects.
+#
+# Return Values:
+# - encode_time : float : The mean time taken to encode one request body, in seconds.
+#
+# Preconditions:
+# - None.
+#
+# Postconditions:
+# - `BENCHMARK_ITERATION_COUNT` messages have been appended to the conversation history.
+#
+# To-Do:
+# - None.
+#
+#-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def benchmark_full_encode ( conversation_history ):
+
+    total_time = 0.0
+
+    for iteration_index in range ( BENCHMARK_ITERATION_COUNT ):
+
+        conversation_history.append ( Message ( f'{iteration_index} {BENCHMARK_MESSAGE_CONTENT}', 'user' ) )
+
+        start_time = time.perf_counter ()
+        json.dumps ( { **BENCHMARK_PARAMETERS, 'messages': [ message.to_dict () for message in conversation_history ] } ).encode ( 'utf-8' )
+        total_time += time.perf_counter () - start_time
+
+    return total_time / BENCHMARK_ITERATION_COUNT
+
+#-------------------------------------------------------------------------------------------------------------------------------------------------------------
+# Measure the mean time taken to encode the next turn's request body, using the incremental request encoder.
+#
+# Function name:
+# - benchmark_incremental_encode
+#
+# Description:
+# - This function primes a request encoder with the conversation history, then appends a new user message to the conversation history, and encodes the
+#   request body incrementally, for a number of iterations.
+#
+# Parameters:
+# - conversation_history : list : The conversation history, as a list of `Message` objects.
+#
+# Return Values:
+# - encode_time : float : The mean time taken to encode one request body, in seconds.
+#
+# Preconditions:
+# - None.
+#
+# Postconditions:
+# - `BENCHMARK_ITERATION_COUNT` messages have been appended to the conversation history.
+#
+# To-Do:
+# - None.
+#
+#-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def benchmark_incremental_encode ( conversation_history ):
+
+    request_encoder = RequestEncoder ()
+    request_encoder.encode ( conversation_history, **BENCHMARK_PARAMETERS )
+
+    total_time = 0.0
+
+    for iteration_index in range ( BENCHMARK_ITERATION_COUNT ):
+
+        conversation_history.append ( Message ( f'{iteration_index} {BENCHMARK_MESSAGE_CONTENT}', 'user' ) )
+
+        start_time = time.perf_counter ()
+        request_encoder.encode ( conversation_history, **BENCHMARK_PARAMETERS )
+        total_time += time.perf_counter () - start_time
+
+    return total_time / BENCHMARK_ITERATION_COUNT
+
+#-------------------------------------------------------------------------------------------------------------------------------------------------------------
+# Run the request encoder benchmark.
+#
+# Function name:
+# - main
+#
+# Description:
+# - This function runs the full and incremental encode benchmarks for each conversation history length, and prints the results to the console.
+#
+# Parameters:
+# - None
+#
+# Return Values:
+# - None.
+#
+# Preconditions:
+# - None.
+#
+# Postconditions:
+# - The benchmark results are printed to the console.
+#
+# To-Do:
+# - None.
+#
+#-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def main ():
+
+    print ( f'\n{"Turns":>8}  {"Full (ms)":>12}  {"Incremental (ms)":>18}  {"Speedup":>8}' )
+
+    for turn_count in BENCHMARK_TURN_COUNTS:
+
+        full_encode_time        = benchmark_full_encode        ( create_conversation_history ( turn_count ) )
+        incremental_encode_time = benchmark_incremental_encode ( create_conversation_history ( turn_count ) )
+        speedup                 = full_encode_time / incremental_encode_time
+
+        print ( f'{turn_count:>8}  {full_encode_time * 1000:>12.3f}  {incremental_encode_time * 1000:>18.3f}  {speedup:>7.1f}x' )
+
+if __name__ == "__main__":
+    main ()
@@ -0,0 +1,1093 @@
+#---------------------------------------------------------------------------------------------------------------------------------------------------------
+# Application   Conversation Agent Reference Application
+# Version:      2.0
+# Release Date: 2024-04-06
+# Author:       Rohin Gosling
+#
+# Description:
+#
+# - Full-text search over the chat log archive.
+#
+# - An inverted index maps each term to the list of messages containing it. Messages are read from the chat log files with `read_chat_log_messages`.
+#
+# - The index is stored in the `index` sub-folder of the chat log folder, as a set of immutable segment files plus a manifest:
+#
+#   - Each call to `update` indexes only the chat log files that are new or changed since the previous update, and writes them to a new segment.
+#   - The manifest records the segment holding the current version of each chat log file. Messages of a file that was since changed or removed stay in
+#     their old segment, but are skipped by searches.
+#   - Once there are more than `INDEX_SEGMENT_MERGE_THRESHOLD` segments, the `INDEX_SEGMENT_MERGE_COUNT` adjacent segments with the fewest messages are
+#     merged into one. Merging combines the segments' postings lists, and drops skipped messages, without reading the chat log files again. Newly written
+#     segments are small, so most merges are small, and the large, older segments are merged rarely.
+#
+# - Several processes may share one index, e.g. the worker processes of a worker pool. `update` and `open` hold a cross-process `FileLock` on the index
+#   folder, and re-read the manifest under the lock, so that each process sees the segments written by the others. Segment and manifest files are written
+#   to unique temporary files, and then moved into place.
+#
+# - Segments are memory-mapped, and queried in place. Terms are found by binary search over a fixed-width term table, and postings lists are intersected
+#   with binary searches directly over the mapped postings. Message content is not stored in the index. It is read back from the chat log file for each
+#   search result, so lookups never load the archive into memory.
+#
+# - Segment file layout (little-endian):
+#
+#   - Header:         Magic, version, term count, document count, and the offsets of each of the sections below.
+#   - Term table:     One `( term offset, term length, postings offset, postings count )` entry per term, sorted by term.
+#   - Term data:      The UTF-8 encoded terms.
+#   - Postings:       For each term, the ascending document numbers of the messages containing the term, as 32-bit unsigned integers.
+#   - Document table: One `( file number, content offset, content length, role code )` entry per message.
+#   - File table:     JSON list of the chat log file names in the segment.
+#
+# - Usage:
+#
+#   chat_log_index = ChatLogIndex ( 'chat_log' )
+#   chat_log_index.update ()
+#   results = chat_log_index.search ( 'python program' )
+#
+#---------------------------------------------------------------------------------------------------------------------------------------------------------
+
+import os
+import re
+import json
+import mmap
+import bisect
+import struct
+import tempfile
+from file_lock       import FileLock
+from message         import Message
+from chat_log_reader import list_chat_log_files, read_chat_log_messages, read_chat_log_content
+
+class ChatLogIndex:
+
+    # Constants: Index Files.
+
+    INDEX_FOLDER_NAME             = 'index'
+    INDEX_MANIFEST_FILE_NAME      = 'manifest.json'
+    INDEX_LOCK_FILE_NAME          = 'index.lock'
+    INDEX_SEGMENT_FILE_NAME       = 'segment_'
+    INDEX_SEGMENT_FILE_EXTENSION  = '.idx'
+    INDEX_SEGMENT_MERGE_THRESHOLD = 16       # Maximum number of segments, before segments are merged.
+    INDEX_SEGMENT_MERGE_COUNT     = 4        # Number of adjacent segments merged at a time.
+
+    # Constants: Segment File Layout.
+
+    INDEX_SEGMENT_MAGIC          = b'CLIX'
+    INDEX_SEGMENT_VERSION        = 1
+    INDEX_SEGMENT_HEADER         = struct.Struct ( '<4sIIIQQQQQ' )  # Magic, version, term count, document count, section offsets.
+    INDEX_SEGMENT_TERM_ENTRY     = struct.Struct ( '<QIQI' )        # Term offset, term length, postings offset, postings count.
+    INDEX_SEGMENT_DOCUMENT_ENTRY = struct.Struct ( '<IQIB' )        # File number, content offset, content length, role code.
+    INDEX_SEGMENT_POSTING        = struct.Struct ( '<I' )           # Document number.
+
+    # Constants: Search.
+
+    INDEX_TERM_PATTERN          = re.compile ( r'\w+' )
+    INDEX_SEARCH_RESULT_DEFAULT = 10
+
+    #---------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Constructor.
+    #---------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def __init__ ( self, chat_log_folder = 'chat_log' ):
+
+        # Initialise chat log index.
+
+        self.chat_log_folder = chat_log_folder
+        self.index_folder    = os.path.join ( chat_log_folder, self.INDEX_FOLDER_NAME )
+        self.lock_path       = os.path.join ( self.index_folder, self.INDEX_LOCK_FILE_NAME )
+        self.manifest        = self.load_manifest ()
+        self.segments        = None     # Memory-mapped segments, opened on first search.
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Update the index with any new chat log files.
+    #
+    # Function name:
+    # - update
+    #
+    # Description:
+    # - This function compares the chat log files on disk with the files recorded in the manifest.
+    # - New and changed files are indexed into a new segment, and removed files are dropped from the manifest. If there are then too many segments, the
+    #   smallest adjacent segments are merged.
+    # - The update runs under the index lock, against the manifest as it is on disk, so concurrent updates from several processes are serialised, and
+    #   a file indexed by another process is not indexed again.
+    #
+    # Parameters:
+    # - None
+    #
+    # Return Values:
+    # - indexed_file_count : int : The number of chat log files that were indexed.
+    #
+    # Preconditions:
+    # - The chat log index class must be initialized.
+    #
+    # Postconditions:
+    # - Every chat log file in the chat log folder is indexed.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def update ( self ):
+
+        with FileLock ( self.lock_path ):
+
+            # Reload the manifest, in case another process has updated the index.
+
+            self.close ()
+            self.manifest = self.load_manifest ()
+
+            return self.update_segments ()
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Update the index segments with any new chat log files.
+    #
+    # Function name:
+    # - update_segments
+    #
+    # Description:
+    # - This function does the work of `update`.
+    #
+    # Parameters:
+    # - None
+    #
+    # Return Values:
+    # - indexed_file_count : int : The number of chat log files that were indexed.
+    #
+    # Preconditions:
+    # - The index lock is held, and the manifest is current.
+    #
+    # Postconditions:
+    # - Every chat log file in the chat log folder is indexed.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def update_segments ( self ):
+
+        # Compare the chat log files on disk with the indexed files.
+
+        file_signatures    = { file_name : self.get_file_signature ( file_name ) for file_name in list_chat_log_files ( self.chat_log_folder ) }
+        indexed_files      = self.manifest [ 'files' ]
+        changed_file_names = [ file_name for file_name, signature in file_signatures.items () if indexed_files.get ( file_name, ( None, ) ) [ 1 : ] != signature ]
+        removed_file_names = [ file_name for file_name in indexed_files if file_name not in file_signatures ]
+
+        if len ( changed_file_names ) == 0 and len ( removed_file_names ) == 0:
+            return 0
+
+        # Forget removed files. Their messages are skipped by searches, until their segment is merged.
+
+        for file_name in removed_file_names:
+            del indexed_files [ file_name ]
+
+        # Index the new and changed files into a new segment. The messages of the previous version of a changed file are skipped from now on.
+
+        if len ( changed_file_names ) > 0:
+
+            segment_file_name = self.get_segment_file_name ()
+
+            self.write_segment ( segment_file_name, changed_file_names, *self.index_chat_log_files ( changed_file_names ) )
+
+            self.manifest [ 'segments' ].append ( segment_file_name )
+
+            for file_name in changed_file_names:
+                indexed_files [ file_name ] = ( segment_file_name, *file_signatures [ file_name ] )
+
+        # Merge segments, while there are too many.
+
+        old_segments = []
+
+        while len ( self.manifest [ 'segments' ] ) > self.INDEX_SEGMENT_MERGE_THRESHOLD:
+            old_segments += self.merge_segments ()
+
+        self.save_manifest ()
+
+        # Remove segments that have been merged.
+
+        for old_segment in old_segments:
+            try:
+                os.remove ( os.path.join ( self.index_folder, old_segment ) )
+            except OSError:
+                pass
+
+        return len ( changed_file_names )
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Merge the smallest adjacent segments.
+    #
+    # Function name:
+    # - merge_segments
+    #
+    # Description:
+    # - This function finds the `INDEX_SEGMENT_MERGE_COUNT` adjacent segments with the fewest messages, and merges them into a new segment, which takes their
+    #   place in the manifest. Only adjacent segments are merged, so that the segments stay in the order their messages were indexed.
+    # - The merged segment is built from the segments' own document tables and postings lists. Messages that searches would skip are dropped, and the
+    #   remaining messages are renumbered in order, so each merged postings list is the concatenation of the segments' renumbered postings lists.
+    #
+    # Parameters:
+    # - None
+    #
+    # Return Values:
+    # - old_segments : list : The file names of the merged segments, to be removed once the manifest has been saved.
+    #
+    # Preconditions:
+    # - The index lock is held, and there are more than `INDEX_SEGMENT_MERGE_COUNT` segments.
+    #
+    # Postconditions:
+    # - The manifest lists the merged segment in place of the old segments.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def merge_segments ( self ):
+
+        # Find the adjacent segments with the fewest messages.
+
+        segment_file_names = self.manifest [ 'segments' ]
+        segments           = [ self.open_segment ( segment_file_name ) for segment_file_name in segment_file_names ]
+
+        try:
+            document_counts = [ header [ 3 ] for _, header, _, _ in segments ]
+            merge_count     = min ( self.INDEX_SEGMENT_MERGE_COUNT, len ( segments ) )
+            merge_start     = min ( range ( len ( segments ) - merge_count + 1 ), key = lambda start: sum ( document_counts [ start : start + merge_count ] ) )
+
+            # Combine the document tables and postings lists of the live messages.
+
+            file_names      = []
+            postings_lists  = {}
+            document_table  = bytearray ()
+            document_number = 0
+
+            for segment_map, header, segment_chat_log_files, live_file_numbers in segments [ merge_start : merge_start + merge_count ]:
+
+                # Renumber the live files and messages of the segment.
+
+                file_numbers = {}
+
+                for file_number, file_name in enumerate ( segment_chat_log_files ):
+                    if live_file_numbers is None or file_number in live_file_numbers:
+                        file_numbers [ file_number ] = len ( file_names )
+                        file_names.append ( file_name )
+
+                document_numbers = [ None ] * header [ 3 ]
+
+                for segment_document_number in range ( header [ 3 ] ):
+
+                    file_number, byte_offset, byte_length, role_code = self.INDEX_SEGMENT_DOCUMENT_ENTRY.unpack_from (
+                        segment_map,
+                        header [ 7 ] + segment_document_number * self.INDEX_SEGMENT_DOCUMENT_ENTRY.size
+                    )
+
+                    if file_number in file_numbers:
+                        document_numbers [ segment_document_number ] = document_number
+                        document_table  += self.INDEX_SEGMENT_DOCUMENT_ENTRY.pack ( file_numbers [ file_number ], byte_offset, byte_length, role_code )
+                        document_number += 1
+
+                # Append the segment's renumbered postings.
+
+                for term_index in range ( header [ 2 ] ):
+
+                    term_offset, term_length, postings_offset, postings_count = self.INDEX_SEGMENT_TERM_ENTRY.unpack_from (
+                        segment_map,
+                        header [ 4 ] + term_index * self.INDEX_SEGMENT_TERM_ENTRY.size
+                    )
+
+                    term_bytes = segment_map [ header [ 5 ] + term_offset : header [ 5 ] + term_offset + term_length ]
+                    postings   = struct.unpack_from ( f'<{postings_count}I', segment_map, header [ 6 ] + postings_offset )
+                    postings   = [ document_numbers [ posting ] for posting in postings if document_numbers [ posting ] is not None ]
+
+                    if len ( postings ) > 0:
+                        postings_lists.setdefault ( term_bytes, [] ).extend ( postings )
+
+        finally:
+            for segment_map, _, _, _ in segments:
+                segment_map.close ()
+
+        # Write the merged segment, unless every message was dropped, and record it in place of the old segments.
+
+        old_segments = segment_file_names [ merge_start : merge_start + merge_count ]
+        new_segments = []
+
+        if document_number > 0:
+
+            segment_file_name = self.get_segment_file_name ()
+            new_segments      = [ segment_file_name ]
+
+            self.write_segment ( segment_file_name, file_names, postings_lists, document_table, document_number )
+
+            for file_name in file_names:
+                self.manifest [ 'files' ] [ file_name ] = ( segment_file_name, *self.manifest [ 'files' ] [ file_name ] [ 1 : ] )
+
+        self.manifest [ 'segments' ] = segment_file_names [ : merge_start ] + new_segments + segment_file_names [ merge_start + merge_count : ]
+
+        return old_segments
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Allocate a new segment file name.
+    #
+    # Function name:
+    # - get_segment_file_name
+    #
+    # Description:
+    # - This function returns the file name of the next segment, and advances the manifest's segment counter.
+    #
+    # Parameters:
+    # - None
+    #
+    # Return Values:
+    # - segment_file_name : str : The segment file name, relative to the index folder.
+    #
+    # Preconditions:
+    # - The index lock is held.
+    #
+    # Postconditions:
+    # - None.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def get_segment_file_name ( self ):
+
+        segment_file_name = f'{self.INDEX_SEGMENT_FILE_NAME}{self.manifest [ "next_segment" ]}{self.INDEX_SEGMENT_FILE_EXTENSION}'
+
+        self.manifest [ 'next_segment' ] += 1
+
+        return segment_file_name
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Search the index.
+    #
+    # Function name:
+    # - search
+    #
+    # Description:
+    # - This function returns the messages that contain every term in a query, newest first.
+    # - The query is split into terms the same way as message content. Matching is case-insensitive.
+    #
+    # Parameters:
+    # - query        : str : The search query.
+    # - result_limit : int : The maximum number of results to return. Default value is `INDEX_SEARCH_RESULT_DEFAULT`.
+    #
+    # Return Values:
+    # - results : list : A list of dictionaries with `file_name`, `role`, and `content` keys, one per matching message.
+    #
+    # Preconditions:
+    # - The index has been updated.
+    #
+    # Postconditions:
+    # - None.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def search ( self, query, result_limit = INDEX_SEARCH_RESULT_DEFAULT ):
+
+        terms = sorted ( set ( self.get_terms ( query ) ) )
+
+        if len ( terms ) == 0:
+            return []
+
+        if self.segments is None:
+            self.open ()
+
+        # Search the newest segments first.
+
+        results = []
+
+        for segment in reversed ( self.segments ):
+
+            if len ( results ) >= result_limit:
+                break
+
+            for document_number in self.search_segment ( segment, terms, result_limit - len ( results ) ):
+                results.append ( self.read_document ( segment, document_number ) )
+
+        return results
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Search a single segment.
+    #
+    # Function name:
+    # - search_segment
+    #
+    # Description:
+    # - This function returns the numbers of the newest documents in a segment that contain every one of a list of terms.
+    # - The postings lists are intersected from the end, newest first, and the search stops as soon as `result_limit` documents are found, so the cost
+    #   depends on the number of results, rather than on the length of the postings lists.
+    # - Documents of files that are not live in the segment are skipped.
+    # - The postings list of the rarest term supplies the candidates. Each candidate is looked up in the other postings lists by binary search, and when a
+    #   list does not contain it, the search leaps back to the next document that list does contain, skipping every candidate in between.
+    #
+    # Parameters:
+    # - segment      : tuple : A segment tuple, as returned by `open_segment`.
+    # - terms        : list  : The search terms.
+    # - result_limit : int   : The maximum number of documents to return.
+    #
+    # Return Values:
+    # - document_numbers : list : The descending numbers of the matching documents.
+    #
+    # Preconditions:
+    # - None.
+    #
+    # Postconditions:
+    # - None.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def search_segment ( self, segment, terms, result_limit ):
+
+        postings_lists = []
+
+        for term in terms:
+
+            postings = self.find_postings ( segment, term )
+
+            if postings is None:
+                return []
+
+            postings_lists.append ( postings )
+
+        postings_lists.sort ( key = len )
+
+        # Walk the rarest postings list from the end.
+        # - `search_bounds` holds the end of the range of each postings list that can still contain a match. Candidates only decrease, so the ranges only
+        #   shrink.
+
+        live_file_numbers = segment [ 3 ]
+        candidates        = postings_lists [ 0 ]
+        search_bounds     = [ len ( postings ) for postings in postings_lists ]
+        position          = len ( candidates ) - 1
+        document_numbers  = []
+
+        while position >= 0 and len ( document_numbers ) < result_limit:
+
+            candidate      = candidates [ position ]
+            next_candidate = candidate
+
+            for list_index in range ( 1, len ( postings_lists ) ):
+
+                postings = postings_lists [ list_index ]
+                bound    = bisect.bisect_right ( postings, candidate, 0, search_bounds [ list_index ] )
+
+                if bound == 0:
+                    return document_numbers
+
+                search_bounds [ list_index ] = bound
+                next_candidate               = min ( next_candidate, postings [ bound - 1 ] )
+
+            if next_candidate == candidate:
+
+                if live_file_numbers is None or self.get_document_file_number ( segment, candidate ) in live_file_numbers:
+                    document_numbers.append ( candidate )
+
+                position -= 1
+            else:
+                position = bisect.bisect_right ( candidates, next_candidate, 0, position ) - 1
+
+        return document_numbers
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Find the postings list for a term in a segment.
+    #
+    # Function name:
+    # - find_postings
+    #
+    # Description:
+    # - This function binary searches the segment's term table for a term, and returns the term's postings list as a view over the mapped segment.
+    #
+    # Parameters:
+    # - segment : tuple : A segment tuple, as returned by `open_segment`.
+    # - term    : str   : The term to find.
+    #
+    # Return Values:
+    # - postings : memoryview : The ascending document numbers of the documents containing the term, or `None` if the term is not in the segment.
+    #
+    # Preconditions:
+    # - None.
+    #
+    # Postconditions:
+    # - None.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def find_postings ( self, segment, term ):
+
+        segment_map, header, _, _ = segment
+
+        term_bytes        = term.encode ( 'utf-8' )
+        term_count        = header [ 2 ]
+        term_table_offset = header [ 4 ]
+        term_data_offset  = header [ 5 ]
+        postings_offset   = header [ 6 ]
+
+        low  = 0
+        high = term_count
+
+        while low < high:
+
+            middle = ( low + high ) // 2
+
+            term_offset, term_length, term_postings_offset, term_postings_count = self.INDEX_SEGMENT_TERM_ENTRY.unpack_from (
+                segment_map,
+                term_table_offset + middle * self.INDEX_SEGMENT_TERM_ENTRY.size
+            )
+
+            middle_term = segment_map [ term_data_offset + term_offset : term_data_offset + term_offset + term_length ]
+
+            if middle_term < term_bytes:
+                low = middle + 1
+
+            elif middle_term > term_bytes:
+                high = middle
+
+            else:
+                postings_head = postings_offset + term_postings_offset
+                postings_tail = postings_head + term_postings_count * self.INDEX_SEGMENT_POSTING.size
+
+                return memoryview ( segment_map ) [ postings_head : postings_tail ].cast ( 'I' )
+
+        return None
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Get the file number of a document in a segment.
+    #
+    # Function name:
+    # - get_document_file_number
+    #
+    # Description:
+    # - This function reads the file number from a document's entry in the segment's document table.
+    #
+    # Parameters:
+    # - segment         : tuple : A segment tuple, as returned by `open_segment`.
+    # - document_number : int   : The document number.
+    #
+    # Return Values:
+    # - file_number : int : The number of the document's file in the segment's file table.
+    #
+    # Preconditions:
+    # - None.
+    #
+    # Postconditions:
+    # - None.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def get_document_file_number ( self, segment, document_number ):
+
+        segment_map, header, _, _ = segment
+
+        return self.INDEX_SEGMENT_DOCUMENT_ENTRY.unpack_from ( segment_map, header [ 7 ] + document_number * self.INDEX_SEGMENT_DOCUMENT_ENTRY.size ) [ 0 ]
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Read a document from a segment.
+    #
+    # Function name:
+    # - read_document
+    #
+    # Description:
+    # - This function looks up a document in the segment's document table, and reads the message content back from its chat log file.
+    #
+    # Parameters:
+    # - segment         : tuple : A segment tuple, as returned by `open_segment`.
+    # - document_number : int   : The document number.
+    #
+    # Return Values:
+    # - result : dict : A dictionary with `file_name`, `role`, and `content` keys.
+    #
+    # Preconditions:
+    # - None.
+    #
+    # Postconditions:
+    # - None.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def read_document ( self, segment, document_number ):
+
+        segment_map, header, file_names, _ = segment
+
+        file_number, byte_offset, byte_length, role_code = self.INDEX_SEGMENT_DOCUMENT_ENTRY.unpack_from (
+            segment_map,
+            header [ 7 ] + document_number * self.INDEX_SEGMENT_DOCUMENT_ENTRY.size
+        )
+
+        file_name = file_names [ file_number ]
+        content   = read_chat_log_content ( os.path.join ( self.chat_log_folder, file_name ), byte_offset, byte_length )
+
+        return { 'file_name': file_name, 'role': Message.MESSAGE_ROLES [ role_code ], 'content': content }
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Index a list of chat log files.
+    #
+    # Function name:
+    # - index_chat_log_files
+    #
+    # Description:
+    # - This function reads the messages from a list of chat log files, and builds an inverted index over them.
+    # - Documents are numbered in file order, so each postings list is built in ascending order.
+    #
+    # Parameters:
+    # - file_names : list : The chat log file names to index, relative to the chat log folder.
+    #
+    # Return Values:
+    # - postings_lists  : dict      : Each UTF-8 encoded term, mapped to the ascending numbers of the documents containing it.
+    # - document_table  : bytearray : The packed document table.
+    # - document_count  : int       : The number of documents.
+    #
+    # Preconditions:
+    # - None.
+    #
+    # Postconditions:
+    # - None.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def index_chat_log_files ( self, file_names ):
+
+        postings_lists  = {}
+        document_table  = bytearray ()
+        document_number = 0
+
+        for file_number, file_name in enumerate ( file_names ):
+
+            for role, content, byte_offset, byte_length in read_chat_log_messages ( os.path.join ( self.chat_log_folder, file_name ) ):
+
+                for term in set ( self.get_terms ( content ) ):
+                    postings_lists.setdefault ( term.encode ( 'utf-8' ), [] ).append ( document_number )
+
+                document_table += self.INDEX_SEGMENT_DOCUMENT_ENTRY.pack ( file_number, byte_offset, byte_length, Message.get_role_code ( role ) )
+                document_number += 1
+
+        return postings_lists, document_table, document_number
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Write a segment file.
+    #
+    # Function name:
+    # - write_segment
+    #
+    # Description:
+    # - This function writes an inverted index to a segment file.
+    # - The segment is written to a temporary file first, and then moved into place, so that a partially written segment is never visible.
+    #
+    # Parameters:
+    # - segment_file_name : str       : The segment file name, relative to the index folder.
+    # - file_names        : list      : The chat log file names in the segment, relative to the chat log folder, in file number order.
+    # - postings_lists    : dict      : Each UTF-8 encoded term, mapped to the ascending numbers of the documents containing it.
+    # - document_table    : bytearray : The packed document table.
+    # - document_count    : int       : The number of documents.
+    #
+    # Return Values:
+    # - None.
+    #
+    # Preconditions:
+    # - None.
+    #
+    # Postconditions:
+    # - The segment file has been written.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def write_segment ( self, segment_file_name, file_names, postings_lists, document_table, document_count ):
+
+        # Compile the term table, term data, and postings sections.
+
+        term_table = bytearray ()
+        term_data  = bytearray ()
+        postings   = bytearray ()
+
+        for term_bytes in sorted ( postings_lists ):
+
+            term_postings = postings_lists [ term_bytes ]
+
+            term_table += self.INDEX_SEGMENT_TERM_ENTRY.pack ( len ( term_data ), len ( term_bytes ), len ( postings ), len ( term_postings ) )
+            term_data  += term_bytes
+            postings   += struct.pack ( f'<{len ( term_postings )}I', *term_postings )
+
+        file_table = json.dumps ( file_names ).encode ( 'utf-8' )
+
+        # Compile the header.
+
+        term_table_offset     = self.INDEX_SEGMENT_HEADER.size
+        term_data_offset      = term_table_offset + len ( term_table )
+        postings_offset       = term_data_offset  + len ( term_data )
+        document_table_offset = postings_offset   + len ( postings )
+        file_table_offset     = document_table_offset + len ( document_table )
+
+        header = self.INDEX_SEGMENT_HEADER.pack (
+            self.INDEX_SEGMENT_MAGIC,
+            self.INDEX_SEGMENT_VERSION,
+            len ( postings_lists ),
+            document_count,
+            term_table_offset,
+            term_data_offset,
+            postings_offset,
+            document_table_offset,
+            file_table_offset
+        )
+
+        # Write the segment file.
+
+        if not os.path.exists ( self.index_folder ):
+            os.makedirs ( self.index_folder )
+
+        segment_path = os.path.join ( self.index_folder, segment_file_name )
+
+        self.write_file ( segment_path, b''.join ( ( header, term_table, term_data, postings, document_table, file_table ) ) )
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Open the index segments.
+    #
+    # Function name:
+    # - open
+    #
+    # Description:
+    # - This function re-reads the manifest, and memory-maps each segment listed in it.
+    # - The segments are opened under the index lock, so that another process can not remove a segment between reading the manifest and opening the
+    #   segment. Once mapped, a segment stays readable even if it is later removed by a merge.
+    #
+    # Parameters:
+    # - None
+    #
+    # Return Values:
+    # - None.
+    #
+    # Preconditions:
+    # - None.
+    #
+    # Postconditions:
+    # - `segments` holds a segment tuple, as returned by `open_segment`, for each segment, oldest first.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def open ( self ):
+
+        with FileLock ( self.lock_path ):
+            self.manifest = self.load_manifest ()
+            self.open_segments ()
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Memory-map the segments listed in the manifest.
+    #
+    # Function name:
+    # - open_segments
+    #
+    # Description:
+    # - This function does the work of `open`.
+    #
+    # Parameters:
+    # - None
+    #
+    # Return Values:
+    # - None.
+    #
+    # Preconditions:
+    # - The index lock is held.
+    #
+    # Postconditions:
+    # - `segments` holds a segment tuple, as returned by `open_segment`, for each segment, oldest first.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def open_segments ( self ):
+
+        self.segments = []
+
+        for segment_file_name in self.manifest [ 'segments' ]:
+            self.segments.append ( self.open_segment ( segment_file_name ) )
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Memory-map a segment.
+    #
+    # Function name:
+    # - open_segment
+    #
+    # Description:
+    # - This function memory-maps a segment file, and reads its header and file table.
+    # - The files whose current version is held by the segment, according to the manifest, are its live files. Messages of any other file in the segment
+    #   belong to a version of the file that was since changed or removed, and are skipped.
+    #
+    # Parameters:
+    # - segment_file_name : str : The segment file name, relative to the index folder.
+    #
+    # Return Values:
+    # - segment : tuple : A `( mapped segment, header, file names, live file numbers )` tuple. The live file numbers are `None` if every file is live.
+    #
+    # Preconditions:
+    # - The index lock is held.
+    #
+    # Postconditions:
+    # - None.
+    #
+    # Raises:
+    # - ValueError : The segment file is not a valid segment.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def open_segment ( self, segment_file_name ):
+
+        with open ( os.path.join ( self.index_folder, segment_file_name ), 'rb' ) as file:
+            segment_map = mmap.mmap ( file.fileno (), 0, access = mmap.ACCESS_READ )
+
+        header = self.INDEX_SEGMENT_HEADER.unpack_from ( segment_map, 0 )
+
+        if header [ 0 ] != self.INDEX_SEGMENT_MAGIC or header [ 1 ] != self.INDEX_SEGMENT_VERSION:
+            segment_map.close ()
+            raise ValueError ( f'Invalid chat log index segment: {segment_file_name}' )
+
+        file_names        = json.loads ( segment_map [ header [ 8 ] : ].decode ( 'utf-8' ) )
+        indexed_files     = self.manifest [ 'files' ]
+        live_file_numbers = { file_number for file_number, file_name in enumerate ( file_names ) if indexed_files.get ( file_name, ( None, ) ) [ 0 ] == segment_file_name }
+
+        if len ( live_file_numbers ) == len ( file_names ):
+            live_file_numbers = None
+
+        return ( segment_map, header, file_names, live_file_numbers )
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Close the index segments.
+    #
+    # Function name:
+    # - close
+    #
+    # Description:
+    # - This function unmaps any open segments. They are re-opened by the next search.
+    #
+    # Parameters:
+    # - None
+    #
+    # Return Values:
+    # - None.
+    #
+    # Preconditions:
+    # - None.
+    #
+    # Postconditions:
+    # - No segments are mapped.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def close ( self ):
+
+        if self.segments is not None:
+            for segment_map, _, _, _ in self.segments:
+                segment_map.close ()
+
+        self.segments = None
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Load the index manifest.
+    #
+    # Function name:
+    # - load_manifest
+    #
+    # Description:
+    # - This function loads the list of segments and indexed chat log files from the manifest file.
+    # - If there is no manifest, or it can not be read, an empty manifest is returned, and the archive will be re-indexed by the next update.
+    # - File entries from earlier manifests, which did not record the segment holding each file, are dropped. Those files are indexed again by the next
+    #   update, and their old messages are skipped until their segments are merged away.
+    #
+    # Parameters:
+    # - None
+    #
+    # Return Values:
+    # - manifest : dict : A dictionary with `next_segment`, `segments`, and `files` keys. Each entry in `files` maps a chat log file name to a
+    #                     `( segment file name, modification time, size )` tuple.
+    #
+    # Preconditions:
+    # - None.
+    #
+    # Postconditions:
+    # - None.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def load_manifest ( self ):
+
+        try:
+            with open ( os.path.join ( self.index_folder, self.INDEX_MANIFEST_FILE_NAME ), 'r', encoding = 'utf-8' ) as file:
+                manifest = json.load ( file )
+
+            manifest [ 'files' ] = { file_name : tuple ( file_entry ) for file_name, file_entry in manifest [ 'files' ].items () if len ( file_entry ) == 3 }
+
+            return manifest
+
+        except ( OSError, ValueError, KeyError, TypeError ):
+            return { 'next_segment': 0, 'segments': [], 'files': {} }
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Save the index manifest.
+    #
+    # Function name:
+    # - save_manifest
+    #
+    # Description:
+    # - This function writes the manifest with `write_file`, so that the manifest is always complete.
+    #
+    # Parameters:
+    # - None
+    #
+    # Return Values:
+    # - None.
+    #
+    # Preconditions:
+    # - The index folder exists.
+    #
+    # Postconditions:
+    # - The manifest file has been written.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def save_manifest ( self ):
+
+        manifest_path = os.path.join ( self.index_folder, self.INDEX_MANIFEST_FILE_NAME )
+
+        self.write_file ( manifest_path, json.dumps ( self.manifest ).encode ( 'utf-8' ) )
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Write an index file.
+    #
+    # Function name:
+    # - write_file
+    #
+    # Description:
+    # - This function writes the data to a uniquely named temporary file in the index folder, and then moves it into place, so that readers never see a
+    #   partly written file, and concurrent writers never share a temporary file.
+    #
+    # Parameters:
+    # - file_path : str   : The path of the index file.
+    # - data      : bytes : The file content.
+    #
+    # Return Values:
+    # - None.
+    #
+    # Preconditions:
+    # - The index folder exists.
+    #
+    # Postconditions:
+    # - The index file has been written, and the temporary file has been removed.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def write_file ( self, file_path, data ):
+
+        file_descriptor, temporary_path = tempfile.mkstemp ( dir = self.index_folder, prefix = os.path.basename ( file_path ) + '.', suffix = '.tmp' )
+
+        try:
+            with os.fdopen ( file_descriptor, 'wb' ) as file:
+                file.write ( data )
+
+            os.replace ( temporary_path, file_path )
+
+        except BaseException:
+            try:
+                os.remove ( temporary_path )
+            except OSError:
+                pass
+            raise
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Get the signature of a chat log file, used to detect changes to the file.
+    #
+    # Function name:
+    # - get_file_signature
+    #
+    # Description:
+    # - This function returns the modification time and size of a chat log file.
+    #
+    # Parameters:
+    # - file_name : str : The chat log file name, relative to the chat log folder.
+    #
+    # Return Values:
+    # - file_signature : tuple : The file's modification time in nanoseconds and size in bytes.
+    #
+    # Preconditions:
+    # - The chat log file exists.
+    #
+    # Postconditions:
+    # - None.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def get_file_signature ( self, file_name ):
+
+        file_status = os.stat ( os.path.join ( self.chat_log_folder, file_name ) )
+
+        return ( file_status.st_mtime_ns, file_status.st_size )
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Split text into index terms.
+    #
+    # Function name:
+    # - get_terms
+    #
+    # Description:
+    # - This function returns the lower case words in a piece of text.
+    #
+    # Parameters:
+    # - text : str : The text to split.
+    #
+    # Return Values:
+    # - terms : list : The terms in the text, in order.
+    #
+    # Preconditions:
+    # - None.
+    #
+    # Postconditions:
+    # - None.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def get_terms ( self, text ):
+
+        return self.INDEX_TERM_PATTERN.findall ( text.lower () )
@@ -0,0 +1,209 @@
+#---------------------------------------------------------------------------------------------------------------------------------------------------------
+# Application   Conversation Agent Reference Application
+# Version:      2.0
+# Release Date: 2024-04-06
+# Author:       Rohin Gosling
+#
+# Description:
+#
+# - Chat log reader, for reading the chat log files written by `LanguageModel.save_chat_log_to_file` back into messages.
+#
+# - A chat log file consists of a model information header, followed by messages of the form:
+#
+#   [<role>]
+#   <content>
+#   <blank line>
+#
+# - A message starts at a line holding only a known role tag, e.g. `[user]`, and runs until the next role tag or the end of the file.
+#
+#---------------------------------------------------------------------------------------------------------------------------------------------------------
+
+import os
+import re
+from message import Message
+
+# Constants: Chat Log Files.
+
+CHAT_LOG_FILE_NAME_PATTERN = re.compile ( r'^chat_log_(\d+)\.txt$' )
+CHAT_LOG_ROLE_TAGS         = { f'[{role}]'.encode ( 'utf-8' ) : role for role in Message.MESSAGE_ROLES }
+
+#-------------------------------------------------------------------------------------------------------------------------------------------------------------
+# List the chat log files in a chat log folder.
+#
+# Function name:
+# - list_chat_log_files
+#
+# Description:
+# - This function returns the names of the chat log files in a folder, in the order in which they were written.
+#
+# Parameters:
+# - chat_log_folder : str : The chat log folder.
+#
+# Return Values:
+# - file_names : list : The chat log file names, relative to the chat log folder, sorted by chat log index.
+#
+# Preconditions:
+# - None.
+#
+# Postconditions:
+# - None.
+#
+# To-Do:
+# - None.
+#
+#-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def list_chat_log_files ( chat_log_folder ):
+
+    if not os.path.isdir ( chat_log_folder ):
+        return []
+
+    chat_log_files = []
+
+    for file_name in os.listdir ( chat_log_folder ):
+        match = CHAT_LOG_FILE_NAME_PATTERN.match ( file_name )
+        if match:
+            chat_log_files.append ( ( int ( match.group ( 1 ) ), file_name ) )
+
+    return [ file_name for _, file_name in sorted ( chat_log_files ) ]
+
+#-------------------------------------------------------------------------------------------------------------------------------------------------------------
+# Read the messages from a chat log file.
+#
+# Function name:
+# - read_chat_log_messages
+#
+# Description:
+# - This function parses a chat log file into its messages.
+# - Along with each message, the position of the message content in the file is returned, so that callers can index a message, and read its content back
+#   later, without holding the content in memory.
+# - Both `\n` and `\r\n` line endings are supported.
+#
+# Parameters:
+# - file_name : str : The chat log file name.
+#
+# Return Values:
+# - messages : list : A list of `( role, content, byte_offset, byte_length )` tuples, one per message, where `byte_offset` and `byte_length` give the position
+#                     of the UTF-8 encoded message content in the file.
+#
+# Preconditions:
+# - The chat log file exists.
+#
+# Postconditions:
+# - None.
+#
+# To-Do:
+# - None.
+#
+#-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def read_chat_log_messages ( file_name ):
+
+    with open ( file_name, 'rb' ) as file:
+        data = file.read ()
+
+    messages     = []
+    role         = None
+    content_head = 0
+    content_tail = 0
+    line_head    = 0
+
+    for line in data.splitlines ( keepends = True ):
+
+        line_tail = line_head + len ( line )
+        line_text = line.rstrip ( b'\r\n' )
+
+        if line_text in CHAT_LOG_ROLE_TAGS:
+
+            # Role tag. Close the previous message, and start a new one.
+
+            if role is not None:
+                messages.append ( compile_chat_log_message ( data, role, content_head, content_tail ) )
+
+            role         = CHAT_LOG_ROLE_TAGS [ line_text ]
+            content_head = line_tail
+            content_tail = line_tail
+
+        elif line_text != b'':
+
+            # Content line. Blank lines only extend the content if they are followed by more content.
+
+            content_tail = line_head + len ( line_text )
+
+        line_head = line_tail
+
+    if role is not None:
+        messages.append ( compile_chat_log_message ( data, role, content_head, content_tail ) )
+
+    return messages
+
+#-------------------------------------------------------------------------------------------------------------------------------------------------------------
+# Compile a chat log message tuple.
+#
+# Function name:
+# - compile_chat_log_message
+#
+# Description:
+# - This function returns the message tuple for the message content between two positions in a chat log file's data.
+#
+# Parameters:
+# - data         : bytes : The chat log file's data.
+# - role         : str   : The role of the message sender.
+# - content_head : int   : The position of the start of the message content.
+# - content_tail : int   : The position of the end of the message content.
+#
+# Return Values:
+# - message : tuple : A `( role, content, byte_offset, byte_length )` tuple.
+#
+# Preconditions:
+# - None.
+#
+# Postconditions:
+# - None.
+#
+# To-Do:
+# - None.
+#
+#-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def compile_chat_log_message ( data, role, content_head, content_tail ):
+
+    content = data [ content_head : content_tail ].decode ( 'utf-8', errors = 'replace' ).replace ( '\r\n', '\n' )
+
+    return ( role, content, content_head, content_tail - content_head )
+
+#-------------------------------------------------------------------------------------------------------------------------------------------------------------
+# Read message content from a chat log file.
+#
+# Function name:
+# - read_chat_log_content
+#
+# Description:
+# - This function reads the content of a single message back from a chat log file, using the position returned by `read_chat_log_messages`.
+#
+# Parameters:
+# - file_name   : str : The chat log file name.
+# - byte_offset : int : The position of the message content in the file.
+# - byte_length : int : The length of the UTF-8 encoded message content.
+#
+# Return Values:
+# - content : str : The message content.
+#
+# Preconditions:
+# - The chat log file exists, and has not changed since the message position was read.
+#
+# Postconditions:
+# - None.
+#
+# To-Do:
+# - None.
+#
+#-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def read_chat_log_content ( file_name, byte_offset, byte_length ):
+
+    with open ( file_name, 'rb' ) as file:
+        file.seek ( byte_offset )
+        data = file.read ( byte_length )
+
+    return data.decode ( 'utf-8', errors = 'replace' ).replace ( '\r\n', '\n' )
@@ -0,0 +1,321 @@
+#---------------------------------------------------------------------------------------------------------------------------------------------------------
+# Application   Conversation Agent Reference Application
+# Version:      2.0
+# Release Date: 2024-04-06
+# Author:       Rohin Gosling
+#
+# Description:
+#
+# - Hot-reloadable configuration.
+#
+# - Model settings are loaded from a JSON configuration file (`data/config.json` by default), and the system prompt is loaded from the file named in the
+#   configuration.
+#
+# - Both files are watched by modification time polling. `reload_if_changed` is called before each query, and checks the files at most once per
+#   `reload_interval` seconds. A file is only re-read when its modification time or size has changed, so the system prompt is otherwise served from memory.
+#
+# - Each time the loaded settings or system prompt change, `version` is incremented. Consumers compare `version` with the version they last applied, to
+#   decide whether to re-apply the configuration. This lets any number of sessions share one configuration instance, without restarting the process.
+#
+# - If the configuration file is missing or invalid, the defaults (or the last successfully loaded settings) are kept.
+#
+#---------------------------------------------------------------------------------------------------------------------------------------------------------
+
+import os
+import sys
+import json
+import time
+from utility import load_text_to_string
+
+class Configuration:
+
+    # Constants: Configuration File.
+
+    CONFIGURATION_FILE_NAME = 'data/config.json'
+
+    # Constants: Configuration Setting Names.
+
+    CONFIGURATION_BACKEND                 = 'backend'
+    CONFIGURATION_FAKE_BACKEND_LATENCY    = 'fake_backend_latency'
+    CONFIGURATION_MODEL_NAME              = 'model_name'
+    CONFIGURATION_MAX_TOKENS              = 'max_tokens'
+    CONFIGURATION_TEMPERATURE             = 'temperature'
+    CONFIGURATION_STREAMING_ENABLED       = 'streaming_enabled'
+    CONFIGURATION_SYSTEM_PROMPT_FILE_NAME = 'system_prompt_file_name'
+    CONFIGURATION_RELOAD_INTERVAL         = 'reload_interval'
+    CONFIGURATION_RETRIEVAL_ENABLED       = 'retrieval_enabled'
+    CONFIGURATION_RETRIEVAL_TOP_K         = 'retrieval_top_k'
+    CONFIGURATION_RETRIEVAL_EMBEDDER      = 'retrieval_embedder'
+    CONFIGURATION_COALESCING_ENABLED      = 'coalescing_enabled'
+
+    # Constants: Configuration Defaults.
+    # - Used for any setting that is not present in the configuration file.
+    # - The backend settings are read when a language model is created, and the retrieval embedder when the vector index is first opened. All other
+    #   settings are hot-reloaded.
+
+    CONFIGURATION_BACKEND_OPENAI = 'openai'    # Query the OpenAI API.
+    CONFIGURATION_BACKEND_FAKE   = 'fake'      # Query the local fake backend. See `FakeClient`.
+
+    CONFIGURATION_DEFAULTS = {
+        CONFIGURATION_BACKEND                 : CONFIGURATION_BACKEND_OPENAI,
+        CONFIGURATION_FAKE_BACKEND_LATENCY    : 0.05,
+        CONFIGURATION_MODEL_NAME              : 'gpt-4o',
+        CONFIGURATION_MAX_TOKENS              : 1024,
+        CONFIGURATION_TEMPERATURE             : 0.7,
+        CONFIGURATION_STREAMING_ENABLED       : True,
+        CONFIGURATION_SYSTEM_PROMPT_FILE_NAME : 'data/system_prompt.txt',
+        CONFIGURATION_RELOAD_INTERVAL         : 1.0,
+        CONFIGURATION_RETRIEVAL_ENABLED       : False,
+        CONFIGURATION_RETRIEVAL_TOP_K         : 3,
+        CONFIGURATION_RETRIEVAL_EMBEDDER      : 'hashing',
+        CONFIGURATION_COALESCING_ENABLED      : False
+    }
+
+    # Constants: Terminal Management.
+    # - Terminal formatting and rendering.
+
+    TERMINAL_ERROR = '[Error]'
+
+    #---------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Constructor.
+    #---------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def __init__ ( self, file_name = CONFIGURATION_FILE_NAME ):
+
+        # Initialise configuration.
+
+        self.file_name                 = file_name
+        self.settings                  = dict ( self.CONFIGURATION_DEFAULTS )
+        self.system_prompt             = ''
+        self.version                   = 0
+        self.last_check_time           = None
+        self.file_signature            = None
+        self.system_prompt_file_name   = None
+        self.system_prompt_signature   = None
+
+        # Load configuration and system prompt.
+
+        self.reload_if_changed ( force_enabled = True )
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Get a configuration setting.
+    #
+    # Function name:
+    # - get
+    #
+    # Description:
+    # - This function returns the current value of a configuration setting.
+    #
+    # Parameters:
+    # - setting_name : str : The name of the setting, e.g. `CONFIGURATION_MODEL_NAME`.
+    #
+    # Return Values:
+    # - setting_value : any : The current value of the setting.
+    #
+    # Preconditions:
+    # - The configuration class must be initialized.
+    #
+    # Postconditions:
+    # - None.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def get ( self, setting_name ):
+
+        return self.settings [ setting_name ]
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Reload the configuration and system prompt files, if they have changed.
+    #
+    # Function name:
+    # - reload_if_changed
+    #
+    # Description:
+    # - This function polls the modification time and size of the configuration file and the system prompt file, and re-reads whichever of them changed.
+    # - Polling is rate limited to once per `reload_interval` seconds, unless `force_enabled` is True.
+    #
+    # Parameters:
+    # - force_enabled : bool : Check the files even if the reload interval has not yet elapsed. Default value is False.
+    #
+    # Return Values:
+    # - changed : bool : True if the settings or system prompt changed, otherwise False.
+    #
+    # Preconditions:
+    # - None.
+    #
+    # Postconditions:
+    # - The settings and system prompt reflect the files on disk, and `version` has been incremented if either changed.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def reload_if_changed ( self, force_enabled = False ):
+
+        # Rate limit polling.
+
+        current_time = time.monotonic ()
+
+        if not force_enabled and current_time - self.last_check_time < self.settings [ self.CONFIGURATION_RELOAD_INTERVAL ]:
+            return False
+
+        self.last_check_time = current_time
+
+        # Reload the configuration file and system prompt file, if they have changed.
+
+        settings_changed      = self.reload_settings_if_changed ()
+        system_prompt_changed = self.reload_system_prompt_if_changed ()
+
+        if settings_changed or system_prompt_changed:
+            self.version += 1
+            return True
+
+        return False
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Reload the configuration file, if it has changed.
+    #
+    # Function name:
+    # - reload_settings_if_changed
+    #
+    # Description:
+    # - This function re-reads the configuration file if its modification time or size has changed since it was last read.
+    # - Settings missing from the file take their default values. If the file can not be read or parsed, the current settings are kept.
+    #
+    # Parameters:
+    # - None
+    #
+    # Return Values:
+    # - changed : bool : True if the settings changed, otherwise False.
+    #
+    # Preconditions:
+    # - None.
+    #
+    # Postconditions:
+    # - The settings reflect the configuration file on disk.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def reload_settings_if_changed ( self ):
+
+        file_signature = self.get_file_signature ( self.file_name )
+
+        if file_signature == self.file_signature:
+            return False
+
+        self.file_signature = file_signature
+
+        # The configuration file is optional. If it does not exist, use the default settings.
+
+        if file_signature is None:
+            settings = dict ( self.CONFIGURATION_DEFAULTS )
+
+        else:
+            try:
+                with open ( self.file_name, 'r', encoding = 'utf-8' ) as file:
+                    settings = { **self.CONFIGURATION_DEFAULTS, **json.load ( file ) }
+
+            except ( OSError, ValueError ) as e:
+                print ( f'\n{self.TERMINAL_ERROR} Unable to load configuration file {self.file_name}: {str(e)}', file = sys.stderr )
+                return False
+
+        if settings == self.settings:
+            return False
+
+        self.settings = settings
+
+        return True
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Reload the system prompt file, if it has changed.
+    #
+    # Function name:
+    # - reload_system_prompt_if_changed
+    #
+    # Description:
+    # - This function re-reads the system prompt file if the file name in the settings, or the file's modification time or size, has changed since it was last
+    #   read.
+    # - If the system prompt file is missing or empty, the system prompt is set to an empty string, and the caller should use its default system prompt.
+    #
+    # Parameters:
+    # - None
+    #
+    # Return Values:
+    # - changed : bool : True if the system prompt changed, otherwise False.
+    #
+    # Preconditions:
+    # - None.
+    #
+    # Postconditions:
+    # - The system prompt reflects the system prompt file on disk.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def reload_system_prompt_if_changed ( self ):
+
+        system_prompt_file_name = self.settings [ self.CONFIGURATION_SYSTEM_PROMPT_FILE_NAME ]
+        system_prompt_signature = self.get_file_signature ( system_prompt_file_name )
+
+        if system_prompt_file_name == self.system_prompt_file_name and system_prompt_signature == self.system_prompt_signature:
+            return False
+
+        self.system_prompt_file_name = system_prompt_file_name
+        self.system_prompt_signature = system_prompt_signature
+
+        system_prompt = load_text_to_string ( system_prompt_file_name ) if system_prompt_signature is not None else ''
+
+        if system_prompt is None:
+            system_prompt = ''
+
+        if system_prompt == self.system_prompt:
+            return False
+
+        self.system_prompt = system_prompt
+
+        return True
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Get the signature of a file, used to detect changes to the file.
+    #
+    # Function name:
+    # - get_file_signature
+    #
+    # Description:
+    # - This function returns the modification time and size of a file.
+    #
+    # Parameters:
+    # - file_name : str : The name of the file.
+    #
+    # Return Values:
+    # - file_signature : tuple : The file's modification time in nanoseconds and size in bytes, or `None` if the file does not exist.
+    #
+    # Preconditions:
+    # - None.
+    #
+    # Postconditions:
+    # - None.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def get_file_signature ( self, file_name ):
+
+        try:
+            file_status = os.stat ( file_name )
+
+        except OSError:
+            return None
+
+        return ( file_status.st_mtime_ns, file_status.st_size )
@@ -0,0 +1,133 @@
+#---------------------------------------------------------------------------------------------------------------------------------------------------------
+# Application   Conversation Agent Reference Application
+# Version:      2.0
+# Release Date: 2024-04-06
+# Author:       Rohin Gosling
+#
+# Description:
+#
+# - Local fake language model backend, for development, load testing, and benchmarking without calling the OpenAI API.
+#
+# - `FakeClient` implements the part of the `OpenAI` client interface used by `LanguageModel.send_query`, i.e. `post`. It decodes the request
+#   body like a real server would, waits for a configurable latency, and replies with a short deterministic response that echoes the latest user message.
+#
+# - Streaming and non-streaming responses have the same shape as the OpenAI client's response objects, as far as the renderers are concerned:
+#
+#   - Streaming:     An iterator of chunks, where the text of each chunk is in `chunk.choices [ 0 ].delta.content`.
+#   - Non-streaming: A response, where the text is in `response.choices [ 0 ].message.content`.
+#
+# - Select the fake backend by setting `backend` to `fake` in `data/config.json`.
+#
+#---------------------------------------------------------------------------------------------------------------------------------------------------------
+
+import json
+import time
+from types import SimpleNamespace
+
+class FakeClient:
+
+    # Constants: Fake Responses.
+
+    FAKE_RESPONSE_PREFIX      = 'You said:'
+    FAKE_RESPONSE_CHUNK_WORDS = 4       # Number of words in each streamed chunk.
+
+    #---------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Constructor.
+    #---------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def __init__ ( self, latency = 0.0 ):
+
+        # Initialise fake client.
+
+        self.latency = latency      # Time in seconds to wait before responding, to simulate the upstream API.
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Post a request to the fake backend.
+    #
+    # Function name:
+    # - post
+    #
+    # Description:
+    # - This function mirrors `OpenAI.post`, as called by `LanguageModel.send_query`.
+    # - The response text echoes the content of the last message in the request.
+    #
+    # Parameters:
+    # - path       : str   : The API path. Ignored.
+    # - body       : bytes : The JSON-encoded request body.
+    # - cast_to    : type  : The non-streaming response type. Ignored.
+    # - stream     : bool  : True to return a streaming response, otherwise False.
+    # - stream_cls : type  : The streaming response type. Ignored.
+    #
+    # Return Values:
+    # - response : object : An iterator of response chunks if `stream` is True, otherwise a complete response.
+    #
+    # Preconditions:
+    # - None.
+    #
+    # Postconditions:
+    # - None.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def post ( self, path, body = None, cast_to = None, stream = False, stream_cls = None ):
+
+        # Decode the request, and compile the response text.
+
+        request  = json.loads ( body )
+        messages = request [ 'messages' ]
+
+        response_text = f'{self.FAKE_RESPONSE_PREFIX} {messages [ -1 ] [ "content" ]}'
+
+        # Simulate the upstream API latency.
+
+        if self.latency > 0.0:
+            time.sleep ( self.latency )
+
+        # Return the response.
+
+        if stream:
+            return self.stream_response ( response_text )
+
+        return SimpleNamespace ( choices = [ SimpleNamespace ( message = SimpleNamespace ( content = response_text ) ) ] )
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Stream a response.
+    #
+    # Function name:
+    # - stream_response
+    #
+    # Description:
+    # - This function splits the response text into chunks of a few words, and yields them as streaming response chunks.
+    #
+    # Parameters:
+    # - response_text : str : The response text.
+    #
+    # Return Values:
+    # - chunk : object : Each response chunk, in order.
+    #
+    # Preconditions:
+    # - None.
+    #
+    # Postconditions:
+    # - None.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def stream_response ( self, response_text ):
+
+        words = response_text.split ( ' ' )
+
+        for word_index in range ( 0, len ( words ), self.FAKE_RESPONSE_CHUNK_WORDS ):
+
+            chunk_text = ' '.join ( words [ word_index : word_index + self.FAKE_RESPONSE_CHUNK_WORDS ] )
+
+            if word_index > 0:
+                chunk_text = ' ' + chunk_text
+
+            yield SimpleNamespace ( choices = [ SimpleNamespace ( delta = SimpleNamespace ( content = chunk_text ) ) ] )
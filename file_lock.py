@@ -0,0 +1,148 @@
+#---------------------------------------------------------------------------------------------------------------------------------------------------------
+# Application   Conversation Agent Reference Application
+# Version:      2.0
+# Release Date: 2024-04-06
+# Author:       Rohin Gosling
+#
+# Description:
+#
+# - Cross-process file lock, for index files that are shared by several application processes, e.g. the worker processes of a worker pool, or the
+#   processes started by the load generator.
+#
+# - Thread locks only exclude threads in the same process. A `FileLock` takes an exclusive operating system lock on a lock file, so that it also excludes
+#   other processes:
+#
+#   - POSIX:   `fcntl.flock`.
+#   - Windows: `msvcrt.locking`, on the first byte of the lock file.
+#
+# - The lock is released when the `with` block exits, or when the process exits, so a crashed process never leaves the lock held.
+#
+# - Usage:
+#
+#   with FileLock ( os.path.join ( index_folder, 'index.lock' ) ):
+#       ...
+#
+#---------------------------------------------------------------------------------------------------------------------------------------------------------
+
+import os
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+class FileLock:
+
+    #---------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Constructor.
+    #---------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def __init__ ( self, lock_path ):
+
+        # Initialise file lock.
+
+        self.lock_path = lock_path
+        self.file      = None       # The open lock file, while the lock is held.
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Acquire the lock.
+    #
+    # Function name:
+    # - acquire
+    #
+    # Description:
+    # - This function opens the lock file, creating it and its folder if necessary, and blocks until it holds an exclusive lock on the file.
+    #
+    # Parameters:
+    # - None
+    #
+    # Return Values:
+    # - None.
+    #
+    # Preconditions:
+    # - The lock is not already held by this object.
+    #
+    # Postconditions:
+    # - The lock is held.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def acquire ( self ):
+
+        lock_folder = os.path.dirname ( self.lock_path )
+
+        if lock_folder and not os.path.exists ( lock_folder ):
+            os.makedirs ( lock_folder, exist_ok = True )
+
+        self.file = open ( self.lock_path, 'a+b' )
+
+        try:
+            if os.name == 'nt':
+                self.file.seek ( 0 )
+                msvcrt.locking ( self.file.fileno (), msvcrt.LK_LOCK, 1 )
+            else:
+                fcntl.flock ( self.file.fileno (), fcntl.LOCK_EX )
+
+        except OSError:
+            self.file.close ()
+            self.file = None
+            raise
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Release the lock.
+    #
+    # Function name:
+    # - release
+    #
+    # Description:
+    # - This function unlocks and closes the lock file. The lock file itself is left in place, so that every process always locks the same file.
+    #
+    # Parameters:
+    # - None
+    #
+    # Return Values:
+    # - None.
+    #
+    # Preconditions:
+    # - None.
+    #
+    # Postconditions:
+    # - The lock is not held.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def release ( self ):
+
+        if self.file is None:
+            return
+
+        try:
+            if os.name == 'nt':
+                self.file.seek ( 0 )
+                msvcrt.locking ( self.file.fileno (), msvcrt.LK_UNLCK, 1 )
+            else:
+                fcntl.flock ( self.file.fileno (), fcntl.LOCK_UN )
+
+        finally:
+            self.file.close ()
+            self.file = None
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Context manager support.
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def __enter__ ( self ):
+
+        self.acquire ()
+
+        return self
+
+    def __exit__ ( self, exception_type, exception_value, traceback ):
+
+        self.release ()
@@ -0,0 +1,194 @@
+#---------------------------------------------------------------------------------------------------------------------------------------------------------
+# Application   Conversation Agent Reference Application
+# Version:      2.0
+# Release Date: 2024-04-06
+# Author:       Rohin Gosling
+#
+# Description:
+#
+# - Background input reader, used to read user input prompts concurrently with the rest of the main loop.
+#
+# - A daemon thread reads lines from the input stream (usually `sys.stdin`), and places them on a type-ahead queue. The main loop drains the queue in the
+#   order the lines were entered.
+#
+# - This means that lines typed while the language model response is streaming, or lines piped in from a file (e.g. `cat prompts.txt | python main.py`),
+#   are read and queued immediately, rather than waiting for the main loop to get back around to calling `input()`.
+#
+# - End of input is signalled to the consumer by returning `None`.
+#
+#---------------------------------------------------------------------------------------------------------------------------------------------------------
+
+import sys
+import queue
+import threading
+
+class InputReader:
+
+    # Constants: Input Reader.
+
+    INPUT_READER_END_OF_INPUT = None    # Sentinel placed on the type-ahead queue when the input stream reaches end of file.
+
+    #---------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Constructor.
+    #---------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def __init__ ( self, input_stream = None ):
+
+        # Initialise input reader.
+
+        self.input_stream        = input_stream if input_stream is not None else sys.stdin
+        self.type_ahead_queue    = queue.Queue ()
+        self.end_of_input        = False
+        self.thread              = threading.Thread ( target = self.read_loop, name = 'InputReader', daemon = True )
+        self.thread_started      = False
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Start the background input reader thread.
+    #
+    # Function name:
+    # - start
+    #
+    # Description:
+    # - This function starts the daemon thread that reads lines from the input stream into the type-ahead queue.
+    # - Calling `start` more than once has no further effect.
+    #
+    # Parameters:
+    # - None
+    #
+    # Return Values:
+    # - None.
+    #
+    # Preconditions:
+    # - The input reader class must be initialized.
+    #
+    # Postconditions:
+    # - The input reader thread is running.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def start ( self ):
+
+        if not self.thread_started:
+            self.thread.start ()
+            self.thread_started = True
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Read lines from the input stream into the type-ahead queue.
+    #
+    # Function name:
+    # - read_loop
+    #
+    # Description:
+    # - This function is the body of the input reader thread.
+    # - It reads lines from the input stream until end of file, strips the line terminator, and places each line on the type-ahead queue.
+    # - When the input stream is exhausted or closed, the end of input sentinel is placed on the queue.
+    #
+    # Parameters:
+    # - None
+    #
+    # Return Values:
+    # - None.
+    #
+    # Preconditions:
+    # - The input reader thread must have been started.
+    #
+    # Postconditions:
+    # - All lines from the input stream have been queued, followed by the end of input sentinel.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def read_loop ( self ):
+
+        try:
+            for line in iter ( self.input_stream.readline, '' ):
+                self.type_ahead_queue.put ( line.rstrip ( '\r\n' ) )
+
+        except ( OSError, ValueError ):
+
+            # The input stream was closed underneath us. Treat this the same as end of file.
+
+            pass
+
+        finally:
+            self.type_ahead_queue.put ( self.INPUT_READER_END_OF_INPUT )
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Get the next line from the type-ahead queue.
+    #
+    # Function name:
+    # - get_line
+    #
+    # Description:
+    # - This function returns the next queued input line, blocking until one is available.
+    # - Lines are returned in the order in which they were read from the input stream.
+    #
+    # Parameters:
+    # - timeout : float : Optional time in seconds to wait for a line. Default value is None, i.e. Wait indefinitely.
+    #
+    # Return Values:
+    # - line : str : The next input line, or `None` if the end of the input stream has been reached.
+    #
+    # Preconditions:
+    # - The input reader thread must have been started.
+    #
+    # Postconditions:
+    # - The returned line is removed from the type-ahead queue.
+    #
+    # Raises:
+    # - queue.Empty : If the timeout expired before a line was available. A timeout is not the end of input, since the user may simply not have typed
+    #                 anything yet.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def get_line ( self, timeout = None ):
+
+        # Once the end of input has been reached, there is nothing more to read.
+
+        if self.end_of_input:
+            return self.INPUT_READER_END_OF_INPUT
+
+        line = self.type_ahead_queue.get ( timeout = timeout )
+
+        if line is self.INPUT_READER_END_OF_INPUT:
+            self.end_of_input = True
+
+        return line
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Get the number of lines waiting in the type-ahead queue.
+    #
+    # Function name:
+    # - get_pending_line_count
+    #
+    # Description:
+    # - This function returns the approximate number of lines that have been read from the input stream, but not yet consumed.
+    #
+    # Parameters:
+    # - None
+    #
+    # Return Values:
+    # - pending_line_count : int : The approximate number of queued lines.
+    #
+    # Preconditions:
+    # - The input reader class must be initialized.
+    #
+    # Postconditions:
+    # - None.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def get_pending_line_count ( self ):
+
+        return self.type_ahead_queue.qsize ()
@@ -53,9 +53,19 @@
 #---------------------------------------------------------------------------------------------------------------------------------------------------------
 
 import os
-from openai  import OpenAI
-
-from utility import load_text_to_string
+import sys
+import json
+import inspect
+import hashlib
+from openai            import OpenAI, Stream
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+from message           import Message
+from request_encoder   import RequestEncoder
+from configuration     import Configuration
+from retrieval         import get_shared_vector_index
+from fake_client       import FakeClient
+from request_coalescer import shared_request_coalescer
 
 class LanguageModel:
 
@@ -67,8 +77,10 @@ class LanguageModel:
     MODEL_MESSAGE_ROLE_SYSTEM     = 'system'
     MODEL_MESSAGE_ROLE_USER       = 'user'
     MODEL_MESSAGE_ROLE_AI         = 'assistant'
-    MODEL_SYSTEM_PROMPT_FILE_NAME = 'data/system_prompt.txt'
     MODEL_SYSTEM_PROMPT_DEFAULT   = 'You are a general purpose AI assistant. You always provide well-reasoned answers that are both correct and helpful.'
+    MODEL_API_PATH_COMPLETIONS    = '/chat/completions'
+    MODEL_RETRIEVAL_HEADER        = 'Relevant excerpts from past conversations. Use them only if they help to answer the next user message.'
+    MODEL_RETRIEVAL_EXCERPT_SIZE  = 1000     # Maximum number of characters of each retrieved message to include.
 
     # Constants: Terminal Management.
     # - Terminal formatting and rendering.
@@ -81,16 +93,26 @@ class LanguageModel:
     # Constructor.
     #---------------------------------------------------------------------------------------------------------------------------------------------------------
 
-    def __init__ ( self ):
+    def __init__ ( self, configuration = None ):
 
         # Initialise language model.
+        # - The model name, max tokens, temperature, streaming option, and system prompt are loaded from the configuration by `apply_configuration`.
+        # - Sessions may share a configuration instance. Changes to the configuration files are picked up before each query.
+
+        self.configuration           = configuration if configuration is not None else Configuration ()
+        self.client                  = self.create_client ()
+        self.raw_body_enabled        = True     # Cleared if the client can not send a pre-encoded request body. See `post_request_body`.
+        self.body_parameter          = 'content' if 'content' in inspect.signature ( self.client.post ).parameters else 'body'
+        self.configuration_version   = None
+        self.configuration_overrides = {}
+        self.conversation_history    = []
+        self.request_encoder         = RequestEncoder ()
+        self.vector_index            = None
+
+        # Initialise terminal output.
+        # - System and error messages are written to this stream. Headless modes redirect it to `sys.stderr`, to keep `sys.stdout` clean.
 
-        self.client               = OpenAI ( api_key = os.environ [ 'OPENAI_API_KEY' ] )
-        self.name                 = self.MODEL_NAME_GPT_4O
-        self.max_tokens           = 1024
-        self.temperature          = 0.7
-        self.streaming_enabled    = True
-        self.conversation_history = []
+        self.terminal_output_stream = sys.stdout
 
         # Initialise chat-log file. 
 
@@ -98,15 +120,170 @@ class LanguageModel:
         self.chat_log_file_name      = 'chat_log_'
         self.chat_log_file_extension = '.txt'
 
-        # Add system prompt to conversation history.
-        # - If a system prompt can not be loaded from the file, then just use the default system prompt. 
+        # Apply model settings, and add system prompt to conversation history.
+
+        self.apply_configuration ()
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Create the client used to query the language model.
+    #
+    # Function name:
+    # - create_client
+    #
+    # Description:
+    # - This function creates the client for the backend selected in the configuration.
+    # - For the OpenAI backend, the API key is read from the `OPENAI_API_KEY` environment variable.
+    #
+    # Parameters:
+    # - None
+    #
+    # Return Values:
+    # - client : object : An `OpenAI` client, or a `FakeClient` for the local fake backend.
+    #
+    # Preconditions:
+    # - The configuration must be initialized.
+    #
+    # Postconditions:
+    # - None.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def create_client ( self ):
+
+        if self.configuration.get ( Configuration.CONFIGURATION_BACKEND ) == Configuration.CONFIGURATION_BACKEND_FAKE:
+            return FakeClient ( latency = self.configuration.get ( Configuration.CONFIGURATION_FAKE_BACKEND_LATENCY ) )
+
+        return OpenAI ( api_key = os.environ [ 'OPENAI_API_KEY' ] )
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Apply the current configuration to the language model.
+    #
+    # Function name:
+    # - apply_configuration
+    #
+    # Description:
+    # - This function sets the model name, max tokens, temperature, streaming option, and retrieval options from the configuration, with any configuration
+    #   overrides applied.
+    # - The system prompt at the start of the conversation history is added, or replaced if it has changed. The rest of the conversation history is kept.
+    # - If a system prompt can not be loaded from the file, then just use the default system prompt. 
+    #
+    # Parameters:
+    # - None
+    #
+    # Return Values:
+    # - None.
+    #
+    # Preconditions:
+    # - The model class must be initialized.
+    #
+    # Postconditions:
+    # - The model settings and system prompt match the configuration.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def apply_configuration ( self ):
 
-        model_system_prompt = load_text_to_string ( self.MODEL_SYSTEM_PROMPT_FILE_NAME )
+        # Apply model settings.
+
+        settings = { **self.configuration.settings, **self.configuration_overrides }
+
+        self.name               = settings [ Configuration.CONFIGURATION_MODEL_NAME         ]
+        self.max_tokens         = settings [ Configuration.CONFIGURATION_MAX_TOKENS         ]
+        self.temperature        = settings [ Configuration.CONFIGURATION_TEMPERATURE        ]
+        self.streaming_enabled  = settings [ Configuration.CONFIGURATION_STREAMING_ENABLED  ]
+        self.retrieval_enabled  = settings [ Configuration.CONFIGURATION_RETRIEVAL_ENABLED  ]
+        self.retrieval_top_k    = settings [ Configuration.CONFIGURATION_RETRIEVAL_TOP_K    ]
+        self.retrieval_embedder = settings [ Configuration.CONFIGURATION_RETRIEVAL_EMBEDDER ]
+        self.coalescing_enabled = settings [ Configuration.CONFIGURATION_COALESCING_ENABLED ]
+
+        # Add or replace the system prompt.
+        # - The system prompt message is replaced rather than modified, so that the request encoder sees that it has changed.
+
+        model_system_prompt = self.configuration.system_prompt
 
         if model_system_prompt == '':
             model_system_prompt = self.MODEL_SYSTEM_PROMPT_DEFAULT
 
-        self.add_message_to_conversation_history ( model_system_prompt, self.MODEL_MESSAGE_ROLE_SYSTEM )
+        if len ( self.conversation_history ) == 0:
+            self.add_message_to_conversation_history ( model_system_prompt, self.MODEL_MESSAGE_ROLE_SYSTEM )
+
+        elif self.conversation_history [ 0 ].content != model_system_prompt:
+            self.conversation_history [ 0 ] = Message ( model_system_prompt, self.MODEL_MESSAGE_ROLE_SYSTEM )
+
+        self.configuration_version = self.configuration.version
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Reload the configuration if it has changed, and apply it to the language model.
+    #
+    # Function name:
+    # - update_configuration
+    #
+    # Description:
+    # - This function polls the configuration for changes, and re-applies it if it has changed since it was last applied to this model.
+    #
+    # Parameters:
+    # - None
+    #
+    # Return Values:
+    # - None.
+    #
+    # Preconditions:
+    # - The model class must be initialized.
+    #
+    # Postconditions:
+    # - The model settings and system prompt match the configuration.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def update_configuration ( self ):
+
+        self.configuration.reload_if_changed ()
+
+        if self.configuration.version != self.configuration_version:
+            self.apply_configuration ()
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Override a configuration setting for this language model.
+    #
+    # Function name:
+    # - override_configuration
+    #
+    # Description:
+    # - This function overrides a configuration setting for this model only, e.g. when it is set from the command line. The override takes precedence over
+    #   the configuration file, including after the configuration file is reloaded.
+    #
+    # Parameters:
+    # - setting_name  : str : The name of the setting, e.g. `Configuration.CONFIGURATION_STREAMING_ENABLED`.
+    # - setting_value : any : The value of the setting.
+    #
+    # Return Values:
+    # - None.
+    #
+    # Preconditions:
+    # - The model class must be initialized.
+    #
+    # Postconditions:
+    # - The override has been applied.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def override_configuration ( self, setting_name, setting_value ):
+
+        self.configuration_overrides [ setting_name ] = setting_value
+
+        self.apply_configuration ()
 
     #-------------------------------------------------------------------------------------------------------------------------------------------------------------
     # Add a message to the conversation history.
@@ -116,6 +293,7 @@ class LanguageModel:
     #
     # Description:
     # - This function appends a message to the model's conversation history.
+    # - Messages are stored as compact `Message` objects, and are only converted to the API's dictionary form when the language model is queried.
     #
     # Parameters:    
     # - message      : str : The message to be added to the conversation history.
@@ -139,17 +317,63 @@ class LanguageModel:
 
     def add_message_to_conversation_history ( self, message, message_role ):
         
-        self.conversation_history.append ( { 'role': message_role, 'content': message } )
+        self.conversation_history.append ( Message ( message, message_role ) )
 
     #-------------------------------------------------------------------------------------------------------------------------------------------------------------
-    # Query the language model with the conversation history.
+    # Query the language model with the conversation history, for the interactive application.
     #
     # Function name:
     # - query_language_model
     #
     # Description:
+    # - This function queries the language model with `send_query`. If the query fails, the error message is printed to the terminal output stream, and
+    #   returned in place of the response, so that the interactive application renders it as the model's reply.
+    # - Headless modes call `send_query` directly, so that a failure is raised, and reported once, in their own output.
+    #
+    # Parameters:
+    # - None
+    #
+    # Return Values:
+    # - response : object : The response object from the language model, or an error message string if the query failed.
+    #
+    # Preconditions:
+    # - The model class must be initialized.
+    # - The conversation history must be set.
+    #
+    # Postconditions:
+    # - The language model is queried and the response object is returned.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def query_language_model ( self ):
+
+        try:
+            return self.send_query ()
+
+        except Exception as e:
+
+            error_message = f'\n{self.TERMINAL_ERROR} {str(e)}\n'
+
+            print ( error_message, file = self.terminal_output_stream )
+
+            return error_message
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Send a query to the language model.
+    #
+    # Function name:
+    # - send_query
+    #
+    # Description:
     # - This function queries the language model using the provided conversation history.
     # - It handles both streaming and non-streaming responses.
+    # - The request body is built by the request encoder, which only encodes messages added since the previous query. The pre-encoded body is posted with the
+    #   client's `post` function, which is what `chat.completions.create` uses internally, so the client does not re-encode the conversation history.
+    # - If retrieval is enabled, relevant excerpts from past conversations are included in the request, but not in the conversation history. See
+    #   `get_request_messages`.
     #
     # Parameters:
     # - None
@@ -164,39 +388,204 @@ class LanguageModel:
     # Postconditions:
     # - The language model is queried and the response object is returned.
     #
+    # Raises:
+    # - Exception : Any error raised by the configuration, the retrieval index, or the client, e.g. an API error.
+    #
     # To-Do:
     # 1. Add more detailed error handling for the API call.
     # 2. Log the query and response for debugging.
     #
     #-------------------------------------------------------------------------------------------------------------------------------------------------------------
 
-    def query_language_model ( self ):
-        
-        try:
+    def send_query ( self ):
+
+        # Pick up any changes to the configuration files.
+
+        self.update_configuration ()
+
+        # Query the language model. 
+
+        request_body = self.request_encoder.encode (
+            self.get_request_messages (),
+            model       = self.name,
+            max_tokens  = self.max_tokens,
+            temperature = self.temperature,
+            stream      = self.streaming_enabled
+        )
+
+        post_request = lambda: self.post_request_body ( request_body )
+
+        # Share the upstream call with any identical request that is already running, e.g. the same prompt sent to many new sessions at once.
+        # - The request body covers the whole request, including the model settings and the conversation history, so requests with the same key are
+        #   interchangeable.
+
+        if self.coalescing_enabled:
+            request_key = hashlib.blake2b ( request_body, digest_size = 16 ).digest ()
+            response    = shared_request_coalescer.execute ( request_key, post_request, self.streaming_enabled )
+        else:
+            response    = post_request ()
+
+        # Return the response object. 
+        # - We return the response object rather than the response text, so that the renderer can render streaming responses if `stream` is True.        
+        # - If `stream` is False, the renderer will retrieve the response text with `response.choices [ 0 ].message.content`.
+
+        return response
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Post an encoded request body to the chat completions API.
+    #
+    # Function name:
+    # - post_request_body
+    #
+    # Description:
+    # - This function sends a request body encoded by the request encoder, without decoding and re-encoding it.
+    # - Sending a pre-encoded body needs a recent OpenAI SDK. Current SDKs take it as the `content` parameter of `post`, and some earlier 1.x SDKs accept it as
+    #   `body`. The parameter is looked up once, when the model is created. SDKs that can do neither raise `TypeError` when they try to serialize the bytes
+    #   as JSON. In that case, this and all later requests from this model fall back to `chat.completions.create`, which works with any 1.x SDK, without
+    #   the benefit of incremental encoding.
+    #
+    # Parameters:
+    # - request_body : bytes : The JSON-encoded request body.
+    #
+    # Return Values:
+    # - response : object : The response object, or a stream of response chunks if streaming is enabled.
+    #
+    # Preconditions:
+    # - The model class must be initialized.
+    #
+    # Postconditions:
+    # - None.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def post_request_body ( self, request_body ):
 
-            # Query the language model. 
+        # Fall back to the SDK's own request encoding.
+
+        if not self.raw_body_enabled:
+            return self.client.chat.completions.create ( **json.loads ( request_body ) )
+
+        # Post the encoded request body.
+
+        try:
 
-            response = self.client.chat.completions.create (
-                model       = self.name,
-                messages    = self.conversation_history,
-                max_tokens  = self.max_tokens,
-                temperature = self.temperature,
-                stream      = self.streaming_enabled
+            return self.client.post (
+                self.MODEL_API_PATH_COMPLETIONS,
+                cast_to    = ChatCompletion,
+                stream     = self.streaming_enabled,
+                stream_cls = Stream [ ChatCompletionChunk ],
+                **{ self.body_parameter : request_body }
             )
 
-            # Return the response object. 
-            # - We return the response object rather than the response text, so that the renderer can render streaming responses if `stream` is True.        
-            # - If `stream` is False, the renderer will retrieve the response text with `response.choices [ 0 ].message.content`.
+        except TypeError:
 
-            return response
-        
-        except Exception as e:
+            if self.body_parameter == 'content':
+                raise
 
-            error_message = f'\n{[self.TERMINAL_ERROR]} {str(e)}\n'
+            self.raw_body_enabled = False
 
-            print ( error_message )
+            return self.post_request_body ( request_body )
 
-            return error_message
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Get the messages to send to the language model.
+    #
+    # Function name:
+    # - get_request_messages
+    #
+    # Description:
+    # - This function returns the conversation history, with retrieved context inserted before the latest user message if retrieval is enabled.
+    # - The context message is only included in the request. It is not added to the conversation history, so it is not sent again on later turns, and is
+    #   not written to the chat log.
+    #
+    # Parameters:
+    # - None
+    #
+    # Return Values:
+    # - messages : list : The messages to send, as a list of `Message` objects.
+    #
+    # Preconditions:
+    # - The model class must be initialized.
+    #
+    # Postconditions:
+    # - None.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def get_request_messages ( self ):
+
+        # Retrieval only applies when the latest message is a user message.
+
+        if not self.retrieval_enabled or self.conversation_history [ -1 ].role != self.MODEL_MESSAGE_ROLE_USER:
+            return self.conversation_history
+
+        context_message = self.get_retrieval_context ( self.conversation_history [ -1 ].content )
+
+        if context_message is None:
+            return self.conversation_history
+
+        return self.conversation_history [ : -1 ] + [ context_message, self.conversation_history [ -1 ] ]
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Retrieve context from past conversations for a user prompt.
+    #
+    # Function name:
+    # - get_retrieval_context
+    #
+    # Description:
+    # - This function retrieves the past messages most relevant to the user prompt from the shared vector index, and compiles them into a system message.
+    # - The index is brought up to date with new chat log files by its update thread, which is started on first use, so indexing never delays the query.
+    # - If NumPy is not installed, or the configured embedder can not be created, retrieval is disabled for this model, and an error message is printed.
+    #
+    # Parameters:
+    # - user_prompt : str : The user's latest prompt.
+    #
+    # Return Values:
+    # - context_message : Message : A system message holding the retrieved excerpts, or `None` if nothing relevant was found.
+    #
+    # Preconditions:
+    # - The model class must be initialized.
+    #
+    # Postconditions:
+    # - None.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def get_retrieval_context ( self, user_prompt ):
+
+        # Open the shared vector index on first use.
+
+        if self.vector_index is None:
+            try:
+                self.vector_index = get_shared_vector_index ( self.chat_log_folder, self.retrieval_embedder )
+
+            except ( ImportError, ValueError ) as e:
+                print ( f'\n{self.TERMINAL_ERROR} {str(e)}\n', file = self.terminal_output_stream )
+                self.override_configuration ( Configuration.CONFIGURATION_RETRIEVAL_ENABLED, False )
+                return None
+
+        # Retrieve relevant messages.
+
+        self.vector_index.start_updates ()
+
+        results = self.vector_index.retrieve ( user_prompt, self.retrieval_top_k )
+
+        if len ( results ) == 0:
+            return None
+
+        # Compile the context message.
+
+        excerpts = [ f'[{result [ "role" ]}]\n{result [ "content" ] [ : self.MODEL_RETRIEVAL_EXCERPT_SIZE ]}' for result in results ]
+
+        return Message ( self.MODEL_RETRIEVAL_HEADER + '\n\n' + '\n\n'.join ( excerpts ), self.MODEL_MESSAGE_ROLE_SYSTEM )
 
     #-------------------------------------------------------------------------------------------------------------------------------------------------------------
     # Save the chat log to a file.
@@ -234,22 +623,33 @@ class LanguageModel:
         # Ensure the folder exists; if not, create it.
 
         if not os.path.exists ( self.chat_log_folder ):
-            os.makedirs ( self.chat_log_folder )
+            os.makedirs ( self.chat_log_folder, exist_ok = True )
         
         # Determine the next file number to use.
+        # - The file is created exclusively, so that if another process claims the same file number first, we move on to the next one rather than
+        #   overwriting its chat log.
 
         file_index = 0
 
-        while os.path.exists ( os.path.join ( self.chat_log_folder, f'{self.chat_log_file_name}{file_index}{self.chat_log_file_extension}' ) ):
-            file_index += 1
+        while True:
+
+            while os.path.exists ( os.path.join ( self.chat_log_folder, f'{self.chat_log_file_name}{file_index}{self.chat_log_file_extension}' ) ):
+                file_index += 1
+
+            # Create the filename with the next index.
 
-        # Create the filename with the next index.
+            file_name = os.path.join ( self.chat_log_folder, f'{self.chat_log_file_name}{file_index}{self.chat_log_file_extension}' )
 
-        file_name = os.path.join ( self.chat_log_folder, f'{self.chat_log_file_name}{file_index}{self.chat_log_file_extension}' )
+            try:
+                file = open ( file_name, 'x', encoding = 'utf-8' )
+                break
+
+            except FileExistsError:
+                file_index += 1
 
         # Write the conversation history to the file.
 
-        with open ( file_name, 'w', encoding = 'utf-8' ) as file:
+        with file:
 
             # Write chat log header information.
 
@@ -266,13 +666,51 @@ class LanguageModel:
 
             for row in self.conversation_history:
                 if row_index > 0:
-                    file.write ( f'[{row [ "role" ]}]\n{row [ "content" ]}\n\n' )
+                    file.write ( f'[{row.role}]\n{row.content}\n\n' )
                 elif row_index == 0 and include_system_prompt_enabled:
-                    file.write ( f'[{row [ "role" ]}]\n{row [ "content" ]}\n\n' )
+                    file.write ( f'[{row.role}]\n{row.content}\n\n' )
                 
                 row_index += 1
 
-        print ( f'\n{self.TERMINAL_SYSTEM}\nConversation history saved to "{file_name}."' ) 
+        print ( f'\n{self.TERMINAL_SYSTEM}\nConversation history saved to "{file_name}."', file = self.terminal_output_stream ) 
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Get the memory used by the conversation history.
+    #
+    # Function name:
+    # - get_conversation_history_memory_size
+    #
+    # Description:
+    # - This function returns the number of bytes used by the conversation history of this session, i.e. the history list and all of its messages, and the
+    #   encoded copy of the history held by the request encoder.
+    #
+    # Parameters:
+    # - None
+    #
+    # Return Values:
+    # - memory_size : int : The memory used by the conversation history, in bytes.
+    #
+    # Preconditions:
+    # - The model class must be initialized.
+    #
+    # Postconditions:
+    # - None.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def get_conversation_history_memory_size ( self ):
+
+        memory_size = sys.getsizeof ( self.conversation_history )
+
+        for message in self.conversation_history:
+            memory_size += message.get_memory_size ()
+
+        memory_size += self.request_encoder.get_memory_size ()
+
+        return memory_size
 
     #-------------------------------------------------------------------------------------------------------------------------------------------------------------
     # Function tagline. Short one-sentence or phrase description of function. e .g. Execute this or that. 
@@ -0,0 +1,1043 @@
+#---------------------------------------------------------------------------------------------------------------------------------------------------------
+# Application   Conversation Agent Reference Application
+# Version:      2.0
+# Release Date: 2024-04-06
+# Author:       Rohin Gosling
+#
+# Description:
+#
+# - Load generator, that replays recorded conversations from the chat log folder against the application, and reports latency and throughput.
+#
+# - Conversations are read from two kinds of file in the chat log folder:
+#
+#   - Chat log files, `chat_log_<n>.txt`, as written by `LanguageModel.save_chat_log_to_file`.
+#   - Structured chat log files, `*.jsonl`, with one message per line, of the form `{"role": "user", "content": "..."}`. Each file is one conversation.
+#
+# - Only the user messages of each conversation are replayed. The assistant messages are generated again by the application under test.
+#
+# - The application is run in one of three modes, each in a scratch working folder, so that the replayed conversations are not added to the chat log:
+#
+#   - interactive : One `python main.py` process per conversation, driven through stdin as if a user were typing.
+#   - pipeline    : One `python main.py --pipeline` process per conversation.
+#   - workers     : One `python main.py --pipeline --workers N` process, with one session per conversation.
+#
+# - In interactive and pipeline modes, a process holds a single conversation history, so every conversation is started on a fresh process, and a process
+#   is shut down once its conversation has ended. A spare process is kept running for each slot, so that the next conversation in the slot does not wait
+#   for the application to start.
+#
+# - Scheduling is open-loop. Turns are sent at the requested rate, whether or not earlier turns have completed, and `concurrency` conversations are
+#   interleaved turn by turn. When a conversation runs out of turns, the next conversation from the chat logs takes its place.
+#
+# - Latency is measured from the time a turn was scheduled to be sent, to the time its response was complete, so that time spent queued behind a slow
+#   response is included, rather than hidden by sending late.
+#
+# - Usage:
+#
+#   python load_generator.py --mode workers --workers 4 --rate 20 --concurrency 16 --turns 500
+#   python load_generator.py --mode pipeline --backend fake --fake-latency 0.2 --rate 5
+#
+#---------------------------------------------------------------------------------------------------------------------------------------------------------
+
+import os
+import sys
+import json
+import time
+import queue
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+from chat_log_reader import list_chat_log_files, read_chat_log_messages
+
+# Constants: Load Generator Modes.
+
+LOAD_MODE_INTERACTIVE = 'interactive'
+LOAD_MODE_PIPELINE    = 'pipeline'
+LOAD_MODE_WORKERS     = 'workers'
+LOAD_MODES            = [ LOAD_MODE_INTERACTIVE, LOAD_MODE_PIPELINE, LOAD_MODE_WORKERS ]
+
+# Constants: Load Generator Arrivals.
+
+LOAD_ARRIVAL_UNIFORM = 'uniform'    # Turns are sent at fixed intervals.
+LOAD_ARRIVAL_POISSON = 'poisson'    # Turns are sent at exponentially distributed intervals, with the same mean rate.
+LOAD_ARRIVALS        = [ LOAD_ARRIVAL_UNIFORM, LOAD_ARRIVAL_POISSON ]
+
+# Constants: Load Generator Files.
+
+LOAD_APPLICATION_FOLDER     = os.path.dirname ( os.path.abspath ( __file__ ) )
+LOAD_APPLICATION_SCRIPT     = os.path.join ( LOAD_APPLICATION_FOLDER, 'main.py' )
+LOAD_DATA_FOLDER            = 'data'
+LOAD_CONFIGURATION_FILE     = 'data/config.json'
+LOAD_STRUCTURED_LOG_SUFFIX  = '.jsonl'
+
+# Constants: Load Generator Interactive Mode.
+# - The prompt the application prints when it is ready for the next user prompt, and the prompt commands it would execute rather than send to the model.
+#   See `Application.TERMINAL_PROMPT_FORMAT` and `Application.PROMPT_COMMAND_*`.
+
+LOAD_INTERACTIVE_PROMPT   = '[User]'
+LOAD_INTERACTIVE_ERROR    = '[Error]'
+LOAD_INTERACTIVE_COMMANDS = { 'exit', 'clear', 'memory', '/search' }
+
+# Constants: Load Generator Defaults.
+
+LOAD_RATE_DEFAULT         = 1.0     # Turns per second.
+LOAD_CONCURRENCY_DEFAULT  = 4       # Number of conversations replayed at once.
+LOAD_WORKER_COUNT_DEFAULT = 2
+LOAD_DRAIN_TIMEOUT        = 60.0    # Time in seconds to wait for outstanding turns, after the last turn is sent.
+
+#-------------------------------------------------------------------------------------------------------------------------------------------------------------
+# Read the messages from a structured chat log file.
+#
+# Function name:
+# - read_structured_chat_log_messages
+#
+# Description:
+# - This function parses a structured chat log file, with one JSON message per line, into its messages.
+# - Blank lines, and lines that are not messages with a string role and content, are skipped.
+#
+# Parameters:
+# - file_name : str : The structured chat log file name.
+#
+# Return Values:
+# - messages : list : A list of `( role, content )` tuples, one per message.
+#
+# Preconditions:
+# - The structured chat log file exists.
+#
+# Postconditions:
+# - None.
+#
+# To-Do:
+# - None.
+#
+#-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def read_structured_chat_log_messages ( file_name ):
+
+    messages = []
+
+    with open ( file_name, 'r', encoding = 'utf-8' ) as file:
+
+        for line in file:
+
+            if line.strip () == '':
+                continue
+
+            try:
+                message = json.loads ( line )
+
+            except ValueError:
+                continue
+
+            if isinstance ( message, dict ) and isinstance ( message.get ( 'role' ), str ) and isinstance ( message.get ( 'content' ), str ):
+                messages.append ( ( message [ 'role' ], message [ 'content' ] ) )
+
+    return messages
+
+#-------------------------------------------------------------------------------------------------------------------------------------------------------------
+# Load the conversations to replay from a chat log folder.
+#
+# Function name:
+# - load_conversations
+#
+# Description:
+# - This function reads every chat log file and structured chat log file in a folder, and returns the user prompts of each conversation.
+# - Conversations with no user prompts are skipped.
+#
+# Parameters:
+# - chat_log_folder : str : The chat log folder.
+#
+# Return Values:
+# - conversations : list : A list of conversations, where each conversation is a list of user prompts, in order.
+#
+# Preconditions:
+# - None.
+#
+# Postconditions:
+# - None.
+#
+# To-Do:
+# - None.
+#
+#-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def load_conversations ( chat_log_folder ):
+
+    conversations = []
+
+    # Chat log files.
+
+    for file_name in list_chat_log_files ( chat_log_folder ):
+
+        messages = read_chat_log_messages ( os.path.join ( chat_log_folder, file_name ) )
+
+        conversations.append ( [ content for role, content, _, _ in messages if role == 'user' ] )
+
+    # Structured chat log files.
+
+    if os.path.isdir ( chat_log_folder ):
+
+        for file_name in sorted ( os.listdir ( chat_log_folder ) ):
+
+            if file_name.endswith ( LOAD_STRUCTURED_LOG_SUFFIX ):
+
+                messages = read_structured_chat_log_messages ( os.path.join ( chat_log_folder, file_name ) )
+
+                conversations.append ( [ content for role, content in messages if role == 'user' ] )
+
+    return [ conversation for conversation in conversations if len ( conversation ) > 0 ]
+
+#-------------------------------------------------------------------------------------------------------------------------------------------------------------
+# Schedule the turns to replay.
+#
+# Function name:
+# - schedule_turns
+#
+# Description:
+# - This function interleaves the turns of `concurrency` conversations, one turn from each in turn. Each conversation is replayed in a fixed slot, and when
+#   a conversation runs out of turns, the next conversation takes over its slot. Conversations are reused from the start once all have been replayed.
+#
+# Parameters:
+# - conversations : list : The conversations, as returned by `load_conversations`.
+# - concurrency   : int  : The number of conversations to replay at once.
+# - turn_count    : int  : The number of turns to schedule.
+#
+# Return Values:
+# - turns : list : A list of `( slot, session_id, prompt )` tuples, in the order they are to be sent.
+#
+# Preconditions:
+# - There is at least one conversation.
+#
+# Postconditions:
+# - None.
+#
+# To-Do:
+# - None.
+#
+#-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def schedule_turns ( conversations, concurrency, turn_count ):
+
+    turns              = []
+    conversation_count = 0
+    slot_states        = [ None ] * concurrency     # The session id, prompts, and next prompt index of the conversation in each slot.
+
+    while len ( turns ) < turn_count:
+
+        for slot in range ( concurrency ):
+
+            if len ( turns ) == turn_count:
+                break
+
+            # Start the next conversation, if the slot is empty or its conversation has ended.
+
+            if slot_states [ slot ] is None or slot_states [ slot ] [ 2 ] == len ( slot_states [ slot ] [ 1 ] ):
+                slot_states [ slot ] = [ f'conversation-{conversation_count}', conversations [ conversation_count % len ( conversations ) ], 0 ]
+                conversation_count  += 1
+
+            session_id, prompts, prompt_index = slot_states [ slot ]
+
+            turns.append ( ( slot, session_id, prompts [ prompt_index ] ) )
+
+            slot_states [ slot ] [ 2 ] += 1
+
+    return turns
+
+#-------------------------------------------------------------------------------------------------------------------------------------------------------------
+# Prepare a scratch working folder for the application under test.
+#
+# Function name:
+# - prepare_working_folder
+#
+# Description:
+# - This function creates a temporary folder with a copy of the application's data folder, so that the application under test finds its configuration
+#   and system prompt, and writes its chat logs to the scratch folder rather than the real chat log folder.
+# - The backend settings in the copied configuration file can be overridden, e.g. to load test against the local fake backend.
+#
+# Parameters:
+# - backend      : str   : The backend to use, or `None` to keep the configured backend.
+# - fake_latency : float : The fake backend latency in seconds, or `None` to keep the configured latency.
+#
+# Return Values:
+# - working_folder : str : The path of the scratch working folder.
+#
+# Preconditions:
+# - None.
+#
+# Postconditions:
+# - The scratch working folder exists. The caller is responsible for removing it.
+#
+# To-Do:
+# - None.
+#
+#-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def prepare_working_folder ( backend, fake_latency ):
+
+    working_folder = tempfile.mkdtemp ( prefix = 'load_generator_' )
+
+    shutil.copytree ( os.path.join ( LOAD_APPLICATION_FOLDER, LOAD_DATA_FOLDER ), os.path.join ( working_folder, LOAD_DATA_FOLDER ) )
+
+    configuration_file_name = os.path.join ( working_folder, LOAD_CONFIGURATION_FILE )
+
+    with open ( configuration_file_name, 'r', encoding = 'utf-8' ) as file:
+        settings = json.load ( file )
+
+    if backend is not None:
+        settings [ 'backend' ] = backend
+
+    if fake_latency is not None:
+        settings [ 'fake_backend_latency' ] = fake_latency
+
+    with open ( configuration_file_name, 'w', encoding = 'utf-8' ) as file:
+        json.dump ( settings, file, indent = 4 )
+
+    return working_folder
+
+class LoadTarget:
+
+    #---------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Constructor.
+    #---------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def __init__ ( self, mode, worker_count, working_folder, turn_results ):
+
+        # Initialise load target.
+
+        self.mode           = mode
+        self.worker_count   = worker_count
+        self.working_folder = working_folder
+        self.turn_results   = turn_results          # Shared `TurnResults`, where completed turns are recorded.
+        self.process        = None
+        self.write_queue    = queue.Queue ()        # Lines waiting to be written to the application's stdin.
+        self.sent_turns     = queue.Queue ()        # Interactive mode: Turn indices in the order they were sent, to match with responses.
+        self.write_thread   = threading.Thread ( target = self.write_loop, daemon = True )
+        self.read_thread    = threading.Thread ( target = self.read_loop,  daemon = True )
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Start the application under test.
+    #
+    # Function name:
+    # - start
+    #
+    # Description:
+    # - This function starts the application in the target's mode, with pipes for stdin and stdout, and starts the threads that write turns to it and read
+    #   responses from it.
+    # - Writes are made from their own thread, so that the scheduler is never blocked by an application that is slow to read its input.
+    #
+    # Parameters:
+    # - None
+    #
+    # Return Values:
+    # - None.
+    #
+    # Preconditions:
+    # - The load target class must be initialized.
+    #
+    # Postconditions:
+    # - The application is running.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def start ( self ):
+
+        command = [ sys.executable, LOAD_APPLICATION_SCRIPT ]
+
+        # Pipeline output is flushed after every record, so that responses are not held back while more input is waiting.
+
+        if self.mode != LOAD_MODE_INTERACTIVE:
+            command += [ '--pipeline', '--input-format', 'json', '--flush' ]
+
+        if self.mode == LOAD_MODE_WORKERS:
+            command += [ '--workers', str ( self.worker_count ) ]
+
+        self.process = subprocess.Popen (
+            command,
+            cwd      = self.working_folder,
+            stdin    = subprocess.PIPE,
+            stdout   = subprocess.PIPE,
+            stderr   = subprocess.DEVNULL,
+            encoding = 'utf-8',
+            env      = { **os.environ, 'PYTHONUNBUFFERED': '1' }
+        )
+
+        self.write_thread.start ()
+        self.read_thread.start ()
+
+        self.turn_results.process_count += 1
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Send a turn to the application under test.
+    #
+    # Function name:
+    # - send_turn
+    #
+    # Description:
+    # - This function queues a user prompt to be written to the application's stdin, in the input format of the target's mode.
+    #
+    # Parameters:
+    # - turn_index : int : The index of the turn, used to match the response to the turn.
+    # - session_id : str : The session id of the turn's conversation.
+    # - prompt     : str : The user prompt.
+    #
+    # Return Values:
+    # - None.
+    #
+    # Preconditions:
+    # - The application is running.
+    #
+    # Postconditions:
+    # - The turn is queued to be written.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def send_turn ( self, turn_index, session_id, prompt ):
+
+        if self.mode == LOAD_MODE_INTERACTIVE:
+            self.sent_turns.put ( turn_index )
+            self.write_queue.put ( prompt + '\n' )
+        else:
+            self.write_queue.put ( json.dumps ( { 'id': turn_index, 'session': session_id, 'content': prompt } ) + '\n' )
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Close the application's input.
+    #
+    # Function name:
+    # - close
+    #
+    # Description:
+    # - This function queues the end of the application's stdin, after any turns that are still waiting to be written. This ends the session in every mode,
+    #   and the application exits once it has responded to the turns it was sent.
+    #
+    # Parameters:
+    # - None
+    #
+    # Return Values:
+    # - None.
+    #
+    # Preconditions:
+    # - The application is running.
+    #
+    # Postconditions:
+    # - No more turns may be sent.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def close ( self ):
+
+        self.write_queue.put ( None )
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Wait for the application under test to exit.
+    #
+    # Function name:
+    # - wait
+    #
+    # Description:
+    # - This function waits for the application to exit after its input was closed, and kills it if it does not exit in time.
+    #
+    # Parameters:
+    # - timeout : float : Maximum time in seconds to wait for the application to exit, before it is killed.
+    #
+    # Return Values:
+    # - None.
+    #
+    # Preconditions:
+    # - The application's input has been closed.
+    #
+    # Postconditions:
+    # - The application has exited.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def wait ( self, timeout ):
+
+        self.write_thread.join ()
+
+        try:
+            self.process.wait ( timeout = timeout )
+
+        except subprocess.TimeoutExpired:
+            self.process.kill ()
+            self.process.wait ()
+
+        self.read_thread.join ()
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Write queued lines to the application's stdin.
+    #
+    # Function name:
+    # - write_loop
+    #
+    # Description:
+    # - This function is the target of the write thread. It writes each queued line to the application's stdin, and closes stdin when it dequeues `None`.
+    #
+    # Parameters:
+    # - None
+    #
+    # Return Values:
+    # - None.
+    #
+    # Preconditions:
+    # - The application is running.
+    #
+    # Postconditions:
+    # - The application's stdin is closed.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def write_loop ( self ):
+
+        try:
+
+            line = self.write_queue.get ()
+
+            while line is not None:
+                self.process.stdin.write ( line )
+                self.process.stdin.flush ()
+                line = self.write_queue.get ()
+
+            self.process.stdin.close ()
+
+        except OSError:
+
+            # The application exited early. Its unfinished turns are reported as incomplete.
+
+            pass
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Read responses from the application's stdout.
+    #
+    # Function name:
+    # - read_loop
+    #
+    # Description:
+    # - This function is the target of the read thread. It reads the application's output until it exits, and records each completed turn.
+    #
+    #   - interactive : A turn is complete when the application prints the next user prompt. Turns complete in the order they were sent, and a turn is
+    #                   recorded as an error if an error message was printed in its response.
+    #   - pipeline    : A turn is complete when its turn record, or error record, is written. Records are matched to turns by id.
+    #
+    # Parameters:
+    # - None
+    #
+    # Return Values:
+    # - None.
+    #
+    # Preconditions:
+    # - The application is running.
+    #
+    # Postconditions:
+    # - The application's stdout is closed.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def read_loop ( self ):
+
+        ready       = False     # Interactive mode: True once the application has printed its first user prompt.
+        error_found = False     # Interactive mode: True if an error message was printed in the current response.
+
+        for line in self.process.stdout:
+
+            line = line.rstrip ( '\n' )
+
+            if self.mode == LOAD_MODE_INTERACTIVE:
+
+                if line == LOAD_INTERACTIVE_PROMPT:
+
+                    if ready:
+                        self.turn_results.complete ( self.sent_turns.get (), error_found )
+
+                    ready       = True
+                    error_found = False
+
+                elif LOAD_INTERACTIVE_ERROR in line:
+                    error_found = True
+
+            else:
+
+                try:
+                    record = json.loads ( line )
+
+                except ValueError:
+                    continue
+
+                if 'delta' not in record and isinstance ( record.get ( 'id' ), int ):
+                    self.turn_results.complete ( record [ 'id' ], 'error' in record )
+
+class TurnResults:
+
+    #---------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Constructor.
+    #---------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def __init__ ( self, turn_count ):
+
+        # Initialise turn results.
+
+        self.scheduled_times = [ None ] * turn_count   # Time each turn was scheduled to be sent.
+        self.sent_times      = [ None ] * turn_count   # Time each turn was actually sent.
+        self.complete_times  = [ None ] * turn_count   # Time each turn's response was complete.
+        self.errors          = [ False ] * turn_count
+        self.pending_count   = 0
+        self.process_count   = 0                        # Number of application processes started.
+        self.condition       = threading.Condition ()
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Record that a turn was sent.
+    #
+    # Function name:
+    # - send
+    #
+    # Description:
+    # - This function records the scheduled and actual send times of a turn.
+    #
+    # Parameters:
+    # - turn_index     : int   : The index of the turn.
+    # - scheduled_time : float : The time the turn was scheduled to be sent.
+    #
+    # Return Values:
+    # - None.
+    #
+    # Preconditions:
+    # - None.
+    #
+    # Postconditions:
+    # - The turn is pending.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def send ( self, turn_index, scheduled_time ):
+
+        with self.condition:
+            self.scheduled_times [ turn_index ] = scheduled_time
+            self.sent_times      [ turn_index ] = time.perf_counter ()
+            self.pending_count  += 1
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Record that a turn was completed.
+    #
+    # Function name:
+    # - complete
+    #
+    # Description:
+    # - This function records the completion time of a turn, and wakes any thread waiting for the pending turns to complete.
+    #
+    # Parameters:
+    # - turn_index  : int  : The index of the turn.
+    # - error_found : bool : True if the turn completed with an error, otherwise False.
+    #
+    # Return Values:
+    # - None.
+    #
+    # Preconditions:
+    # - The turn was sent.
+    #
+    # Postconditions:
+    # - The turn is complete.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def complete ( self, turn_index, error_found ):
+
+        with self.condition:
+
+            if self.complete_times [ turn_index ] is None:
+                self.complete_times [ turn_index ] = time.perf_counter ()
+                self.errors         [ turn_index ] = error_found
+                self.pending_count -= 1
+                self.condition.notify_all ()
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Wait for the pending turns to complete.
+    #
+    # Function name:
+    # - wait
+    #
+    # Description:
+    # - This function blocks until every sent turn has completed, or the timeout expires.
+    #
+    # Parameters:
+    # - timeout : float : Maximum time in seconds to wait.
+    #
+    # Return Values:
+    # - None.
+    #
+    # Preconditions:
+    # - None.
+    #
+    # Postconditions:
+    # - None.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def wait ( self, timeout ):
+
+        with self.condition:
+            self.condition.wait_for ( lambda: self.pending_count == 0, timeout = timeout )
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Compile the load test report.
+    #
+    # Function name:
+    # - compile_report
+    #
+    # Description:
+    # - This function summarizes the turn results as counts, throughput, and latency percentiles.
+    # - Latency is measured from each turn's scheduled send time. Send lag is how late each turn was actually sent, and should be close to zero; if it is not,
+    #   the load generator itself could not keep up with the requested rate.
+    # - The number of application processes started is included, since in interactive and pipeline modes every conversation starts a process, and process
+    #   start-up competes for CPU with the turns being measured.
+    #
+    # Parameters:
+    # - None
+    #
+    # Return Values:
+    # - report : dict : The report.
+    #
+    # Preconditions:
+    # - None.
+    #
+    # Postconditions:
+    # - None.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def compile_report ( self ):
+
+        with self.condition:
+
+            sent_indices     = [ turn_index for turn_index, sent_time in enumerate ( self.sent_times ) if sent_time is not None ]
+            complete_indices = [ turn_index for turn_index in sent_indices if self.complete_times [ turn_index ] is not None ]
+            latencies        = sorted ( self.complete_times [ turn_index ] - self.scheduled_times [ turn_index ] for turn_index in complete_indices )
+            send_lags        = sorted ( self.sent_times [ turn_index ] - self.scheduled_times [ turn_index ] for turn_index in sent_indices )
+            error_count      = sum ( 1 for turn_index in complete_indices if self.errors [ turn_index ] )
+
+        report = {
+            'sent'       : len ( sent_indices ),
+            'completed'  : len ( complete_indices ),
+            'errors'     : error_count,
+            'incomplete' : len ( sent_indices ) - len ( complete_indices ),
+            'processes'  : self.process_count,
+        }
+
+        if len ( complete_indices ) > 0:
+
+            start_time = min ( self.scheduled_times [ turn_index ] for turn_index in sent_indices )
+            end_time   = max ( self.complete_times  [ turn_index ] for turn_index in complete_indices )
+
+            report [ 'duration'       ] = end_time - start_time
+            report [ 'throughput'     ] = len ( complete_indices ) / report [ 'duration' ]
+            report [ 'latency_mean'   ] = sum ( latencies ) / len ( latencies )
+            report [ 'latency_p50'    ] = get_percentile ( latencies, 50 )
+            report [ 'latency_p90'    ] = get_percentile ( latencies, 90 )
+            report [ 'latency_p99'    ] = get_percentile ( latencies, 99 )
+            report [ 'latency_max'    ] = latencies [ -1 ]
+            report [ 'send_lag_p99'   ] = get_percentile ( send_lags, 99 )
+
+        return report
+
+#-------------------------------------------------------------------------------------------------------------------------------------------------------------
+# Get a percentile of a sorted list of values.
+#
+# Function name:
+# - get_percentile
+#
+# Description:
+# - This function returns the nearest-rank percentile of a sorted list of values.
+#
+# Parameters:
+# - values     : list  : The values, sorted in ascending order.
+# - percentile : float : The percentile, from 0 to 100.
+#
+# Return Values:
+# - value : float : The percentile value.
+#
+# Preconditions:
+# - The list is not empty.
+#
+# Postconditions:
+# - None.
+#
+# To-Do:
+# - None.
+#
+#-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def get_percentile ( values, percentile ):
+
+    rank = max ( 1, -( -len ( values ) * percentile // 100 ) )
+
+    return values [ int ( rank ) - 1 ]
+
+#-------------------------------------------------------------------------------------------------------------------------------------------------------------
+# Replay the scheduled turns against the application.
+#
+# Function name:
+# - run_load
+#
+# Description:
+# - This function starts the load targets, sends each turn at its scheduled time, waits for the outstanding turns to complete, and stops the targets.
+# - In interactive and pipeline modes each process holds one conversation history, so each conversation is sent to its own target. When a new conversation
+#   takes over a slot, the slot's target is closed, and its spare target, which was started in advance, takes its place. In workers mode a single target
+#   serves every slot, with one session per conversation.
+#
+# Parameters:
+# - turns          : list      : The turns, as returned by `schedule_turns`.
+# - arguments      : Namespace : The command line arguments.
+# - working_folder : str       : The scratch working folder.
+#
+# Return Values:
+# - turn_results : TurnResults : The results of the turns.
+#
+# Preconditions:
+# - None.
+#
+# Postconditions:
+# - The application under test has exited.
+#
+# To-Do:
+# - None.
+#
+#-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def run_load ( turns, arguments, working_folder ):
+
+    turn_results       = TurnResults ( len ( turns ) )
+    conversation_start = arguments.mode != LOAD_MODE_WORKERS    # True to start each conversation on a fresh target.
+    target_count       = arguments.concurrency if conversation_start else 1
+    create_target      = lambda: LoadTarget ( arguments.mode, arguments.workers, working_folder, turn_results )
+
+    targets         = [ create_target () for _ in range ( target_count ) ]
+    spare_targets   = [ create_target () for _ in range ( target_count ) ] if conversation_start else []
+    closed_targets  = []
+    target_sessions = [ None ] * target_count       # The session id of the conversation on each target.
+
+    for target in targets + spare_targets:
+        target.start ()
+
+    # Send each turn at its scheduled time, regardless of whether earlier turns have completed.
+
+    random_generator = random.Random ( arguments.seed )
+    scheduled_time   = time.perf_counter () + arguments.warmup
+
+    for turn_index, ( slot, session_id, prompt ) in enumerate ( turns ):
+
+        delay = scheduled_time - time.perf_counter ()
+
+        if delay > 0.0:
+            time.sleep ( delay )
+
+        target_index = slot % target_count
+
+        # Move a new conversation onto the slot's spare target, and replace the spare.
+        # - The old target is closed, rather than stopped, so that it can finish its outstanding turns while the load continues.
+
+        if conversation_start and target_sessions [ target_index ] not in ( None, session_id ):
+
+            targets [ target_index ].close ()
+            closed_targets.append ( targets [ target_index ] )
+
+            targets       [ target_index ] = spare_targets [ target_index ]
+            spare_targets [ target_index ] = create_target ()
+            spare_targets [ target_index ].start ()
+
+        target_sessions [ target_index ] = session_id
+
+        turn_results.send ( turn_index, scheduled_time )
+        targets [ target_index ].send_turn ( turn_index, session_id, prompt )
+
+        if arguments.arrival == LOAD_ARRIVAL_POISSON:
+            scheduled_time += random_generator.expovariate ( arguments.rate )
+        else:
+            scheduled_time += 1.0 / arguments.rate
+
+    # Wait for the outstanding turns, and shut down.
+
+    turn_results.wait ( arguments.timeout )
+
+    for target in targets + spare_targets:
+        target.close ()
+
+    for target in closed_targets + targets + spare_targets:
+        target.wait ( arguments.timeout )
+
+    return turn_results
+
+#-------------------------------------------------------------------------------------------------------------------------------------------------------------
+# Print the load test report.
+#
+# Function name:
+# - print_report
+#
+# Description:
+# - This function prints the load test report to the console.
+#
+# Parameters:
+# - report    : dict      : The report, as returned by `TurnResults.compile_report`.
+# - arguments : Namespace : The command line arguments.
+#
+# Return Values:
+# - None.
+#
+# Preconditions:
+# - None.
+#
+# Postconditions:
+# - The report is printed to the console.
+#
+# To-Do:
+# - None.
+#
+#-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def print_report ( report, arguments ):
+
+    print ( f'\nLoad:' )
+    print ( f'- Mode:          {arguments.mode}' + ( f' ({arguments.workers} workers)' if arguments.mode == LOAD_MODE_WORKERS else '' ) )
+    print ( f'- Offered Rate:  {arguments.rate:.2f} turns/s ({arguments.arrival})' )
+    print ( f'- Concurrency:   {arguments.concurrency} conversations' )
+    print ( f'- Processes:     {report [ "processes" ]} started' )
+
+    print ( f'\nTurns:' )
+    print ( f'- Sent:          {report [ "sent" ]}' )
+    print ( f'- Completed:     {report [ "completed" ]}' )
+    print ( f'- Errors:        {report [ "errors" ]}' )
+    print ( f'- Incomplete:    {report [ "incomplete" ]}' )
+
+    if report [ 'completed' ] == 0:
+        return
+
+    print ( f'\nThroughput:' )
+    print ( f'- Duration:      {report [ "duration" ]:.2f} s' )
+    print ( f'- Throughput:    {report [ "throughput" ]:.2f} turns/s' )
+
+    print ( f'\nLatency:' )
+    print ( f'- Mean:          {report [ "latency_mean" ] * 1000:.1f} ms' )
+    print ( f'- p50:           {report [ "latency_p50"  ] * 1000:.1f} ms' )
+    print ( f'- p90:           {report [ "latency_p90"  ] * 1000:.1f} ms' )
+    print ( f'- p99:           {report [ "latency_p99"  ] * 1000:.1f} ms' )
+    print ( f'- Max:           {report [ "latency_max"  ] * 1000:.1f} ms' )
+    print ( f'- Send Lag p99:  {report [ "send_lag_p99" ] * 1000:.1f} ms' )
+
+#-------------------------------------------------------------------------------------------------------------------------------------------------------------
+# Run the load generator.
+#
+# Function name:
+# - main
+#
+# Description:
+# - This function parses the command line, loads and schedules the conversations, replays them against the application, and reports the results.
+# - In interactive mode, multi-line prompts are joined into one line, and prompts that the application would execute as prompt commands are skipped.
+#
+# Parameters:
+# - None
+#
+# Return Values:
+# - None.
+#
+# Preconditions:
+# - None.
+#
+# Postconditions:
+# - The report is printed to the console.
+#
+# To-Do:
+# - None.
+#
+#-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def main ():
+
+    parser = argparse.ArgumentParser ( description = 'Replay recorded conversations against the application, and report latency and throughput.' )
+    parser.add_argument ( '--mode',         choices = LOAD_MODES, default = LOAD_MODE_PIPELINE, help = 'Application mode to load test.' )
+    parser.add_argument ( '--workers',      type = int, default = LOAD_WORKER_COUNT_DEFAULT, help = 'Workers mode: number of worker processes.' )
+    parser.add_argument ( '--rate',         type = float, default = LOAD_RATE_DEFAULT, help = 'Offered load, in turns per second.' )
+    parser.add_argument ( '--arrival',      choices = LOAD_ARRIVALS, default = LOAD_ARRIVAL_POISSON, help = 'Distribution of the intervals between turns.' )
+    parser.add_argument ( '--concurrency',  type = int, default = LOAD_CONCURRENCY_DEFAULT, help = 'Number of conversations replayed at once.' )
+    parser.add_argument ( '--turns',        type = int, help = 'Number of turns to send. Defaults to every user turn in the chat logs, once.' )
+    parser.add_argument ( '--chat-log',     default = 'chat_log', help = 'Folder of chat logs to replay.' )
+    parser.add_argument ( '--backend',      choices = [ 'openai', 'fake' ], help = 'Override the backend in the configuration file.' )
+    parser.add_argument ( '--fake-latency', type = float, help = 'Override the fake backend latency in the configuration file, in seconds.' )
+    parser.add_argument ( '--warmup',       type = float, default = 2.0, help = 'Time in seconds to let the application start, before the first turn.' )
+    parser.add_argument ( '--timeout',      type = float, default = LOAD_DRAIN_TIMEOUT, help = 'Time in seconds to wait for outstanding turns after the last turn is sent.' )
+    parser.add_argument ( '--seed',         type = int, default = 0, help = 'Random seed for Poisson arrivals.' )
+    parser.add_argument ( '--json',         action = 'store_true', help = 'Print the report as JSON.' )
+    arguments = parser.parse_args ()
+
+    if arguments.rate <= 0.0:
+        parser.error ( '--rate must be greater than 0.' )
+
+    if arguments.concurrency <= 0:
+        parser.error ( '--concurrency must be greater than 0.' )
+
+    if arguments.mode == LOAD_MODE_WORKERS and arguments.workers <= 0:
+        parser.error ( '--workers must be greater than 0.' )
+
+    # Load the conversations.
+
+    conversations = load_conversations ( arguments.chat_log )
+
+    if arguments.mode == LOAD_MODE_INTERACTIVE:
+        conversations = [ [ ' '.join ( prompt.split () ) for prompt in conversation ] for conversation in conversations ]
+        conversations = [ [ prompt for prompt in conversation if prompt != '' and prompt.lower ().split ( ' ', 1 ) [ 0 ] not in LOAD_INTERACTIVE_COMMANDS ] for conversation in conversations ]
+        conversations = [ conversation for conversation in conversations if len ( conversation ) > 0 ]
+
+    if len ( conversations ) == 0:
+        print ( f'No conversations found in {arguments.chat_log}.', file = sys.stderr )
+        sys.exit ( 1 )
+
+    turn_count = arguments.turns if arguments.turns is not None else sum ( len ( conversation ) for conversation in conversations )
+    turns      = schedule_turns ( conversations, arguments.concurrency, turn_count )
+
+    # Replay the conversations, and report the results.
+
+    working_folder = prepare_working_folder ( arguments.backend, arguments.fake_latency )
+
+    try:
+        turn_results = run_load ( turns, arguments, working_folder )
+
+    finally:
+        shutil.rmtree ( working_folder, ignore_errors = True )
+
+    report = turn_results.compile_report ()
+
+    if arguments.json:
+        print ( json.dumps ( report, indent = 4 ) )
+    else:
+        print_report ( report, arguments )
+
+if __name__ == "__main__":
+    main ()
@@ -1,8 +1,38 @@
-from application import Application
+import sys
+import argparse
+from application    import Application
+from pipeline       import Pipeline
+from chat_log_index import ChatLogIndex
+
+def parse_arguments ():
+    parser = argparse.ArgumentParser ( description = 'Conversation Agent Reference Application' )
+    parser.add_argument ( '--pipeline',     action = 'store_true', help = 'Run headless, reading turns from stdin and writing JSON responses to stdout.' )
+    parser.add_argument ( '--input-format', choices = Pipeline.PIPELINE_INPUT_FORMATS, default = Pipeline.PIPELINE_INPUT_FORMAT_TEXT, help = 'Pipeline input format.' )
+    parser.add_argument ( '--stream',       action = 'store_true', help = 'Pipeline mode: write streamed response chunks as NDJSON delta records.' )
+    parser.add_argument ( '--flush',        action = 'store_true', help = 'Pipeline mode: flush stdout after every record.' )
+    parser.add_argument ( '--workers',      type = int, default = 0, help = 'Pipeline mode: serve sessions on this many worker processes. Streamed chunks are not written.' )
+    parser.add_argument ( '--search',       metavar = 'QUERY', help = 'Search the chat log archive, print the matching messages, and exit.' )
+    parser.add_argument ( '--limit',        type = int, default = ChatLogIndex.INDEX_SEARCH_RESULT_DEFAULT, help = 'Search mode: maximum number of results.' )
+    return parser.parse_args ()
+
+def search ( query, result_limit ):
+    chat_log_index = ChatLogIndex ()
+    chat_log_index.update ()
+
+    for result in chat_log_index.search ( query, result_limit ):
+        print ( f'\n[{result [ "file_name" ]}] [{result [ "role" ]}]\n{result [ "content" ]}' )
 
 def main ():
-    app = Application ()
-    app.run ()
+    arguments = parse_arguments ()
+
+    if arguments.search is not None:
+        search ( arguments.search, arguments.limit )
+    elif arguments.pipeline:
+        pipeline = Pipeline ( input_format = arguments.input_format, streaming_enabled = arguments.stream, flush_enabled = arguments.flush, worker_count = arguments.workers )
+        sys.exit ( pipeline.run () )
+    else:
+        app = Application ()
+        app.run ()
 
 if __name__ == "__main__":
     main ()
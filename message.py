@@ -0,0 +1,183 @@
+#---------------------------------------------------------------------------------------------------------------------------------------------------------
+# Application   Conversation Agent Reference Application
+# Version:      2.0
+# Release Date: 2024-04-06
+# Author:       Rohin Gosling
+#
+# Description:
+#
+# - Compact conversation history message.
+#
+# - Messages are stored using `__slots__`, so that each message carries no per-instance `__dict__`.
+#
+# - Message roles are stored as small integer role codes, that index into a shared role table, rather than as a role string per message.
+#
+# - The JSON-encoded API form of a message, `{"role": ..., "content": ...}`, is only created when a request is made, and is not cached on the message. The
+#   request encoder keeps a single encoded copy of the conversation history, so caching it here as well would hold each message three times over. See
+#   `RequestEncoder`.
+#
+#---------------------------------------------------------------------------------------------------------------------------------------------------------
+
+import sys
+import json
+
+class Message:
+
+    # Constants: Message Role Table.
+    # - Role codes are indexes into this table. Roles not in the table are appended to it the first time they are used.
+
+    MESSAGE_ROLES      = [ 'system', 'user', 'assistant' ]
+    MESSAGE_ROLE_CODES = { role : role_code for role_code, role in enumerate ( MESSAGE_ROLES ) }
+
+    __slots__ = ( 'role_code', 'content' )
+
+    #---------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Constructor.
+    #---------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def __init__ ( self, content, role ):
+
+        # Initialise message.
+
+        self.role_code = self.get_role_code ( role )
+        self.content   = content
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Get the role code for a message role.
+    #
+    # Function name:
+    # - get_role_code
+    #
+    # Description:
+    # - This function returns the role code for a role string, adding the role to the role table if it has not been seen before.
+    #
+    # Parameters:
+    # - role : str : The role of the message sender (e.g., user, assistant, system).
+    #
+    # Return Values:
+    # - role_code : int : The index of the role in the role table.
+    #
+    # Preconditions:
+    # - None.
+    #
+    # Postconditions:
+    # - The role is present in the role table.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    @classmethod
+    def get_role_code ( cls, role ):
+
+        role_code = cls.MESSAGE_ROLE_CODES.get ( role )
+
+        if role_code is None:
+            role_code                       = len ( cls.MESSAGE_ROLES )
+            cls.MESSAGE_ROLE_CODES [ role ] = role_code
+            cls.MESSAGE_ROLES.append ( sys.intern ( role ) )
+
+        return role_code
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # The role of the message sender.
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    @property
+    def role ( self ):
+
+        return self.MESSAGE_ROLES [ self.role_code ]
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Convert the message to the API's dictionary form.
+    #
+    # Function name:
+    # - to_dict
+    #
+    # Description:
+    # - This function returns the message in the form expected by the chat completions API, i.e. `{'role': ..., 'content': ...}`.
+    # - The dictionary is not cached. Use `to_json` when building request bodies.
+    #
+    # Parameters:
+    # - None
+    #
+    # Return Values:
+    # - api_form : dict : The message in the API's dictionary form.
+    #
+    # Preconditions:
+    # - None.
+    #
+    # Postconditions:
+    # - None.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def to_dict ( self ):
+
+        return { 'role': self.role, 'content': self.content }
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Convert the message to the API's JSON-encoded form.
+    #
+    # Function name:
+    # - to_json
+    #
+    # Description:
+    # - This function returns the message's API dictionary form, encoded as compact UTF-8 JSON.
+    # - The encoded form is not cached. The request encoder calls this once per message, when the message is first appended to its encoded messages array.
+    #
+    # Parameters:
+    # - None
+    #
+    # Return Values:
+    # - encoded_form : bytes : The message in the API's JSON-encoded form.
+    #
+    # Preconditions:
+    # - None.
+    #
+    # Postconditions:
+    # - None.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def to_json ( self ):
+
+        return json.dumps ( self.to_dict (), ensure_ascii = False, separators = ( ',', ':' ) ).encode ( 'utf-8' )
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Get the memory used by the message.
+    #
+    # Function name:
+    # - get_memory_size
+    #
+    # Description:
+    # - This function returns the number of bytes used by the message and its content.
+    # - Role strings are shared by all messages through the role table, and are not counted.
+    #
+    # Parameters:
+    # - None
+    #
+    # Return Values:
+    # - memory_size : int : The memory used by the message, in bytes.
+    #
+    # Preconditions:
+    # - None.
+    #
+    # Postconditions:
+    # - None.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def get_memory_size ( self ):
+
+        return sys.getsizeof ( self ) + sys.getsizeof ( self.content )
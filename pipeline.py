@@ -0,0 +1,704 @@
+#---------------------------------------------------------------------------------------------------------------------------------------------------------
+# Application   Conversation Agent Reference Application
+# Version:      2.0
+# Release Date: 2024-04-06
+# Author:       Rohin Gosling
+#
+# Description:
+#
+# - Headless stdin/stdout pipeline mode, for driving the conversation agent from shell pipelines and scripts.
+#
+# - Turns are read from stdin, one per line, in one of two input formats:
+#
+#   - text : Each non-empty line is a user prompt.
+#   - json : Each non-empty line is a JSON object of the form `{"content": "<user prompt>"}`. An optional `"id"` field is echoed back in the response, and an
+#            optional `"session"` field selects the conversation the turn belongs to. Each session has its own conversation history and chat log, and
+#            records carry the session of their turn.
+#
+# - Responses are written to stdout as newline-delimited JSON (NDJSON), with no banners, terminal prompts, or other decoration.
+#
+#   - Non-streaming: One record per turn, e.g. `{"turn": 0, "role": "assistant", "content": "..."}`.
+#   - Streaming:     One record per response chunk, e.g. `{"turn": 0, "delta": "..."}`, followed by the complete turn record with `"done": true`.
+#   - Errors:        `{"turn": 0, "error": "..."}`. A failed turn is not added to the conversation history.
+#
+# - System and error messages are written to stderr.
+#
+# - Output is only flushed once a turn is complete and no further input is waiting, so that high volume pipelines are block buffered. Use the flush option to
+#   flush after every record instead.
+#
+# - With a worker pool, turns are served by a pool of worker processes, with one conversation per session. Turns for different sessions are served
+#   concurrently, and their records are written as they complete, so records carry the `"session"` field of the turn. Streamed chunks are not
+#   forwarded from the workers, so only complete turn records are written, and output is flushed after each one.
+#
+# - Usage:
+#
+#   cat prompts.txt | python main.py --pipeline
+#   cat turns.jsonl | python main.py --pipeline --input-format json --stream
+#   cat turns.jsonl | python main.py --pipeline --input-format json --workers 4
+#
+#---------------------------------------------------------------------------------------------------------------------------------------------------------
+
+import sys
+import json
+import threading
+from language_model import LanguageModel
+from configuration  import Configuration
+from chat_log_index import ChatLogIndex
+from input_reader   import InputReader
+from worker_pool    import WorkerPool
+
+class Pipeline:
+
+    # Constants: Pipeline Input Formats.
+
+    PIPELINE_INPUT_FORMAT_TEXT = 'text'     # Each line is a user prompt.
+    PIPELINE_INPUT_FORMAT_JSON = 'json'     # Each line is a JSON object with a `content` field.
+    PIPELINE_INPUT_FORMATS     = [ PIPELINE_INPUT_FORMAT_TEXT, PIPELINE_INPUT_FORMAT_JSON ]
+
+    # Constants: Pipeline JSON Fields.
+
+    PIPELINE_FIELD_TURN    = 'turn'
+    PIPELINE_FIELD_ID      = 'id'
+    PIPELINE_FIELD_ROLE    = 'role'
+    PIPELINE_FIELD_CONTENT = 'content'
+    PIPELINE_FIELD_DELTA   = 'delta'
+    PIPELINE_FIELD_DONE    = 'done'
+    PIPELINE_FIELD_ERROR   = 'error'
+    PIPELINE_FIELD_SESSION = 'session'
+
+    # Constants: Pipeline Worker Pool.
+
+    PIPELINE_SESSION_DEFAULT      = 'default'   # Session of turns that do not specify one.
+    PIPELINE_RESULT_POLL_INTERVAL = 0.1         # Time in seconds between checks for the end of the input, while waiting for results.
+
+    # Constants: Pipeline Exit Status.
+
+    PIPELINE_EXIT_SUCCESS = 0
+    PIPELINE_EXIT_FAILURE = 1                   # Every worker in the worker pool exited, and turns were not served.
+
+    #---------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Constructor.
+    #---------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def __init__ ( self, input_format = PIPELINE_INPUT_FORMAT_TEXT, streaming_enabled = False, flush_enabled = False, input_stream = None, output_stream = None, worker_count = 0 ):
+
+        # Initialise pipeline.
+
+        self.input_format  = input_format
+        self.flush_enabled = flush_enabled
+        self.output_stream = output_stream if output_stream is not None else sys.stdout
+        self.turn_index    = 0
+        self.lock          = threading.Lock ()      # Serializes output, when results are written by the worker pool result thread.
+
+        # Initialise worker pool.
+
+        self.worker_pool       = WorkerPool ( worker_count ) if worker_count > 0 else None
+        self.worker_pool_turns = {}                 # Request id to ( turn index, turn id, session id ), for turns submitted to the worker pool.
+        self.worker_pool_error = None               # The error that stopped the worker pool, once every worker has exited.
+        self.input_ended       = threading.Event ()
+
+        # Initialise model.
+        # - System and error messages from the model are redirected to stderr, so that stdout only ever contains response records.
+
+        self.streaming_enabled            = streaming_enabled
+        self.model                        = LanguageModel ()
+        self.model.terminal_output_stream = sys.stderr
+        self.model.override_configuration ( Configuration.CONFIGURATION_STREAMING_ENABLED, streaming_enabled )
+
+        # Initialise sessions.
+        # - Without a worker pool, each session is served by its own language model in this process. The default session uses the pipeline's model.
+
+        self.sessions = { self.PIPELINE_SESSION_DEFAULT : self.model }     # Session id to the session's language model.
+
+        # Initialise input reader.
+
+        self.input_reader = InputReader ( input_stream )
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Run the pipeline until the end of the input stream.
+    #
+    # Function name:
+    # - run
+    #
+    # Description:
+    # - This is the main public function that consumers of the class call to execute the pipeline.
+    # - Each input line is parsed into a user prompt, the language model of the turn's session is queried, and the response is written to the output stream.
+    # - When the input stream is exhausted, the conversation history of each session is saved to a chat log, and the chat log index is updated.
+    #
+    # Parameters:
+    # - None
+    #
+    # Return Values:
+    # - exit_status : int : `PIPELINE_EXIT_SUCCESS`, or `PIPELINE_EXIT_FAILURE` if the worker pool failed.
+    #
+    # Preconditions:
+    # - The pipeline class must be initialized.
+    #
+    # Postconditions:
+    # - All input turns have been processed, and the chat log has been saved.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def run ( self ):
+
+        if self.worker_pool is not None:
+            return self.run_worker_pool ()
+
+        self.input_reader.start ()
+
+        line = self.input_reader.get_line ()
+
+        while line is not None:
+
+            # Parse the turn, and skip blank lines.
+
+            if line.strip () != '':
+
+                user_prompt, turn_id, session_id = self.parse_turn ( line )
+
+                if user_prompt is None:
+                    self.write_record ( self.compile_error_record ( turn_id, f'Invalid turn: {line}' ) )
+                else:
+                    model = self.get_session_model ( session_id )
+
+                    # Records only carry the session with JSON input, since text input has no sessions.
+
+                    if self.input_format == self.PIPELINE_INPUT_FORMAT_TEXT:
+                        session_id = None
+
+                    model.add_message_to_conversation_history ( user_prompt, model.MODEL_MESSAGE_ROLE_USER )
+                    model_response_text = self.write_language_model_response ( model, turn_id, session_id )
+
+                    # A failed turn is only reported in its error record. It is removed from the conversation history, so that it is not sent to the
+                    # model again on later turns.
+
+                    if model_response_text is None:
+                        model.conversation_history.pop ()
+                    else:
+                        model.add_message_to_conversation_history ( model_response_text, model.MODEL_MESSAGE_ROLE_AI )
+
+                self.turn_index += 1
+
+                # Flush once the turn is complete, if there is no more input waiting to be processed.
+
+                if self.input_reader.get_pending_line_count () == 0:
+                    self.output_stream.flush ()
+
+            line = self.input_reader.get_line ()
+
+        # Shut down pipeline.
+
+        self.output_stream.flush ()
+
+        for model in self.sessions.values ():
+            model.save_chat_log_to_file ( include_system_prompt_enabled = False )
+
+        self.update_chat_log_index ()
+
+        return self.PIPELINE_EXIT_SUCCESS
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Run the pipeline on the worker pool until the end of the input stream.
+    #
+    # Function name:
+    # - run_worker_pool
+    #
+    # Description:
+    # - This function submits each input turn to the worker pool, while a result thread writes the turn records as the workers complete them.
+    # - When the input stream is exhausted and every turn has been written, the workers are stopped, which saves a chat log per session, and the chat log
+    #   index is updated.
+    # - If every worker exits, an error record is written for each outstanding turn, and for each turn read after that, and the pipeline fails.
+    #
+    # Parameters:
+    # - None
+    #
+    # Return Values:
+    # - exit_status : int : `PIPELINE_EXIT_SUCCESS`, or `PIPELINE_EXIT_FAILURE` if the worker pool failed.
+    #
+    # Preconditions:
+    # - The pipeline class must be initialized with a worker pool.
+    #
+    # Postconditions:
+    # - All input turns have been processed, and the chat logs have been saved.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def run_worker_pool ( self ):
+
+        self.worker_pool.start ()
+        self.input_reader.start ()
+
+        result_thread = threading.Thread ( target = self.write_worker_pool_results, daemon = True )
+        result_thread.start ()
+
+        line = self.input_reader.get_line ()
+
+        while line is not None:
+
+            # Parse the turn, skip blank lines, and submit the turn to the worker pool.
+
+            if line.strip () != '':
+
+                user_prompt, turn_id, session_id = self.parse_turn ( line )
+
+                with self.lock:
+
+                    if user_prompt is None:
+                        self.write_record ( self.compile_error_record ( turn_id, f'Invalid turn: {line}' ) )
+                        self.output_stream.flush ()
+
+                    elif self.worker_pool_error is not None:
+                        self.write_worker_pool_record ( self.turn_index, turn_id, session_id, None, self.worker_pool_error )
+
+                    else:
+                        try:
+                            request_id = self.worker_pool.submit ( session_id, user_prompt )
+                            self.worker_pool_turns [ request_id ] = ( self.turn_index, turn_id, session_id )
+
+                        except RuntimeError as e:
+                            self.worker_pool_error = str ( e )
+                            self.write_worker_pool_record ( self.turn_index, turn_id, session_id, None, self.worker_pool_error )
+
+                    self.turn_index += 1
+
+            line = self.input_reader.get_line ()
+
+        # Shut down pipeline.
+
+        self.input_ended.set ()
+        result_thread.join ()
+
+        self.output_stream.flush ()
+        self.worker_pool.stop ()
+
+        self.update_chat_log_index ()
+
+        if self.worker_pool_error is not None:
+            print ( f'{self.model.TERMINAL_ERROR} Worker pool failed: {self.worker_pool_error}', file = sys.stderr )
+            return self.PIPELINE_EXIT_FAILURE
+
+        return self.PIPELINE_EXIT_SUCCESS
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Write the worker pool results to the output stream.
+    #
+    # Function name:
+    # - write_worker_pool_results
+    #
+    # Description:
+    # - This function is the target of the result thread. It writes a turn record, or an error record, for each result as it arrives from the worker pool.
+    # - If every worker exits, the outstanding turns can not be completed. An error record is written for each of them, and the thread ends.
+    #
+    # Parameters:
+    # - None
+    #
+    # Return Values:
+    # - None.
+    #
+    # Preconditions:
+    # - The worker pool has been started.
+    #
+    # Postconditions:
+    # - The input stream is exhausted and every submitted turn has been written, or the worker pool has failed.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def write_worker_pool_results ( self ):
+
+        while not ( self.input_ended.is_set () and self.worker_pool.get_pending_request_count () == 0 ):
+
+            try:
+                result = self.worker_pool.get_result ( timeout = self.PIPELINE_RESULT_POLL_INTERVAL )
+
+            except RuntimeError as e:
+
+                # Every worker has exited. Fail the outstanding turns, in the order they were submitted.
+
+                with self.lock:
+
+                    self.worker_pool_error = str ( e )
+
+                    for request_id in sorted ( self.worker_pool_turns ):
+                        turn_index, turn_id, session_id = self.worker_pool_turns [ request_id ]
+                        self.write_worker_pool_record ( turn_index, turn_id, session_id, None, self.worker_pool_error )
+
+                    self.worker_pool_turns.clear ()
+
+                return
+
+            if result is None:
+                continue
+
+            with self.lock:
+                turn_index, turn_id, session_id = self.worker_pool_turns.pop ( result [ 'request_id' ] )
+                self.write_worker_pool_record ( turn_index, turn_id, session_id, result [ 'content' ], result [ 'error' ] )
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Write the record of a worker pool turn.
+    #
+    # Function name:
+    # - write_worker_pool_record
+    #
+    # Description:
+    # - This function writes a turn record, or an error record if the turn failed, with the turn's index and session, and flushes the output stream.
+    #
+    # Parameters:
+    # - turn_index    : int : The index of the turn in the input stream.
+    # - turn_id       : any : The turn id from the input, or `None`.
+    # - session_id    : str : The session id.
+    # - content       : str : The response text, if the turn succeeded.
+    # - error_message : str : The error message, if the turn failed, otherwise `None`.
+    #
+    # Return Values:
+    # - None.
+    #
+    # Preconditions:
+    # - The caller holds the lock.
+    #
+    # Postconditions:
+    # - The record has been written and flushed.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def write_worker_pool_record ( self, turn_index, turn_id, session_id, content, error_message ):
+
+        if error_message is not None:
+            record = self.compile_error_record ( turn_id, error_message, session_id )
+        else:
+            record = self.compile_record ( turn_id, session_id )
+            record [ self.PIPELINE_FIELD_ROLE    ] = self.model.MODEL_MESSAGE_ROLE_AI
+            record [ self.PIPELINE_FIELD_CONTENT ] = content
+
+        record [ self.PIPELINE_FIELD_TURN ] = turn_index
+
+        self.write_record ( record )
+        self.output_stream.flush ()
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Update the chat log index.
+    #
+    # Function name:
+    # - update_chat_log_index
+    #
+    # Description:
+    # - This function indexes any new chat log files, once the pipeline has shut down.
+    # - Several pipeline processes may shut down at the same time, e.g. under the load generator. Index updates are serialised by the index lock, and an
+    #   index error is written to stderr, rather than failing the pipeline after all of its turns have been written.
+    #
+    # Parameters:
+    # - None
+    #
+    # Return Values:
+    # - None.
+    #
+    # Preconditions:
+    # - None.
+    #
+    # Postconditions:
+    # - Every chat log file is indexed, unless the update failed.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def update_chat_log_index ( self ):
+
+        try:
+            ChatLogIndex ( self.model.chat_log_folder ).update ()
+
+        except Exception as e:
+            print ( f'{self.model.TERMINAL_ERROR} Chat log index update failed: {str(e)}', file = sys.stderr )
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Get the language model of a session.
+    #
+    # Function name:
+    # - get_session_model
+    #
+    # Description:
+    # - This function returns the language model that holds a session's conversation history, creating it on the session's first turn.
+    # - Session models share the pipeline's configuration, and its streaming setting.
+    #
+    # Parameters:
+    # - session_id : str : The session id.
+    #
+    # Return Values:
+    # - model : LanguageModel : The session's language model.
+    #
+    # Preconditions:
+    # - None.
+    #
+    # Postconditions:
+    # - The session has a language model.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def get_session_model ( self, session_id ):
+
+        model = self.sessions.get ( session_id )
+
+        if model is None:
+            model                        = LanguageModel ( configuration = self.model.configuration )
+            model.terminal_output_stream = sys.stderr
+            model.override_configuration ( Configuration.CONFIGURATION_STREAMING_ENABLED, self.streaming_enabled )
+            self.sessions [ session_id ] = model
+
+        return model
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Parse an input line into a user prompt.
+    #
+    # Function name:
+    # - parse_turn
+    #
+    # Description:
+    # - This function converts a line of input into a user prompt, according to the pipeline input format.
+    #
+    # Parameters:
+    # - line : str : A line of input.
+    #
+    # Return Values:
+    # - user_prompt : str : The user prompt, or `None` if the line could not be parsed.
+    # - turn_id     : any : The optional turn id supplied with JSON input, or `None`.
+    # - session_id  : str : The session supplied with JSON input, or the default session.
+    #
+    # Preconditions:
+    # - The pipeline class must be initialized.
+    #
+    # Postconditions:
+    # - None.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def parse_turn ( self, line ):
+
+        # Text input. The whole line is the user prompt.
+
+        if self.input_format == self.PIPELINE_INPUT_FORMAT_TEXT:
+            return line, None, self.PIPELINE_SESSION_DEFAULT
+
+        # JSON input. The user prompt is the `content` field.
+
+        try:
+            turn = json.loads ( line )
+
+        except ValueError:
+            return None, None, None
+
+        if not isinstance ( turn, dict ):
+            return None, None, None
+
+        user_prompt = turn.get ( self.PIPELINE_FIELD_CONTENT )
+        turn_id     = turn.get ( self.PIPELINE_FIELD_ID )
+        session_id  = str ( turn.get ( self.PIPELINE_FIELD_SESSION, self.PIPELINE_SESSION_DEFAULT ) )
+
+        if not isinstance ( user_prompt, str ):
+            user_prompt = None
+
+        return user_prompt, turn_id, session_id
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Query the language model, and write its response to the output stream.
+    #
+    # Function name:
+    # - write_language_model_response
+    #
+    # Description:
+    # - This function is the headless counterpart of `Application.render_language_model_response`.
+    # - The model is queried with `send_query`, so that a failed query, or a failure part way through a streamed response, is reported once, in an error
+    #   record, rather than also being printed to stderr.
+    # - Streaming responses are written as one delta record per chunk, followed by the complete turn record.
+    # - Non-streaming responses are written as a single turn record.
+    #
+    # Parameters:
+    # - model      : LanguageModel : The language model of the turn's session, with the user prompt added to its conversation history.
+    # - turn_id    : any           : The optional turn id to echo back in the response records.
+    # - session_id : str           : The session to echo back in the response records, or `None`.
+    #
+    # Return Values:
+    # - response_text : str : The text of the language model's response, or `None` if the query failed.
+    #
+    # Preconditions:
+    # - The pipeline and model classes must be initialized.
+    #
+    # Postconditions:
+    # - The language model's response, or an error record, is written to the output stream.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def write_language_model_response ( self, model, turn_id, session_id ):
+
+        try:
+
+            # Query the language model.
+
+            model_response = model.send_query ()
+
+            # Write model response.
+
+            if model.streaming_enabled:
+
+                # Output a delta record for each chunk as the response is streamed.
+
+                response_chunks = []
+
+                for chunk in model_response:
+                    if chunk.choices [ 0 ].delta.content:
+                        delta_record = self.compile_record ( turn_id, session_id )
+                        delta_record [ self.PIPELINE_FIELD_DELTA ] = chunk.choices [ 0 ].delta.content
+                        self.write_record ( delta_record )
+                        response_chunks.append ( chunk.choices [ 0 ].delta.content )
+
+                response_text = ''.join ( response_chunks )
+
+            else:
+                response_text = model_response.choices [ 0 ].message.content
+
+            # Output the complete turn record.
+
+            turn_record = self.compile_record ( turn_id, session_id )
+            turn_record [ self.PIPELINE_FIELD_ROLE    ] = model.MODEL_MESSAGE_ROLE_AI
+            turn_record [ self.PIPELINE_FIELD_CONTENT ] = response_text
+
+            if model.streaming_enabled:
+                turn_record [ self.PIPELINE_FIELD_DONE ] = True
+
+            self.write_record ( turn_record )
+
+            return response_text
+
+        except Exception as e:
+
+            self.write_record ( self.compile_error_record ( turn_id, str ( e ), session_id ) )
+
+            return None
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Compile the common fields of an output record.
+    #
+    # Function name:
+    # - compile_record
+    #
+    # Description:
+    # - This function returns a new output record, populated with the current turn index, and the turn id and session if they were supplied.
+    #
+    # Parameters:
+    # - turn_id    : any : The optional turn id to echo back in the record.
+    # - session_id : str : The optional session to echo back in the record. Default value is `None`.
+    #
+    # Return Values:
+    # - record : dict : The output record.
+    #
+    # Preconditions:
+    # - None.
+    #
+    # Postconditions:
+    # - None.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def compile_record ( self, turn_id, session_id = None ):
+
+        record = { self.PIPELINE_FIELD_TURN : self.turn_index }
+
+        if turn_id is not None:
+            record [ self.PIPELINE_FIELD_ID ] = turn_id
+
+        if session_id is not None:
+            record [ self.PIPELINE_FIELD_SESSION ] = session_id
+
+        return record
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Compile an error output record.
+    #
+    # Function name:
+    # - compile_error_record
+    #
+    # Description:
+    # - This function returns a new output record describing an error for the current turn.
+    #
+    # Parameters:
+    # - turn_id       : any : The optional turn id to echo back in the record.
+    # - error_message : str : Description of the error.
+    # - session_id    : str : The optional session to echo back in the record. Default value is `None`.
+    #
+    # Return Values:
+    # - record : dict : The error record.
+    #
+    # Preconditions:
+    # - None.
+    #
+    # Postconditions:
+    # - None.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def compile_error_record ( self, turn_id, error_message, session_id = None ):
+
+        record = self.compile_record ( turn_id, session_id )
+        record [ self.PIPELINE_FIELD_ERROR ] = error_message
+
+        return record
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Write a record to the output stream.
+    #
+    # Function name:
+    # - write_record
+    #
+    # Description:
+    # - This function writes a record to the output stream as a single line of compact JSON.
+    # - The output stream is only flushed here if the flush option is enabled.
+    #
+    # Parameters:
+    # - record : dict : The record to write.
+    #
+    # Return Values:
+    # - None.
+    #
+    # Preconditions:
+    # - The pipeline class must be initialized.
+    #
+    # Postconditions:
+    # - The record is written to the output stream.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def write_record ( self, record ):
+
+        self.output_stream.write ( json.dumps ( record, ensure_ascii = False, separators = ( ',', ':' ) ) + '\n' )
+
+        if self.flush_enabled:
+            self.output_stream.flush ()
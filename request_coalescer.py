@@ -0,0 +1,298 @@
+#---------------------------------------------------------------------------------------------------------------------------------------------------------
+# Application   Conversation Agent Reference Application
+# Version:      2.0
+# Release Date: 2024-04-06
+# Author:       Rohin Gosling
+#
+# Description:
+#
+# - Single-flight request coalescing, so that concurrent identical requests share one upstream call.
+#
+# - When many sessions send the same request at the same time, e.g. the same first question to a fresh conversation, or a retry of a request that is
+#   still running, the first request becomes the leader of a "flight", and makes the upstream call. Requests with the same key that arrive while the
+#   flight is running join it as followers, and receive the leader's response instead of making their own call.
+#
+#   - Non-streaming: Every request in the flight receives the same response object.
+#   - Streaming:     The upstream stream is drained by a pump thread into the flight's chunk buffer, and each request in the flight receives its own iterator
+#                    over the buffer. Chunks are multicast to all iterators as they arrive, and a follower that joins part way through first receives the
+#                    chunks it missed.
+#
+# - Errors are shared in the same way. If the upstream call fails, every request in the flight raises the same exception.
+#
+# - A flight ends when its upstream call is complete. Completed responses are not cached, so a request that arrives after a flight has ended starts a new
+#   one.
+#
+# - Usage:
+#
+#   response = shared_request_coalescer.execute ( key, lambda: client.post ( ... ), streaming_enabled )
+#
+#---------------------------------------------------------------------------------------------------------------------------------------------------------
+
+import threading
+
+class RequestFlight:
+
+    __slots__ = ( 'condition', 'response', 'chunks', 'error', 'done' )
+
+    #---------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Constructor.
+    #---------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def __init__ ( self ):
+
+        # Initialise flight.
+
+        self.condition = threading.Condition ()     # Notified when the response, a chunk, or an error arrives, or the flight ends.
+        self.response  = None                       # The upstream response. For streaming requests, the upstream stream.
+        self.chunks    = []                         # Streamed chunks received so far.
+        self.error     = None                       # The exception raised by the upstream call, if it failed.
+        self.done      = False                      # True once the upstream call is complete.
+
+class RequestCoalescer:
+
+    #---------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Constructor.
+    #---------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def __init__ ( self ):
+
+        # Initialise request coalescer.
+
+        self.flights                 = {}                       # Request key to the running `RequestFlight` for that key.
+        self.lock                    = threading.Lock ()
+        self.upstream_request_count  = 0                        # Number of requests that made an upstream call.
+        self.coalesced_request_count = 0                        # Number of requests that joined another request's upstream call.
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Execute a request, sharing the upstream call with any identical request that is already running.
+    #
+    # Function name:
+    # - execute
+    #
+    # Description:
+    # - This is the main public function that consumers of the class call to make a coalesced request.
+    # - If no request with the same key is running, this request leads a new flight, and calls `request_function` to make the upstream call. Otherwise it
+    #   joins the running flight, and waits for the leader's response.
+    #
+    # Parameters:
+    # - key               : bytes    : The request key. Requests with equal keys must be interchangeable, e.g. a hash of the encoded request body.
+    # - request_function  : function : A function with no parameters, that makes the upstream call and returns the response.
+    # - streaming_enabled : bool     : True if the response is a stream of chunks, otherwise False.
+    #
+    # Return Values:
+    # - response : object : The response. For streaming requests, an iterator over the response chunks.
+    #
+    # Preconditions:
+    # - None.
+    #
+    # Postconditions:
+    # - None.
+    #
+    # Raises:
+    # - Exception : The exception raised by the upstream call, if it failed.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def execute ( self, key, request_function, streaming_enabled ):
+
+        # Join the running flight for this key, or start a new one.
+
+        with self.lock:
+
+            flight = self.flights.get ( key )
+            leader = flight is None
+
+            if leader:
+                flight               = RequestFlight ()
+                self.flights [ key ] = flight
+                self.upstream_request_count += 1
+            else:
+                self.coalesced_request_count += 1
+
+        # Make the upstream call, if this request leads the flight.
+
+        if leader:
+
+            try:
+                response = request_function ()
+
+            except Exception as e:
+                self.end_flight ( key, flight, error = e )
+                raise
+
+            if streaming_enabled:
+                with flight.condition:
+                    flight.response = response
+                    flight.condition.notify_all ()
+
+                threading.Thread ( target = self.pump_chunks, args = ( key, flight ), daemon = True ).start ()
+
+            else:
+                self.end_flight ( key, flight, response = response )
+
+        # Wait for the response.
+
+        with flight.condition:
+
+            flight.condition.wait_for ( lambda: flight.response is not None or flight.done )
+
+            if flight.response is None:
+                raise flight.error
+
+        if streaming_enabled:
+            return self.iterate_chunks ( flight )
+
+        return flight.response
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Drain a streaming response into a flight's chunk buffer.
+    #
+    # Function name:
+    # - pump_chunks
+    #
+    # Description:
+    # - This function is the target of a flight's pump thread. It reads each chunk from the upstream stream, adds it to the chunk buffer, and wakes the
+    #   iterators waiting for it.
+    # - The stream is drained by its own thread, rather than by the leader, so that followers are not held up if the leader is slow to read its chunks.
+    #
+    # Parameters:
+    # - key    : bytes         : The request key.
+    # - flight : RequestFlight : The flight.
+    #
+    # Return Values:
+    # - None.
+    #
+    # Preconditions:
+    # - The flight's response is the upstream stream.
+    #
+    # Postconditions:
+    # - The flight has ended.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def pump_chunks ( self, key, flight ):
+
+        try:
+
+            for chunk in flight.response:
+                with flight.condition:
+                    flight.chunks.append ( chunk )
+                    flight.condition.notify_all ()
+
+        except Exception as e:
+            self.end_flight ( key, flight, error = e )
+            return
+
+        self.end_flight ( key, flight )
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Iterate over a flight's streamed chunks.
+    #
+    # Function name:
+    # - iterate_chunks
+    #
+    # Description:
+    # - This function yields each chunk in the flight's chunk buffer, in order, waiting for more chunks until the flight has ended.
+    #
+    # Parameters:
+    # - flight : RequestFlight : The flight.
+    #
+    # Return Values:
+    # - chunk : object : Each response chunk, in order.
+    #
+    # Preconditions:
+    # - None.
+    #
+    # Postconditions:
+    # - None.
+    #
+    # Raises:
+    # - Exception : The exception raised while streaming the upstream response, if it failed, after all chunks received before the failure.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def iterate_chunks ( self, flight ):
+
+        chunk_index = 0
+
+        while True:
+
+            with flight.condition:
+
+                flight.condition.wait_for ( lambda: chunk_index < len ( flight.chunks ) or flight.done )
+
+                chunks = flight.chunks [ chunk_index : ]
+                done   = flight.done
+
+            # Yield outside the lock, so that the pump thread is never blocked by a slow reader.
+
+            for chunk in chunks:
+                yield chunk
+
+            chunk_index += len ( chunks )
+
+            if done and chunk_index == len ( flight.chunks ):
+
+                if flight.error is not None:
+                    raise flight.error
+
+                return
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # End a flight.
+    #
+    # Function name:
+    # - end_flight
+    #
+    # Description:
+    # - This function records the outcome of a flight's upstream call, wakes every request waiting on the flight, and removes the flight, so that later
+    #   requests with the same key start a new flight.
+    #
+    # Parameters:
+    # - key      : bytes         : The request key.
+    # - flight   : RequestFlight : The flight.
+    # - response : object        : The non-streaming response, if any.
+    # - error    : Exception     : The exception raised by the upstream call, if it failed.
+    #
+    # Return Values:
+    # - None.
+    #
+    # Preconditions:
+    # - None.
+    #
+    # Postconditions:
+    # - The flight is done, and is no longer running.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def end_flight ( self, key, flight, response = None, error = None ):
+
+        with self.lock:
+            if self.flights.get ( key ) is flight:
+                del self.flights [ key ]
+
+        with flight.condition:
+
+            if response is not None:
+                flight.response = response
+
+            flight.error = error
+            flight.done  = True
+            flight.condition.notify_all ()
+
+# Shared request coalescer.
+# - All language models in a process share one coalescer, so that identical requests from different sessions are coalesced.
+
+shared_request_coalescer = RequestCoalescer ()
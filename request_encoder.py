@@ -0,0 +1,215 @@
+#---------------------------------------------------------------------------------------------------------------------------------------------------------
+# Application   Conversation Agent Reference Application
+# Version:      2.0
+# Release Date: 2024-04-06
+# Author:       Rohin Gosling
+#
+# Description:
+#
+# - Incremental chat completions request body encoder.
+#
+# - Rather than re-encoding the entire conversation history to JSON on every turn, the encoder:
+#
+#   1. Keeps the encoded `messages` array from the previous request, along with the messages it was built from.
+#   2. On each request, finds the longest prefix of the conversation history that is unchanged since the previous request, truncates the encoded array back
+#      to the end of that prefix, and encodes and appends only the messages that follow it (see `Message.to_json`).
+#
+# - Appending a turn therefore only encodes the new messages. Replacing or removing messages (e.g. trimmed or compacted turns, or a reloaded system prompt)
+#   only re-encodes the messages from the first changed message onwards, which is usually just the last few.
+#
+# - The encoded array is the only encoded copy of the conversation history. Encoded fragments are not cached on the messages.
+#
+# - Messages are compared by identity, so messages must not be modified once they have been added to the conversation history. Replace them instead.
+#
+#---------------------------------------------------------------------------------------------------------------------------------------------------------
+
+import sys
+import json
+import operator
+
+class RequestEncoder:
+
+    # Constants: JSON Fragments.
+
+    REQUEST_ENCODER_MESSAGES_BEGIN     = b'"messages":['
+    REQUEST_ENCODER_MESSAGES_END       = b']}'
+    REQUEST_ENCODER_MESSAGES_SEPARATOR = b','
+
+    #---------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Constructor.
+    #---------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def __init__ ( self ):
+
+        # Initialise request encoder.
+
+        self.encoded_messages    = []           # The messages encoded into `messages_fragment`, in order.
+        self.message_end_offsets = []           # The offset in `messages_fragment` of the end of each encoded message.
+        self.messages_fragment   = bytearray () # The encoded contents of the `messages` array, without the enclosing brackets.
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Encode a chat completions request body.
+    #
+    # Function name:
+    # - encode
+    #
+    # Description:
+    # - This function returns the JSON-encoded request body for a list of messages and a set of request parameters.
+    # - The encoded `messages` array is updated incrementally from the previous call, as described in the module description.
+    #
+    # Parameters:
+    # - messages   : list : The conversation history, as a list of `Message` objects.
+    # - parameters : dict : Keyword arguments holding the remaining request parameters, e.g. `model`, `max_tokens`, `temperature`, and `stream`.
+    #
+    # Return Values:
+    # - request_body : bytes : The UTF-8 JSON-encoded request body.
+    #
+    # Preconditions:
+    # - Messages must not be modified once they have been passed to the encoder.
+    #
+    # Postconditions:
+    # - The encoder's cached `messages` array matches `messages`.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def encode ( self, messages, **parameters ):
+
+        self.update_messages_fragment ( messages )
+
+        # Assemble the request body from the encoded parameters, and the encoded messages array.
+
+        parameters_fragment = json.dumps ( parameters, separators = ( ',', ':' ) ).encode ( 'utf-8' )
+
+        if len ( parameters ) > 0:
+            parameters_fragment = parameters_fragment [ : -1 ] + self.REQUEST_ENCODER_MESSAGES_SEPARATOR
+        else:
+            parameters_fragment = parameters_fragment [ : -1 ]
+
+        return b''.join ( ( parameters_fragment, self.REQUEST_ENCODER_MESSAGES_BEGIN, self.messages_fragment, self.REQUEST_ENCODER_MESSAGES_END ) )
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Update the encoded messages array to match a list of messages.
+    #
+    # Function name:
+    # - update_messages_fragment
+    #
+    # Description:
+    # - This function finds the number of leading messages that are unchanged since the previous update, discards the encoded fragments of any messages after
+    #   them, and encodes and appends the new messages.
+    #
+    # Parameters:
+    # - messages : list : The conversation history, as a list of `Message` objects.
+    #
+    # Return Values:
+    # - None.
+    #
+    # Preconditions:
+    # - None.
+    #
+    # Postconditions:
+    # - `messages_fragment` holds the encoded `messages` array for `messages`.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def update_messages_fragment ( self, messages ):
+
+        # Find the length of the unchanged prefix.
+
+        prefix_length = min ( len ( messages ), len ( self.encoded_messages ) )
+        prefix_match  = list ( map ( operator.is_, messages [ : prefix_length ], self.encoded_messages [ : prefix_length ] ) )
+
+        if False in prefix_match:
+            prefix_length = prefix_match.index ( False )
+
+        # Discard everything after the unchanged prefix.
+
+        if prefix_length < len ( self.encoded_messages ):
+
+            end_offset = self.message_end_offsets [ prefix_length - 1 ] if prefix_length > 0 else 0
+
+            del self.messages_fragment   [ end_offset : ]
+            del self.encoded_messages    [ prefix_length : ]
+            del self.message_end_offsets [ prefix_length : ]
+
+        # Append the new messages.
+
+        for message in messages [ prefix_length : ]:
+
+            if len ( self.messages_fragment ) > 0:
+                self.messages_fragment += self.REQUEST_ENCODER_MESSAGES_SEPARATOR
+
+            self.messages_fragment += message.to_json ()
+            self.encoded_messages.append ( message )
+            self.message_end_offsets.append ( len ( self.messages_fragment ) )
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Clear the encoder's cached messages array.
+    #
+    # Function name:
+    # - reset
+    #
+    # Description:
+    # - This function discards the encoded messages array, so that it is re-encoded from scratch on the next call to `encode`.
+    #
+    # Parameters:
+    # - None
+    #
+    # Return Values:
+    # - None.
+    #
+    # Preconditions:
+    # - None.
+    #
+    # Postconditions:
+    # - The encoder's cached messages array is empty.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def reset ( self ):
+
+        self.encoded_messages    = []
+        self.message_end_offsets = []
+        self.messages_fragment   = bytearray ()
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Get the memory used by the encoder.
+    #
+    # Function name:
+    # - get_memory_size
+    #
+    # Description:
+    # - This function returns the number of bytes used by the encoded messages array, and the lists that track it.
+    # - The messages themselves are owned by the conversation history, and are not counted.
+    #
+    # Parameters:
+    # - None
+    #
+    # Return Values:
+    # - memory_size : int : The memory used by the encoder, in bytes.
+    #
+    # Preconditions:
+    # - None.
+    #
+    # Postconditions:
+    # - None.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def get_memory_size ( self ):
+
+        memory_size  = sys.getsizeof ( self.messages_fragment ) + sys.getsizeof ( self.encoded_messages ) + sys.getsizeof ( self.message_end_offsets )
+        memory_size += sum ( map ( sys.getsizeof, self.message_end_offsets ) )
+
+        return memory_size
@@ -0,0 +1,932 @@
+#---------------------------------------------------------------------------------------------------------------------------------------------------------
+# Application   Conversation Agent Reference Application
+# Version:      2.0
+# Release Date: 2024-04-06
+# Author:       Rohin Gosling
+#
+# Description:
+#
+# - Retrieval of relevant context from past conversations in the chat log archive.
+#
+# - Every message in the chat log archive is embedded as a vector, and stored in a local vector index in the `index` sub-folder of the chat log folder:
+#
+#   - vectors.f32  : The message embeddings, as a row-major matrix of 32-bit floats, one row per message.
+#   - vectors.doc  : One `( file number, content offset, content length, role code )` row of 64-bit integers per message.
+#   - vectors.json : Manifest holding the indexed chat log files, the message count, and the embedder used.
+#
+# - Indexing is incremental. `update` only embeds the messages in chat log files that are new since the previous update, in batches, and appends them to
+#   the index files. If an indexed chat log file was changed or removed, or the embedder changed, the archive is re-indexed from scratch.
+#
+# - Several processes may share one index, e.g. the worker processes of a worker pool. `update` and `open` hold a cross-process `FileLock` on the index,
+#   and re-read the manifest under the lock, so that only one process appends to the index files at a time, and the vectors and document table always
+#   hold the same rows. The manifest is written to a unique temporary file, and then moved into place.
+#
+# - Retrieval is vectorized. The index files are memory-mapped with NumPy, the query is embedded, and all messages are scored with a single matrix-vector
+#   product, followed by a partial sort for the top-k. Memory-mapped index files are shared between processes through the OS page cache.
+#
+# - Indexing runs in the background, so that it never delays a query. `start_updates` starts a thread that calls `update` every
+#   `VECTOR_INDEX_UPDATE_INTERVAL` seconds. Each update publishes a new read-only snapshot of the mapped index files, and `retrieve` reads whichever
+#   snapshot is current, without taking any lock. Until the first update completes, nothing is retrieved.
+#
+# - Embedders are pluggable. An embedder is any object with a `name`, a `dimension`, and an `embed ( texts )` function that returns an array of unit
+#   length row vectors. The default `HashingEmbedder` needs no model download or network access. `create_embedder` creates an embedder from the
+#   `retrieval_embedder` configuration setting, which is either the name of a built-in embedder, or the `module:ClassName` import path of an embedder
+#   class, which is created with no arguments.
+#
+# Dependencies:
+#
+# - NumPy Library:
+#
+#   pip install --upgrade numpy
+#
+#---------------------------------------------------------------------------------------------------------------------------------------------------------
+
+import os
+import re
+import sys
+import json
+import time
+import zlib
+import tempfile
+import importlib
+import threading
+from file_lock       import FileLock
+from message         import Message
+from chat_log_reader import list_chat_log_files, read_chat_log_messages, read_chat_log_content
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+class HashingEmbedder:
+
+    # Constants: Hashing Embedder.
+
+    EMBEDDER_NAME              = 'hashing'
+    EMBEDDER_DIMENSION_DEFAULT = 256
+    EMBEDDER_TERM_PATTERN      = re.compile ( r'\w{3,}' )      # Terms of fewer than three characters carry little meaning, and are ignored.
+    EMBEDDER_STOP_WORDS        = frozenset ( [
+        'the', 'and', 'for', 'are', 'but', 'not', 'you', 'all', 'any', 'can', 'had', 'her', 'was', 'one', 'our', 'out', 'has', 'him', 'his', 'how', 'its',
+        'may', 'who', 'did', 'she', 'use', 'way', 'what', 'when', 'where', 'which', 'why', 'with', 'this', 'that', 'these', 'those', 'from', 'have', 'here',
+        'there', 'they', 'them', 'then', 'than', 'your', 'will', 'would', 'could', 'should', 'been', 'were', 'into', 'about', 'also', 'some', 'such', 'each',
+        'more', 'most', 'other', 'only', 'just', 'like', 'does', 'doing', 'please', 'sure', 'feel', 'free'
+    ] )
+
+    #---------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Constructor.
+    #---------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def __init__ ( self, dimension = EMBEDDER_DIMENSION_DEFAULT ):
+
+        # Initialise embedder.
+
+        self.name          = f'{self.EMBEDDER_NAME}-{dimension}'
+        self.dimension     = dimension
+        self.term_features = {}     # Cache of term to ( feature index, feature sign ).
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Embed a batch of texts.
+    #
+    # Function name:
+    # - embed
+    #
+    # Description:
+    # - This function embeds each text as a bag of words, using the hashing trick. Each term is hashed to a feature index and sign, term counts are
+    #   log-scaled, and each vector is normalized to unit length. Common stop words are ignored.
+    #
+    # Parameters:
+    # - texts : list : The texts to embed.
+    #
+    # Return Values:
+    # - vectors : ndarray : A `( len ( texts ), dimension )` array of 32-bit float unit vectors. Texts with no terms are embedded as zero vectors.
+    #
+    # Preconditions:
+    # - NumPy is installed.
+    #
+    # Postconditions:
+    # - None.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def embed ( self, texts ):
+
+        # Collect the feature index and sign of every term in every text.
+
+        rows    = []
+        columns = []
+        signs   = []
+
+        for row, text in enumerate ( texts ):
+            for term in self.EMBEDDER_TERM_PATTERN.findall ( text.lower () ):
+
+                feature = self.term_features.get ( term )
+
+                if feature is None:
+
+                    if term in self.EMBEDDER_STOP_WORDS:
+                        continue
+
+                    term_hash = zlib.crc32 ( term.encode ( 'utf-8' ) )
+                    feature   = ( term_hash % self.dimension, 1.0 if term_hash & 0x80000000 else -1.0 )
+                    self.term_features [ term ] = feature
+
+                rows.append ( row )
+                columns.append ( feature [ 0 ] )
+                signs.append ( feature [ 1 ] )
+
+        # Accumulate the features, and normalize.
+
+        vectors = np.zeros ( ( len ( texts ), self.dimension ), dtype = np.float32 )
+
+        np.add.at ( vectors, ( rows, columns ), signs )
+
+        vectors = np.sign ( vectors ) * np.log1p ( np.abs ( vectors ) )
+        norms   = np.linalg.norm ( vectors, axis = 1, keepdims = True )
+
+        norms [ norms == 0.0 ] = 1.0
+
+        return ( vectors / norms ).astype ( np.float32 )
+
+class VectorIndex:
+
+    # Constants: Index Files.
+
+    VECTOR_INDEX_FOLDER_NAME         = 'index'
+    VECTOR_INDEX_MANIFEST_FILE_NAME  = 'vectors.json'
+    VECTOR_INDEX_VECTORS_FILE_NAME   = 'vectors.f32'
+    VECTOR_INDEX_DOCUMENTS_FILE_NAME = 'vectors.doc'
+    VECTOR_INDEX_LOCK_FILE_NAME      = 'vectors.lock'
+    VECTOR_INDEX_DOCUMENT_COLUMNS    = 4                # File number, content offset, content length, role code.
+
+    # Constants: Indexing and Retrieval.
+
+    VECTOR_INDEX_BATCH_SIZE      = 256      # Number of messages to embed at a time.
+    VECTOR_INDEX_UPDATE_INTERVAL = 30.0     # Time in seconds between checks for new chat log files, by the update thread.
+    VECTOR_INDEX_MINIMUM_SCORE   = 0.2      # Minimum cosine similarity for a message to be retrieved.
+
+    # Constants: Terminal Output.
+
+    TERMINAL_ERROR = '[Error]'
+
+    #---------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Constructor.
+    #---------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def __init__ ( self, chat_log_folder = 'chat_log', embedder = None ):
+
+        if np is None:
+            raise ImportError ( 'Retrieval requires NumPy. Install it with `pip install numpy`.' )
+
+        # Initialise vector index.
+
+        self.chat_log_folder  = chat_log_folder
+        self.index_folder     = os.path.join ( chat_log_folder, self.VECTOR_INDEX_FOLDER_NAME )
+        self.lock_path        = os.path.join ( self.index_folder, self.VECTOR_INDEX_LOCK_FILE_NAME )
+        self.embedder         = embedder if embedder is not None else HashingEmbedder ()
+        self.manifest         = self.load_manifest ()
+        self.snapshot         = None                # The current ( vectors, documents, file names ) snapshot, published by `open`.
+        self.update_thread    = None
+        self.lock             = threading.Lock ()   # Serializes updates in this process. Other processes are excluded by the file lock.
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Update the index with any new chat log files.
+    #
+    # Function name:
+    # - update
+    #
+    # Description:
+    # - This function compares the chat log files on disk with the files recorded in the manifest, and embeds and appends the messages of any new files.
+    # - If an indexed file was changed or removed, or the embedder has changed, the whole archive is re-indexed.
+    # - The update runs under the index lock, against the manifest as it is on disk, so that concurrent updates from several processes are serialised, and
+    #   messages indexed by another process are not appended again.
+    # - Retrievals keep reading the current snapshot during the update. A new snapshot is published once the update is complete.
+    #
+    # Parameters:
+    # - None
+    #
+    # Return Values:
+    # - indexed_message_count : int : The number of messages that were embedded.
+    #
+    # Preconditions:
+    # - The vector index class must be initialized.
+    #
+    # Postconditions:
+    # - Every message in the chat log folder is indexed, and the snapshot is current.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def update ( self ):
+
+        # Hold both locks for the whole update, so that neither threads in this process, nor other processes sharing the index, update it at the same time.
+
+        with self.lock, FileLock ( self.lock_path ):
+
+            # Reload the manifest, in case another process has updated the index.
+
+            self.manifest = self.load_manifest ()
+
+            indexed_message_count = self.update_vectors ()
+
+            self.open_vectors ()
+
+            return indexed_message_count
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Embed and append the messages of any new chat log files.
+    #
+    # Function name:
+    # - update_vectors
+    #
+    # Description:
+    # - This function does the work of `update`.
+    #
+    # Parameters:
+    # - None
+    #
+    # Return Values:
+    # - indexed_message_count : int : The number of messages that were embedded.
+    #
+    # Preconditions:
+    # - Both locks are held, and the manifest is current.
+    #
+    # Postconditions:
+    # - Every message in the chat log folder is indexed.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def update_vectors ( self ):
+
+        # Compare the chat log files on disk with the indexed files.
+
+        file_signatures = { file_name : self.get_file_signature ( file_name ) for file_name in list_chat_log_files ( self.chat_log_folder ) }
+        indexed_files   = self.manifest [ 'files' ]
+
+        rebuild_enabled = any ( file_signatures.get ( file_name ) != tuple ( file_entry [ 1 : ] ) for file_name, file_entry in indexed_files.items () )
+        rebuild_enabled = rebuild_enabled or self.manifest [ 'embedder' ] != self.embedder.name
+        new_file_names  = [ file_name for file_name in file_signatures if file_name not in indexed_files or rebuild_enabled ]
+
+        if len ( new_file_names ) == 0:
+            return 0
+
+        # When re-indexing, remove the old index files rather than truncating them, so that other processes can keep reading their mapped copies until
+        # they reload the manifest.
+
+        if rebuild_enabled:
+
+            self.manifest = self.create_manifest ()
+
+            for file_name in ( self.VECTOR_INDEX_VECTORS_FILE_NAME, self.VECTOR_INDEX_DOCUMENTS_FILE_NAME ):
+                try:
+                    os.remove ( os.path.join ( self.index_folder, file_name ) )
+                except OSError:
+                    pass
+
+        if not os.path.exists ( self.index_folder ):
+            os.makedirs ( self.index_folder )
+
+        # Open the index files for appending, discarding anything past the end of the manifest, e.g. from an interrupted update.
+
+        vectors_file   = self.open_index_file ( self.VECTOR_INDEX_VECTORS_FILE_NAME,   4 * self.embedder.dimension )
+        documents_file = self.open_index_file ( self.VECTOR_INDEX_DOCUMENTS_FILE_NAME, 8 * self.VECTOR_INDEX_DOCUMENT_COLUMNS )
+
+        # Embed and append the messages of each new file, in batches.
+
+        indexed_message_count = 0
+
+        try:
+            texts     = []
+            documents = []
+
+            for file_name in new_file_names:
+
+                file_number = len ( self.manifest [ 'files' ] )
+
+                for role, content, byte_offset, byte_length in read_chat_log_messages ( os.path.join ( self.chat_log_folder, file_name ) ):
+
+                    texts.append ( content )
+                    documents.append ( ( file_number, byte_offset, byte_length, Message.get_role_code ( role ) ) )
+
+                    if len ( texts ) >= self.VECTOR_INDEX_BATCH_SIZE:
+                        self.write_batch ( vectors_file, documents_file, texts, documents )
+                        indexed_message_count += len ( texts )
+                        texts     = []
+                        documents = []
+
+                self.manifest [ 'files' ] [ file_name ] = [ file_number, *file_signatures [ file_name ] ]
+
+            if len ( texts ) > 0:
+                self.write_batch ( vectors_file, documents_file, texts, documents )
+                indexed_message_count += len ( texts )
+
+        finally:
+            vectors_file.close ()
+            documents_file.close ()
+
+        # Record the new messages in the manifest.
+
+        self.manifest [ 'document_count' ] += indexed_message_count
+
+        self.save_manifest ()
+
+        return indexed_message_count
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Start updating the index in the background.
+    #
+    # Function name:
+    # - start_updates
+    #
+    # Description:
+    # - This function starts the update thread, if it is not already running. It can be called on every turn.
+    #
+    # Parameters:
+    # - None
+    #
+    # Return Values:
+    # - None.
+    #
+    # Preconditions:
+    # - The vector index class must be initialized.
+    #
+    # Postconditions:
+    # - The update thread is running.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def start_updates ( self ):
+
+        with self.lock:
+
+            if self.update_thread is None:
+                self.update_thread = threading.Thread ( target = self.run_updates, name = 'VectorIndexUpdate', daemon = True )
+                self.update_thread.start ()
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Update the index periodically.
+    #
+    # Function name:
+    # - run_updates
+    #
+    # Description:
+    # - This function is the target of the update thread. It updates the index every `VECTOR_INDEX_UPDATE_INTERVAL` seconds, for the life of the process.
+    # - A failed update is reported on stderr, and retried at the next interval.
+    #
+    # Parameters:
+    # - None
+    #
+    # Return Values:
+    # - None.
+    #
+    # Preconditions:
+    # - None.
+    #
+    # Postconditions:
+    # - None.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def run_updates ( self ):
+
+        while True:
+
+            try:
+                self.update ()
+
+            except Exception as e:
+                print ( f'\n{self.TERMINAL_ERROR} Vector index update failed: {str(e)}', file = sys.stderr )
+
+            time.sleep ( self.VECTOR_INDEX_UPDATE_INTERVAL )
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Retrieve the messages most relevant to a query.
+    #
+    # Function name:
+    # - retrieve
+    #
+    # Description:
+    # - This function embeds the query, scores every indexed message by cosine similarity, and returns the top-k messages, most relevant first.
+    # - Messages scoring less than `VECTOR_INDEX_MINIMUM_SCORE` are not returned.
+    #
+    # Parameters:
+    # - query : str : The query text, e.g. the user's latest prompt.
+    # - top_k : int : The maximum number of messages to return.
+    #
+    # Return Values:
+    # - results : list : A list of dictionaries with `file_name`, `role`, `content`, and `score` keys, one per retrieved message.
+    #
+    # Preconditions:
+    # - None. If the index has not been opened or updated yet, nothing is retrieved.
+    #
+    # Postconditions:
+    # - None.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def retrieve ( self, query, top_k ):
+
+        # Read the current snapshot. Updates publish a new snapshot rather than changing this one, so no lock is needed.
+
+        snapshot = self.snapshot
+
+        if snapshot is None:
+            return []
+
+        vectors, documents, file_names = snapshot
+
+        document_count = len ( vectors )
+
+        if document_count == 0 or top_k <= 0:
+            return []
+
+        # Score every message, and select the top-k.
+
+        query_vector = self.embedder.embed ( [ query ] ) [ 0 ]
+        scores       = vectors @ query_vector
+
+        top_k         = min ( top_k, document_count )
+        top_k_indexes = np.argpartition ( -scores, top_k - 1 ) [ : top_k ]
+        top_k_indexes = top_k_indexes [ np.argsort ( -scores [ top_k_indexes ] ) ]
+
+        # Read the selected messages back from the chat log files.
+
+        results = []
+
+        for document_index in top_k_indexes:
+
+            score = float ( scores [ document_index ] )
+
+            if score < self.VECTOR_INDEX_MINIMUM_SCORE:
+                break
+
+            file_number, byte_offset, byte_length, role_code = ( int ( value ) for value in documents [ document_index ] )
+
+            file_name = file_names [ file_number ]
+
+            try:
+                content = read_chat_log_content ( os.path.join ( self.chat_log_folder, file_name ), byte_offset, byte_length )
+
+            except OSError:
+                continue        # The file was removed since the snapshot was taken.
+
+            results.append ( { 'file_name': file_name, 'role': Message.MESSAGE_ROLES [ role_code ], 'content': content, 'score': score } )
+
+        return results
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Embed a batch of messages, and append them to the index files.
+    #
+    # Function name:
+    # - write_batch
+    #
+    # Description:
+    # - This function embeds a batch of message texts, and appends the vectors and document table rows to the open index files.
+    #
+    # Parameters:
+    # - vectors_file   : file : The vectors file, open for appending.
+    # - documents_file : file : The document table file, open for appending.
+    # - texts          : list : The message texts.
+    # - documents      : list : The `( file number, content offset, content length, role code )` tuple for each message.
+    #
+    # Return Values:
+    # - None.
+    #
+    # Preconditions:
+    # - None.
+    #
+    # Postconditions:
+    # - The batch has been appended to the index files.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def write_batch ( self, vectors_file, documents_file, texts, documents ):
+
+        vectors_file.write   ( self.embedder.embed ( texts ).astype ( '<f4' ).tobytes () )
+        documents_file.write ( np.array ( documents, dtype = '<i8' ).tobytes () )
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Open an index file for appending.
+    #
+    # Function name:
+    # - open_index_file
+    #
+    # Description:
+    # - This function opens an index file for appending, after truncating it to the number of rows recorded in the manifest.
+    #
+    # Parameters:
+    # - file_name : str : The index file name, relative to the index folder.
+    # - row_size  : int : The size of one row of the index file, in bytes.
+    #
+    # Return Values:
+    # - file : file : The index file, open for appending.
+    #
+    # Preconditions:
+    # - The index folder exists.
+    #
+    # Postconditions:
+    # - None.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def open_index_file ( self, file_name, row_size ):
+
+        file = open ( os.path.join ( self.index_folder, file_name ), 'ab' )
+
+        file.truncate ( self.manifest [ 'document_count' ] * row_size )
+
+        return file
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Open the index files.
+    #
+    # Function name:
+    # - open
+    #
+    # Description:
+    # - This function re-reads the manifest, memory-maps the vectors and document table, limited to the number of messages recorded in the manifest, and
+    #   publishes them as the current snapshot, without indexing any new chat log files.
+    # - The files are mapped under the index lock, so that another process can not re-index the archive between reading the manifest and mapping the files.
+    #
+    # Parameters:
+    # - None
+    #
+    # Return Values:
+    # - None.
+    #
+    # Preconditions:
+    # - None.
+    #
+    # Postconditions:
+    # - `snapshot` holds the mapped index files.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def open ( self ):
+
+        with FileLock ( self.lock_path ):
+            self.manifest = self.load_manifest ()
+            self.open_vectors ()
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Memory-map the index files.
+    #
+    # Function name:
+    # - open_vectors
+    #
+    # Description:
+    # - This function does the work of `open`.
+    #
+    # Parameters:
+    # - None
+    #
+    # Return Values:
+    # - None.
+    #
+    # Preconditions:
+    # - The index lock is held.
+    #
+    # Postconditions:
+    # - `snapshot` holds the mapped index files.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def open_vectors ( self ):
+
+        document_count = self.manifest [ 'document_count' ]
+        file_names     = { file_entry [ 0 ] : file_name for file_name, file_entry in self.manifest [ 'files' ].items () }
+
+        if document_count == 0:
+            vectors   = np.zeros ( ( 0, self.embedder.dimension ), dtype = np.float32 )
+            documents = np.zeros ( ( 0, self.VECTOR_INDEX_DOCUMENT_COLUMNS ), dtype = np.int64 )
+
+            self.snapshot = ( vectors, documents, file_names )
+            return
+
+        vectors = np.memmap (
+            os.path.join ( self.index_folder, self.VECTOR_INDEX_VECTORS_FILE_NAME ),
+            dtype = '<f4',
+            mode  = 'r',
+            shape = ( document_count, self.embedder.dimension )
+        )
+
+        documents = np.memmap (
+            os.path.join ( self.index_folder, self.VECTOR_INDEX_DOCUMENTS_FILE_NAME ),
+            dtype = '<i8',
+            mode  = 'r',
+            shape = ( document_count, self.VECTOR_INDEX_DOCUMENT_COLUMNS )
+        )
+
+        # Publish the snapshot with a single assignment, so that a retrieval sees either the old snapshot or the new one.
+
+        self.snapshot = ( vectors, documents, file_names )
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Close the index files.
+    #
+    # Function name:
+    # - close
+    #
+    # Description:
+    # - This function releases the mapped index files. Nothing is retrieved until the index is opened or updated again.
+    #
+    # Parameters:
+    # - None
+    #
+    # Return Values:
+    # - None.
+    #
+    # Preconditions:
+    # - None.
+    #
+    # Postconditions:
+    # - No index files are mapped.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def close ( self ):
+
+        self.snapshot = None
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Create an empty manifest.
+    #
+    # Function name:
+    # - create_manifest
+    #
+    # Description:
+    # - This function returns the manifest of an empty index for the current embedder.
+    #
+    # Parameters:
+    # - None
+    #
+    # Return Values:
+    # - manifest : dict : A dictionary with `embedder`, `document_count`, and `files` keys. Each entry in `files` maps a chat log file name to its file
+    #                     number, modification time, and size.
+    #
+    # Preconditions:
+    # - None.
+    #
+    # Postconditions:
+    # - None.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def create_manifest ( self ):
+
+        return { 'embedder': self.embedder.name, 'document_count': 0, 'files': {} }
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Load the index manifest.
+    #
+    # Function name:
+    # - load_manifest
+    #
+    # Description:
+    # - This function loads the manifest file. If there is no manifest, or it can not be read, an empty manifest is returned.
+    #
+    # Parameters:
+    # - None
+    #
+    # Return Values:
+    # - manifest : dict : The manifest, as described in `create_manifest`.
+    #
+    # Preconditions:
+    # - None.
+    #
+    # Postconditions:
+    # - None.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def load_manifest ( self ):
+
+        try:
+            with open ( os.path.join ( self.index_folder, self.VECTOR_INDEX_MANIFEST_FILE_NAME ), 'r', encoding = 'utf-8' ) as file:
+                manifest = json.load ( file )
+
+            if not all ( key in manifest for key in self.create_manifest () ):
+                raise ValueError ( 'Incomplete manifest.' )
+
+            return manifest
+
+        except ( OSError, ValueError ):
+            return self.create_manifest ()
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Save the index manifest.
+    #
+    # Function name:
+    # - save_manifest
+    #
+    # Description:
+    # - This function writes the manifest to a uniquely named temporary file, and then moves it into place, so that the manifest is always complete, and
+    #   concurrent writers never share a temporary file.
+    #
+    # Parameters:
+    # - None
+    #
+    # Return Values:
+    # - None.
+    #
+    # Preconditions:
+    # - The index folder exists.
+    #
+    # Postconditions:
+    # - The manifest file has been written.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def save_manifest ( self ):
+
+        manifest_path = os.path.join ( self.index_folder, self.VECTOR_INDEX_MANIFEST_FILE_NAME )
+
+        file_descriptor, temporary_path = tempfile.mkstemp ( dir = self.index_folder, prefix = self.VECTOR_INDEX_MANIFEST_FILE_NAME + '.', suffix = '.tmp' )
+
+        try:
+            with os.fdopen ( file_descriptor, 'w', encoding = 'utf-8' ) as file:
+                json.dump ( self.manifest, file )
+
+            os.replace ( temporary_path, manifest_path )
+
+        except BaseException:
+            try:
+                os.remove ( temporary_path )
+            except OSError:
+                pass
+            raise
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Get the signature of a chat log file, used to detect changes to the file.
+    #
+    # Function name:
+    # - get_file_signature
+    #
+    # Description:
+    # - This function returns the modification time and size of a chat log file.
+    #
+    # Parameters:
+    # - file_name : str : The chat log file name, relative to the chat log folder.
+    #
+    # Return Values:
+    # - file_signature : tuple : The file's modification time in nanoseconds and size in bytes.
+    #
+    # Preconditions:
+    # - The chat log file exists.
+    #
+    # Postconditions:
+    # - None.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def get_file_signature ( self, file_name ):
+
+        file_status = os.stat ( os.path.join ( self.chat_log_folder, file_name ) )
+
+        return ( file_status.st_mtime_ns, file_status.st_size )
+
+#-------------------------------------------------------------------------------------------------------------------------------------------------------------
+# Create an embedder.
+#
+# Function name:
+# - create_embedder
+#
+# Description:
+# - This function creates the embedder named by the `retrieval_embedder` configuration setting.
+# - The name is either a built-in embedder name, e.g. `hashing`, or the `module:ClassName` import path of an embedder class, which is created with no
+#   arguments.
+#
+# Parameters:
+# - embedder_name : str : The embedder name, or import path.
+#
+# Return Values:
+# - embedder : object : The embedder.
+#
+# Preconditions:
+# - None.
+#
+# Postconditions:
+# - None.
+#
+# Raises:
+# - ValueError  : If the name is neither a built-in embedder, nor an import path.
+# - ImportError : If the embedder class can not be imported.
+#
+# To-Do:
+# - None.
+#
+#-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+EMBEDDER_CLASSES = { HashingEmbedder.EMBEDDER_NAME : HashingEmbedder }
+
+def create_embedder ( embedder_name ):
+
+    # Built-in embedder.
+
+    if embedder_name in EMBEDDER_CLASSES:
+        return EMBEDDER_CLASSES [ embedder_name ] ()
+
+    # Embedder class import path.
+
+    module_name, _, class_name = embedder_name.partition ( ':' )
+
+    if module_name == '' or class_name == '':
+        raise ValueError ( f'Unknown retrieval embedder "{embedder_name}". Use one of {sorted ( EMBEDDER_CLASSES )}, or a "module:ClassName" import path.' )
+
+    embedder_class = getattr ( importlib.import_module ( module_name ), class_name, None )
+
+    if embedder_class is None:
+        raise ImportError ( f'Retrieval embedder class "{class_name}" not found in module "{module_name}".' )
+
+    return embedder_class ()
+
+#-------------------------------------------------------------------------------------------------------------------------------------------------------------
+# Get the shared vector index for a chat log folder.
+#
+# Function name:
+# - get_shared_vector_index
+#
+# Description:
+# - This function returns a vector index for a chat log folder. The same instance is returned for every call with the same folder, so that all sessions
+#   in a process share one index.
+# - The embedder is created when the index is first opened, so later calls with a different embedder name get the index as it was opened.
+#
+# Parameters:
+# - chat_log_folder : str : The chat log folder.
+# - embedder_name   : str : The embedder name, or import path, as described in `create_embedder`. Default value is the `HashingEmbedder` name.
+#
+# Return Values:
+# - vector_index : VectorIndex : The shared vector index.
+#
+# Preconditions:
+# - NumPy is installed.
+#
+# Postconditions:
+# - None.
+#
+# Raises:
+# - ValueError, ImportError : If the embedder can not be created. See `create_embedder`.
+#
+# To-Do:
+# - None.
+#
+#-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+shared_vector_indexes      = {}
+shared_vector_indexes_lock = threading.Lock ()
+
+def get_shared_vector_index ( chat_log_folder, embedder_name = HashingEmbedder.EMBEDDER_NAME ):
+
+    with shared_vector_indexes_lock:
+
+        vector_index = shared_vector_indexes.get ( chat_log_folder )
+
+        if vector_index is None:
+            vector_index = VectorIndex ( chat_log_folder, embedder = create_embedder ( embedder_name ) )
+            shared_vector_indexes [ chat_log_folder ] = vector_index
+
+        return vector_index
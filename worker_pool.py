@@ -0,0 +1,1016 @@
+#---------------------------------------------------------------------------------------------------------------------------------------------------------
+# Application   Conversation Agent Reference Application
+# Version:      2.0
+# Release Date: 2024-04-06
+# Author:       Rohin Gosling
+#
+# Description:
+#
+# - Multi-process worker pool, for serving many conversation sessions across CPU cores.
+#
+# - `WorkerPool` is the dispatcher. It starts N worker processes, and assigns each session to a worker with a consistent hash ring on the session id, so
+#   every turn of a session is served by the same worker, which holds the session's `LanguageModel`.
+#
+# - Each worker serves its sessions on a thread pool. Turns for different sessions run concurrently, while turns for the same session run one at a time, in
+#   the order they were submitted.
+#
+# - The dispatcher keeps a transcript of each session's completed turns. If a worker dies, it is removed from the hash ring, so that its sessions are
+#   rebalanced across the remaining workers, and its outstanding turns are re-submitted. The first turn sent to a session's new worker carries the session
+#   transcript, so the new worker can restore the conversation history.
+#
+# - Sessions that have been idle for `WORKER_POOL_SESSION_IDLE_TIMEOUT` seconds, or the least recently used idle sessions beyond `WORKER_POOL_SESSION_LIMIT`,
+#   are closed. The worker saves the session's chat log and discards its `LanguageModel`, and the dispatcher discards its transcript. If the session's
+#   worker died, the dispatcher saves the chat log from the transcript instead. A later turn for a closed session starts a new conversation.
+#
+# - Caches are shared across processes through files, rather than copied into each worker: The chat log search index and retrieval vector index are
+#   memory-mapped, so workers share them through the OS page cache, and each worker hot-reloads the same configuration files.
+#
+# - Usage:
+#
+#   worker_pool = WorkerPool ( worker_count = 4 )
+#   worker_pool.start ()
+#   request_id = worker_pool.submit ( 'session-1', 'Hello.' )
+#   result     = worker_pool.get_result ()
+#   worker_pool.stop ()
+#
+#---------------------------------------------------------------------------------------------------------------------------------------------------------
+
+import sys
+import time
+import queue
+import bisect
+import hashlib
+import threading
+import collections
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from language_model     import LanguageModel
+from configuration      import Configuration
+
+# Constants: Worker Commands.
+
+WORKER_COMMAND_QUERY    = 0     # Query the language model for a session turn.
+WORKER_COMMAND_SHUTDOWN = 1     # Finish all outstanding turns, save the chat logs, and exit.
+WORKER_COMMAND_CLOSE    = 2     # Save a session's chat log, and discard the session.
+
+class ConsistentHashRing:
+
+    # Constants: Consistent Hash Ring.
+
+    HASH_RING_VIRTUAL_NODE_COUNT = 64   # Number of points on the ring per node, to spread keys evenly across nodes.
+
+    #---------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Constructor.
+    #---------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def __init__ ( self, virtual_node_count = HASH_RING_VIRTUAL_NODE_COUNT ):
+
+        # Initialise hash ring.
+
+        self.virtual_node_count = virtual_node_count
+        self.ring_hashes        = []    # Sorted hashes of the points on the ring.
+        self.ring_nodes         = []    # The node at each point on the ring.
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Add a node to the ring.
+    #
+    # Function name:
+    # - add_node
+    #
+    # Description:
+    # - This function adds the virtual nodes of a node to the ring. Only the keys that now hash to the new node move to it.
+    #
+    # Parameters:
+    # - node : any : The node to add, e.g. a worker id.
+    #
+    # Return Values:
+    # - None.
+    #
+    # Preconditions:
+    # - The node is not already on the ring.
+    #
+    # Postconditions:
+    # - The node is on the ring.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def add_node ( self, node ):
+
+        for virtual_node_index in range ( self.virtual_node_count ):
+
+            ring_hash     = self.get_hash ( f'{node}:{virtual_node_index}' )
+            ring_position = bisect.bisect ( self.ring_hashes, ring_hash )
+
+            self.ring_hashes.insert ( ring_position, ring_hash )
+            self.ring_nodes.insert  ( ring_position, node )
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Remove a node from the ring.
+    #
+    # Function name:
+    # - remove_node
+    #
+    # Description:
+    # - This function removes the virtual nodes of a node from the ring. Only the keys that hashed to the removed node move, to the next nodes on the ring.
+    #
+    # Parameters:
+    # - node : any : The node to remove.
+    #
+    # Return Values:
+    # - None.
+    #
+    # Preconditions:
+    # - None.
+    #
+    # Postconditions:
+    # - The node is not on the ring.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def remove_node ( self, node ):
+
+        ring_points = [ ( ring_hash, ring_node ) for ring_hash, ring_node in zip ( self.ring_hashes, self.ring_nodes ) if ring_node != node ]
+
+        self.ring_hashes = [ ring_hash for ring_hash, _ in ring_points ]
+        self.ring_nodes  = [ ring_node for _, ring_node in ring_points ]
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Get the node for a key.
+    #
+    # Function name:
+    # - get_node
+    #
+    # Description:
+    # - This function returns the node at the first point on the ring at or after the key's hash.
+    #
+    # Parameters:
+    # - key : str : The key, e.g. a session id.
+    #
+    # Return Values:
+    # - node : any : The node the key is assigned to.
+    #
+    # Preconditions:
+    # - None.
+    #
+    # Postconditions:
+    # - None.
+    #
+    # Raises:
+    # - LookupError : If the ring has no nodes.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def get_node ( self, key ):
+
+        if len ( self.ring_hashes ) == 0:
+            raise LookupError ( 'The hash ring has no nodes.' )
+
+        ring_position = bisect.bisect ( self.ring_hashes, self.get_hash ( str ( key ) ) ) % len ( self.ring_hashes )
+
+        return self.ring_nodes [ ring_position ]
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Hash a key to a point on the ring.
+    #
+    # Function name:
+    # - get_hash
+    #
+    # Description:
+    # - This function returns a stable 64-bit hash of a string. Python's built-in `hash` is salted per process, so it can not be used here.
+    #
+    # Parameters:
+    # - key : str : The string to hash.
+    #
+    # Return Values:
+    # - ring_hash : int : The hash.
+    #
+    # Preconditions:
+    # - None.
+    #
+    # Postconditions:
+    # - None.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def get_hash ( self, key ):
+
+        return int.from_bytes ( hashlib.blake2b ( key.encode ( 'utf-8' ), digest_size = 8 ).digest (), 'big' )
+
+class WorkerPool:
+
+    # Constants: Worker Pool.
+
+    WORKER_POOL_THREAD_COUNT          = 8       # Number of sessions each worker serves concurrently.
+    WORKER_POOL_HEALTH_CHECK_INTERVAL = 0.5     # Time in seconds between worker health checks, while waiting for results.
+    WORKER_POOL_SHUTDOWN_TIMEOUT      = 30.0    # Time in seconds to wait for each worker to exit, before terminating it.
+    WORKER_POOL_SESSION_IDLE_TIMEOUT  = 600.0   # Time in seconds a session may be idle, before it is closed.
+    WORKER_POOL_SESSION_LIMIT         = 1024    # Maximum number of open sessions. The least recently used idle sessions beyond this are closed.
+
+    # Constants: Terminal Output.
+
+    TERMINAL_ERROR = '[Error]'
+
+    #---------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Constructor.
+    #---------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def __init__ ( self, worker_count, worker_thread_count = WORKER_POOL_THREAD_COUNT, chat_log_enabled = True, session_limit = WORKER_POOL_SESSION_LIMIT, session_idle_timeout = WORKER_POOL_SESSION_IDLE_TIMEOUT ):
+
+        # Initialise worker pool.
+
+        self.worker_count           = worker_count
+        self.worker_thread_count    = worker_thread_count
+        self.chat_log_enabled       = chat_log_enabled
+        self.session_limit          = session_limit
+        self.session_idle_timeout   = session_idle_timeout
+        self.workers                = {}                            # Worker id to ( process, request queue ).
+        self.hash_ring              = ConsistentHashRing ()
+        self.result_queue           = multiprocessing.Queue ()
+        self.next_request_id        = 0
+        self.pending_requests       = {}                            # Request id to ( session id, prompt, worker id ), for outstanding turns.
+        self.session_workers        = {}                            # Session id to the id of the worker serving the session.
+        self.session_transcripts    = {}                            # Session id to a list of ( role, content ) tuples for the session's completed turns.
+        self.session_activity_times = collections.OrderedDict ()    # Session id to the time of the session's last activity, least recent first.
+        self.health_check_time      = time.monotonic ()             # Time of the last worker health check.
+        self.lock                   = threading.RLock ()            # Allows one thread to submit turns while another collects results.
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Start the worker processes.
+    #
+    # Function name:
+    # - start
+    #
+    # Description:
+    # - This function starts the worker processes, and adds them to the hash ring.
+    #
+    # Parameters:
+    # - None
+    #
+    # Return Values:
+    # - None.
+    #
+    # Preconditions:
+    # - The worker pool class must be initialized.
+    #
+    # Postconditions:
+    # - `worker_count` workers are running.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def start ( self ):
+
+        for worker_id in range ( self.worker_count ):
+
+            request_queue = multiprocessing.Queue ()
+
+            process = multiprocessing.Process (
+                target = run_worker,
+                args   = ( worker_id, request_queue, self.result_queue, self.worker_thread_count, self.chat_log_enabled ),
+                name   = f'Worker-{worker_id}',
+                daemon = True
+            )
+
+            process.start ()
+
+            self.workers [ worker_id ] = ( process, request_queue )
+            self.hash_ring.add_node ( worker_id )
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Submit a session turn.
+    #
+    # Function name:
+    # - submit
+    #
+    # Description:
+    # - This function sends a user prompt to the worker serving the session. The result is collected later with `get_result`.
+    #
+    # Parameters:
+    # - session_id : str : The session id.
+    # - prompt     : str : The user prompt.
+    #
+    # Return Values:
+    # - request_id : int : The id of the request, which is returned with the result.
+    #
+    # Preconditions:
+    # - The workers have been started.
+    #
+    # Postconditions:
+    # - The turn has been sent to a worker.
+    #
+    # Raises:
+    # - RuntimeError : If every worker has died.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def submit ( self, session_id, prompt ):
+
+        with self.lock:
+
+            request_id            = self.next_request_id
+            self.next_request_id += 1
+
+            self.send_request ( request_id, session_id, prompt )
+
+            return request_id
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Send a request to a worker.
+    #
+    # Function name:
+    # - send_request
+    #
+    # Description:
+    # - This function routes a request to a worker using the hash ring.
+    # - If the session was last served by a different worker, the session transcript is sent with the request, so the worker can restore the session.
+    #
+    # Parameters:
+    # - request_id : int : The request id.
+    # - session_id : str : The session id.
+    # - prompt     : str : The user prompt.
+    #
+    # Return Values:
+    # - None.
+    #
+    # Preconditions:
+    # - The caller holds the lock.
+    #
+    # Postconditions:
+    # - The request is outstanding.
+    #
+    # Raises:
+    # - RuntimeError : If every worker has died.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def send_request ( self, request_id, session_id, prompt ):
+
+        if len ( self.workers ) == 0:
+            raise RuntimeError ( 'All workers have exited.' )
+
+        worker_id  = self.hash_ring.get_node ( session_id )
+        transcript = None
+
+        if session_id in self.session_workers and self.session_workers [ session_id ] != worker_id:
+            transcript = list ( self.session_transcripts.get ( session_id, [] ) )
+
+        self.session_workers  [ session_id ] = worker_id
+        self.pending_requests [ request_id ] = ( session_id, prompt, worker_id )
+
+        self.update_session_activity_time ( session_id )
+
+        self.workers [ worker_id ] [ 1 ].put ( ( WORKER_COMMAND_QUERY, request_id, session_id, prompt, transcript ) )
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Get the next result.
+    #
+    # Function name:
+    # - get_result
+    #
+    # Description:
+    # - This function waits for the next completed turn from any worker, and records it in the session transcript. Failed turns are not recorded.
+    # - The workers are health checked every `WORKER_POOL_HEALTH_CHECK_INTERVAL` seconds, whether or not results are arriving, and the turns of any dead
+    #   workers are re-submitted. Idle sessions are closed at the same time.
+    #
+    # Parameters:
+    # - timeout : float : Maximum time in seconds to wait for a result, or `None` to wait indefinitely.
+    #
+    # Return Values:
+    # - result : dict : A dictionary with `request_id`, `session_id`, `content`, `error`, and `worker_id` keys, or `None` if the timeout expired.
+    #                   `error` is `None` if the turn succeeded. Otherwise `content` is `None`.
+    #
+    # Preconditions:
+    # - None.
+    #
+    # Postconditions:
+    # - The request is no longer outstanding.
+    #
+    # Raises:
+    # - RuntimeError : If every worker has died. The outstanding requests can not be completed.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def get_result ( self, timeout = None ):
+
+        deadline = None if timeout is None else time.monotonic () + timeout
+
+        while True:
+
+            wait_time = self.WORKER_POOL_HEALTH_CHECK_INTERVAL
+
+            if deadline is not None:
+
+                wait_time = min ( wait_time, deadline - time.monotonic () )
+
+                if wait_time <= 0.0:
+                    return None
+
+            # Health check the workers, if the check is due.
+            # - This is not only done when no results arrive, so that turns on a dead worker are not held up by a steady stream of results from the others.
+
+            if time.monotonic () - self.health_check_time >= self.WORKER_POOL_HEALTH_CHECK_INTERVAL:
+                self.health_check_time = time.monotonic ()
+                self.check_worker_health ()
+                self.close_idle_sessions ()
+
+            try:
+                request_id, session_id, content, error, worker_id = self.result_queue.get ( timeout = wait_time )
+
+            except queue.Empty:
+                continue
+
+            with self.lock:
+
+                # Ignore results for requests that were re-submitted after their worker was assumed dead.
+
+                if request_id not in self.pending_requests or self.pending_requests [ request_id ] [ 2 ] != worker_id:
+                    continue
+
+                _, prompt, _ = self.pending_requests.pop ( request_id )
+
+                if error is None:
+                    transcript = self.session_transcripts.setdefault ( session_id, [] )
+                    transcript.append ( ( LanguageModel.MODEL_MESSAGE_ROLE_USER, prompt  ) )
+                    transcript.append ( ( LanguageModel.MODEL_MESSAGE_ROLE_AI,   content ) )
+
+                self.update_session_activity_time ( session_id )
+
+            return { 'request_id': request_id, 'session_id': session_id, 'content': content, 'error': error, 'worker_id': worker_id }
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Get the number of outstanding requests.
+    #
+    # Function name:
+    # - get_pending_request_count
+    #
+    # Description:
+    # - This function returns the number of submitted turns whose results have not yet been collected.
+    #
+    # Parameters:
+    # - None
+    #
+    # Return Values:
+    # - pending_request_count : int : The number of outstanding requests.
+    #
+    # Preconditions:
+    # - None.
+    #
+    # Postconditions:
+    # - None.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def get_pending_request_count ( self ):
+
+        with self.lock:
+            return len ( self.pending_requests )
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Check that the workers are alive, and rebalance if any have died.
+    #
+    # Function name:
+    # - check_worker_health
+    #
+    # Description:
+    # - This function removes dead workers from the hash ring, so that their sessions are rebalanced across the remaining workers, and re-submits their
+    #   outstanding turns in the order they were originally submitted.
+    #
+    # Parameters:
+    # - None
+    #
+    # Return Values:
+    # - None.
+    #
+    # Preconditions:
+    # - None.
+    #
+    # Postconditions:
+    # - Every worker on the hash ring is alive.
+    #
+    # Raises:
+    # - RuntimeError : If every worker has died.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def check_worker_health ( self ):
+
+        with self.lock:
+
+            dead_worker_ids = [ worker_id for worker_id, ( process, _ ) in self.workers.items () if not process.is_alive () ]
+
+            if len ( dead_worker_ids ) == 0:
+                return
+
+            for worker_id in dead_worker_ids:
+                print ( f'\n{self.TERMINAL_ERROR} Worker {worker_id} exited with code {self.workers [ worker_id ] [ 0 ].exitcode}. Rebalancing its sessions.', file = sys.stderr )
+                self.hash_ring.remove_node ( worker_id )
+                del self.workers [ worker_id ]
+
+            if len ( self.workers ) == 0:
+                raise RuntimeError ( 'All workers have exited.' )
+
+            # Re-submit the outstanding turns of the dead workers.
+
+            for request_id in sorted ( self.pending_requests ):
+
+                session_id, prompt, worker_id = self.pending_requests [ request_id ]
+
+                if worker_id in dead_worker_ids:
+                    self.send_request ( request_id, session_id, prompt )
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Record activity on a session.
+    #
+    # Function name:
+    # - update_session_activity_time
+    #
+    # Description:
+    # - This function sets the session's last activity time to now, and moves the session to the most recently used end of the activity order.
+    #
+    # Parameters:
+    # - session_id : str : The session id.
+    #
+    # Return Values:
+    # - None.
+    #
+    # Preconditions:
+    # - The caller holds the lock.
+    #
+    # Postconditions:
+    # - The session is the most recently used session.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def update_session_activity_time ( self, session_id ):
+
+        self.session_activity_times [ session_id ] = time.monotonic ()
+        self.session_activity_times.move_to_end ( session_id )
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Close idle sessions.
+    #
+    # Function name:
+    # - close_idle_sessions
+    #
+    # Description:
+    # - This function closes sessions that have been idle for longer than the session idle timeout, and the least recently used sessions beyond the session
+    #   limit. Sessions with outstanding turns are never closed.
+    #
+    # Parameters:
+    # - None
+    #
+    # Return Values:
+    # - None.
+    #
+    # Preconditions:
+    # - None.
+    #
+    # Postconditions:
+    # - No session has been idle for longer than the session idle timeout, and the session limit is met, unless the remaining sessions have outstanding
+    #   turns.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def close_idle_sessions ( self ):
+
+        with self.lock:
+
+            idle_time_limit     = time.monotonic () - self.session_idle_timeout
+            pending_session_ids = { session_id for session_id, _, _ in self.pending_requests.values () }
+
+            # Sessions are visited least recently used first, so the scan stops at the first session that is neither idle for too long, nor over the limit.
+
+            for session_id, activity_time in list ( self.session_activity_times.items () ):
+
+                if activity_time > idle_time_limit and len ( self.session_activity_times ) <= self.session_limit:
+                    break
+
+                if session_id not in pending_session_ids:
+                    self.close_session ( session_id )
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Close a session.
+    #
+    # Function name:
+    # - close_session
+    #
+    # Description:
+    # - This function discards the dispatcher's state for a session, and tells the session's worker to save the session's chat log and discard it.
+    # - If the session's worker has died, the worker's copy of the session is lost, so the chat log is saved from the dispatcher's transcript instead.
+    #
+    # Parameters:
+    # - session_id : str : The session id.
+    #
+    # Return Values:
+    # - None.
+    #
+    # Preconditions:
+    # - The caller holds the lock.
+    # - The session has no outstanding turns.
+    #
+    # Postconditions:
+    # - The session is closed. A later turn for the session starts a new conversation.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def close_session ( self, session_id ):
+
+        worker_id  = self.session_workers.pop ( session_id, None )
+        transcript = self.session_transcripts.pop ( session_id, [] )
+
+        self.session_activity_times.pop ( session_id, None )
+
+        if worker_id in self.workers:
+            self.workers [ worker_id ] [ 1 ].put ( ( WORKER_COMMAND_CLOSE, None, session_id, None, None ) )
+
+        elif self.chat_log_enabled and len ( transcript ) > 0:
+            self.save_transcript_chat_log ( transcript )
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Save a session transcript to a chat log.
+    #
+    # Function name:
+    # - save_transcript_chat_log
+    #
+    # Description:
+    # - This function saves the chat log of a session whose worker died, from the dispatcher's transcript of the session's completed turns.
+    #
+    # Parameters:
+    # - transcript : list : The session transcript, as a list of ( role, content ) tuples.
+    #
+    # Return Values:
+    # - None.
+    #
+    # Preconditions:
+    # - None.
+    #
+    # Postconditions:
+    # - The chat log has been saved.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def save_transcript_chat_log ( self, transcript ):
+
+        model                        = LanguageModel ()
+        model.terminal_output_stream = sys.stderr
+
+        for role, content in transcript:
+            model.add_message_to_conversation_history ( content, role )
+
+        model.save_chat_log_to_file ( include_system_prompt_enabled = False )
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Stop the worker processes.
+    #
+    # Function name:
+    # - stop
+    #
+    # Description:
+    # - This function asks each worker to finish its outstanding turns, save its chat logs, and exit. Workers that do not exit in time are terminated.
+    # - The chat logs of sessions whose worker died are saved from the dispatcher's transcripts.
+    #
+    # Parameters:
+    # - None
+    #
+    # Return Values:
+    # - None.
+    #
+    # Preconditions:
+    # - None.
+    #
+    # Postconditions:
+    # - No workers are running.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def stop ( self ):
+
+        with self.lock:
+
+            workers = list ( self.workers.values () )
+
+            for session_id, worker_id in list ( self.session_workers.items () ):
+                if worker_id not in self.workers:
+                    self.close_session ( session_id )
+
+        for _, request_queue in workers:
+            request_queue.put ( ( WORKER_COMMAND_SHUTDOWN, None, None, None, None ) )
+
+        for process, _ in workers:
+
+            process.join ( self.WORKER_POOL_SHUTDOWN_TIMEOUT )
+
+            if process.is_alive ():
+                process.terminate ()
+
+class Worker:
+
+    #---------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Constructor.
+    #---------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def __init__ ( self, worker_id, request_queue, result_queue, thread_count, chat_log_enabled ):
+
+        # Initialise worker.
+
+        self.worker_id        = worker_id
+        self.request_queue    = request_queue
+        self.result_queue     = result_queue
+        self.chat_log_enabled = chat_log_enabled
+        self.executor         = ThreadPoolExecutor ( max_workers = thread_count )
+        self.configuration    = Configuration ()                # Shared by all sessions in this worker.
+        self.sessions         = {}                              # Session id to `LanguageModel`.
+        self.session_backlogs = {}                              # Session id to a queue of requests waiting for the session's running turn to finish.
+        self.lock             = threading.Lock ()
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Run the worker.
+    #
+    # Function name:
+    # - run
+    #
+    # Description:
+    # - This function receives requests from the dispatcher until it is told to shut down.
+    # - A session that is idle has its turn started on the thread pool. A turn for a session that is already running is queued in the session's backlog,
+    #   and run by the same thread once the running turn finishes. Requests to close a session are queued in the same way, so they run after the session's
+    #   turns.
+    #
+    # Parameters:
+    # - None
+    #
+    # Return Values:
+    # - None.
+    #
+    # Preconditions:
+    # - The worker class must be initialized.
+    #
+    # Postconditions:
+    # - All turns have been served, and the chat logs have been saved.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def run ( self ):
+
+        while True:
+
+            request = self.request_queue.get ()
+
+            if request [ 0 ] == WORKER_COMMAND_SHUTDOWN:
+                break
+
+            session_id = request [ 2 ]
+
+            with self.lock:
+
+                if session_id in self.session_backlogs:
+                    self.session_backlogs [ session_id ].append ( request )
+                    continue
+
+                self.session_backlogs [ session_id ] = collections.deque ()
+
+            self.executor.submit ( self.run_session, request )
+
+        # Shut down worker.
+
+        self.executor.shutdown ( wait = True )
+
+        if self.chat_log_enabled:
+            for model in self.sessions.values ():
+                model.save_chat_log_to_file ( include_system_prompt_enabled = False )
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Run a session's turns.
+    #
+    # Function name:
+    # - run_session
+    #
+    # Description:
+    # - This function serves a request, and then any requests for the same session that arrived while it was running, in order.
+    #
+    # Parameters:
+    # - request : tuple : The first request to serve.
+    #
+    # Return Values:
+    # - None.
+    #
+    # Preconditions:
+    # - The session has a backlog entry, marking it as running.
+    #
+    # Postconditions:
+    # - The session's backlog is empty, and the session is marked idle.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def run_session ( self, request ):
+
+        session_id = request [ 2 ]
+
+        while request is not None:
+
+            if request [ 0 ] == WORKER_COMMAND_CLOSE:
+                self.close_session ( session_id )
+            else:
+                self.result_queue.put ( self.query_session ( request ) )
+
+            with self.lock:
+
+                if len ( self.session_backlogs [ session_id ] ) > 0:
+                    request = self.session_backlogs [ session_id ].popleft ()
+                else:
+                    del self.session_backlogs [ session_id ]
+                    request = None
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Query the language model for a session turn.
+    #
+    # Function name:
+    # - query_session
+    #
+    # Description:
+    # - This function adds the user prompt to the session's conversation history, queries the language model, and adds the response to the history.
+    # - If the request carries a transcript, the session's conversation history is first restored from it.
+    # - As in the pipeline, a failed turn is removed from the conversation history, and the error message is returned in place of the response.
+    #
+    # Parameters:
+    # - request : tuple : The request.
+    #
+    # Return Values:
+    # - result : tuple : A `( request id, session id, response text, error message, worker id )` tuple. If the turn failed, the response text is `None`.
+    #                    Otherwise the error message is `None`.
+    #
+    # Preconditions:
+    # - No other turn for the session is running.
+    #
+    # Postconditions:
+    # - The turn has been added to the session's conversation history, if it succeeded.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def query_session ( self, request ):
+
+        _, request_id, session_id, prompt, transcript = request
+
+        model        = self.sessions.get ( session_id )
+        prompt_added = False
+
+        try:
+
+            # Get or create the session, and restore its conversation history if it moved here from another worker.
+
+            if model is None or transcript is not None:
+                model                        = LanguageModel ( configuration = self.configuration )
+                model.terminal_output_stream = sys.stderr
+                self.sessions [ session_id ] = model
+
+            for role, content in transcript or []:
+                model.add_message_to_conversation_history ( content, role )
+
+            # Query the language model.
+
+            model.add_message_to_conversation_history ( prompt, model.MODEL_MESSAGE_ROLE_USER )
+            prompt_added = True
+
+            model_response = model.send_query ()
+
+            if model.streaming_enabled:
+                response_text = ''.join ( chunk.choices [ 0 ].delta.content for chunk in model_response if chunk.choices [ 0 ].delta.content )
+            else:
+                response_text = model_response.choices [ 0 ].message.content
+
+            model.add_message_to_conversation_history ( response_text, model.MODEL_MESSAGE_ROLE_AI )
+
+            error_message = None
+
+        except Exception as e:
+
+            # Remove the failed turn from the conversation history.
+
+            if prompt_added:
+                model.conversation_history.pop ()
+
+            response_text = None
+            error_message = str ( e )
+
+        return ( request_id, session_id, response_text, error_message, self.worker_id )
+
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # Close a session.
+    #
+    # Function name:
+    # - close_session
+    #
+    # Description:
+    # - This function saves the session's chat log, and discards the session's language model.
+    #
+    # Parameters:
+    # - session_id : str : The session id.
+    #
+    # Return Values:
+    # - None.
+    #
+    # Preconditions:
+    # - No other turn for the session is running.
+    #
+    # Postconditions:
+    # - The worker no longer holds the session.
+    #
+    # To-Do:
+    # - None.
+    #
+    #-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def close_session ( self, session_id ):
+
+        model = self.sessions.pop ( session_id, None )
+
+        if model is not None and self.chat_log_enabled:
+            model.save_chat_log_to_file ( include_system_prompt_enabled = False )
+
+#-------------------------------------------------------------------------------------------------------------------------------------------------------------
+# Worker process entry point.
+#
+# Function name:
+# - run_worker
+#
+# Description:
+# - This function is the target of each worker process. It is a module-level function, so that it can be started on platforms that spawn, rather than
+#   fork, new processes.
+#
+# Parameters:
+# - worker_id        : int   : The worker id.
+# - request_queue    : Queue : The queue the worker receives requests on.
+# - result_queue     : Queue : The queue the worker sends results on.
+# - thread_count     : int   : The number of sessions to serve concurrently.
+# - chat_log_enabled : bool  : True to save the chat log of each session when the worker shuts down.
+#
+# Return Values:
+# - None.
+#
+# Preconditions:
+# - None.
+#
+# Postconditions:
+# - The worker has shut down.
+#
+# To-Do:
+# - None.
+#
+#-------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def run_worker ( worker_id, request_queue, result_queue, thread_count, chat_log_enabled ):
+
+    worker = Worker ( worker_id, request_queue, result_queue, thread_count, chat_log_enabled )
+    worker.run ()